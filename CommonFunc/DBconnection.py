@@ -1,6 +1,7 @@
 import json
 import pymysql
 from sqlalchemy import create_engine
+from CommonFunc.db_pool import get_pool, get_engine, get_pool_options
 import logging
 import os
 
@@ -66,16 +67,22 @@ def load_config(config_path):
 
 @debug_log
 def db_con_pymysql(config):
-    """通过pymysql连接数据库"""
+    """
+    通过pymysql连接数据库
+    启用连接池 (配置文件 DBPool.enabled) 时从进程内连接池取连接, close() 时归还到池中
+    """
     db_config = config["DBConnection"]
     debug_mode = config.get('DEBUG', False)
     try:
+        if get_pool_options(config)["enabled"]:
+            return get_pool(config).acquire()
         pymysql_conn = pymysql.connect(
             host=db_config["host"],
             user=db_config["user"],
             password=db_config["password"],
             database=db_config["database"],
             cursorclass=pymysql.cursors.DictCursor,
+            local_infile=db_config.get("local_infile", False),
         )
         if debug_mode:
             print(f"PyMySQL成功连接到数据库: {db_config['host']}/{db_config['database']}")
@@ -87,23 +94,36 @@ def db_con_pymysql(config):
 
 @debug_log
 def db_con_sqlalchemy(config):
-    """通过sqlalchemy连接数据库"""
+    """
+    通过sqlalchemy连接数据库
+    启用连接池时同一进程共享一个 engine, 调用方无需 dispose
+    """
     db_config = config["DBConnection"]
     debug_mode = config.get('DEBUG', False)
     try:
-        sqlalchemy_conn = create_engine(
-            f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
-        )
-        # 测试连接
-        sqlalchemy_conn.connect()
-        if debug_mode:
-            print(f"SQLAlchemy成功连接到数据库: {db_config['host']}/{db_config['database']}")
+        if get_pool_options(config)["enabled"]:
+            sqlalchemy_conn, created = get_engine(config)
+        else:
+            sqlalchemy_conn, created = create_engine(
+                f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
+            ), True
+        if created:
+            # 测试连接, 用完立即归还
+            with sqlalchemy_conn.connect():
+                pass
+            if debug_mode:
+                print(f"SQLAlchemy成功连接到数据库: {db_config['host']}/{db_config['database']}")
         return sqlalchemy_conn
     except Exception as e:
         if debug_mode:
             print(f"SQLAlchemy连接数据库失败: {str(e)}")
         raise
 
+def release_sqlalchemy(config, engine):
+    """用完 engine 后调用: 启用连接池时 engine 由进程共享, 不做处理; 否则释放其全部连接"""
+    if engine is not None and not get_pool_options(config)["enabled"]:
+        engine.dispose()
+
 @debug_log
 def set_log(config, log_name, prefix="QA"):
     """
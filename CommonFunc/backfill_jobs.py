@@ -0,0 +1,203 @@
+"""
+可断点续传的批量回补任务
+每次批量回补 (buffer_table, 起止日期) 对应一个任务, 每只股票的完成状态保存在本地 SQLite 文件中
+    - 重新运行同一任务时跳过已完成的股票, 不再清空 buffer_table
+    - resume 模式只重试失败 (api_fail / db_fail) 的股票
+SQLite 文件路径由配置文件 Backfill.job_db 指定
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from CommonFunc.DBconnection import find_config_path, db_con_pymysql
+from CommonFunc.fetch_engine import fetch_hist_to_buffer
+
+# 已完成的状态, 重新运行时跳过
+DONE_STATUSES = ("success", "no_data")
+FAILED_STATUSES = ("api_fail", "db_fail")
+
+
+class BackfillJob:
+    """回补任务及每只股票的完成状态"""
+
+    def __init__(self, db_path, job_id):
+        """
+        Args:
+            db_path (str): SQLite 文件路径
+            job_id (str): 任务标识, 例如 'buffer_table:20250101-20250214'
+        """
+        self.db_path = db_path
+        self.job_id = job_id
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    created TEXT,
+                    finished TEXT
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS symbols (
+                    job_id TEXT,
+                    symbol TEXT,
+                    status TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    updated TEXT,
+                    PRIMARY KEY (job_id, symbol)
+                )
+            """)
+
+    @staticmethod
+    def make_id(table, start_date, end_date):
+        return f"{table}:{start_date}-{end_date}"
+
+    def exists(self):
+        """任务是否已创建"""
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM jobs WHERE job_id = ?", (self.job_id,)).fetchone()
+        return row is not None
+
+    def create(self, symbols):
+        """创建任务并登记全部股票 (状态为 pending)"""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO jobs (job_id, created) VALUES (?, ?)", (self.job_id, now))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO symbols (job_id, symbol, status, updated) VALUES (?, ?, 'pending', ?)",
+                [(self.job_id, symbol, now) for symbol in symbols]
+            )
+
+    def _symbols(self, statuses=None, exclude=None):
+        sql = "SELECT symbol FROM symbols WHERE job_id = ?"
+        params = [self.job_id]
+        if statuses:
+            sql += f" AND status IN ({','.join('?' * len(statuses))})"
+            params += list(statuses)
+        if exclude:
+            sql += f" AND status NOT IN ({','.join('?' * len(exclude))})"
+            params += list(exclude)
+        with self.lock:
+            return [row[0] for row in self.conn.execute(sql + " ORDER BY symbol", params)]
+
+    def pending(self):
+        """未完成的股票 (包括尚未处理和失败的)"""
+        return self._symbols(exclude=DONE_STATUSES)
+
+    def failed(self):
+        """失败的股票"""
+        return self._symbols(statuses=FAILED_STATUSES)
+
+    def mark(self, symbol, status):
+        """记录单只股票的处理结果, 可在多个线程中调用"""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE symbols SET status = ?, attempts = attempts + 1, updated = ? WHERE job_id = ? AND symbol = ?",
+                (status, now, self.job_id, symbol)
+            )
+
+    def summary(self):
+        """按状态统计数量"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM symbols WHERE job_id = ? GROUP BY status", (self.job_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def finish(self):
+        """所有股票完成后标记任务结束"""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE jobs SET finished = ? WHERE job_id = ?", (now, self.job_id))
+
+    def close(self):
+        self.conn.close()
+
+
+def get_job_db_path(config):
+    """SQLite 文件路径"""
+    _, _, root_dir = find_config_path()
+    return os.path.join(root_dir, config["Backfill"]["job_db"])
+
+
+def clear_buffer_rows(config, table, symbols):
+    """删除待重新请求股票在 buffer_table 中的数据, 避免中断后重复写入"""
+    if not symbols:
+        return
+    connection = db_con_pymysql(config)
+    try:
+        with connection.cursor() as cursor:
+            for start in range(0, len(symbols), 1000):
+                batch = symbols[start:start + 1000]
+                cursor.execute(f"DELETE FROM {table} WHERE id IN ({','.join(['%s'] * len(batch))})", batch)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def truncate_table(config, table):
+    """清空 buffer_table (新任务开始时)"""
+    connection = db_con_pymysql(config)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE TABLE {table}")
+    finally:
+        connection.close()
+
+
+def run_backfill(config, symbols, start_date, end_date, resume=False, latest=0, on_status=None, logger=None):
+    """
+    执行 (或继续) 一次批量回补
+
+    Args:
+        config (dict): 配置
+        symbols (list): 全部股票代码
+        start_date, end_date (str): 日期范围 'YYYYMMDD'
+        resume (bool): True 时只重试失败的股票
+        latest (int): 写入 buffer_table 的 Latest 值
+        on_status (callable): on_status(symbol, status) 进度回调
+        logger: 日志对象
+
+    Returns:
+        dict: 任务中各状态的股票数量
+    """
+    table = config["DB_tables"]["buffer_table"]
+    job = BackfillJob(get_job_db_path(config), BackfillJob.make_id(table, start_date, end_date))
+    try:
+        if not job.exists():
+            # 新任务: 清空 buffer_table 并登记全部股票
+            truncate_table(config, table)
+            job.create(symbols)
+            if logger:
+                logger.info_print(f"创建回补任务 {job.job_id}, 共 {len(symbols)} 只股票")
+        else:
+            # 股票列表有新增时补充登记
+            job.create(symbols)
+
+        todo = job.failed() if resume else job.pending()
+        if logger:
+            logger.info_print(f"回补任务 {job.job_id}: 本次处理 {len(todo)} 只股票 "
+                              f"({'仅重试失败' if resume else '跳过已完成'}), 当前状态 {job.summary()}")
+        if not todo:
+            job.finish()
+            return job.summary()
+
+        clear_buffer_rows(config, table, todo)
+
+        def record(symbol, status):
+            job.mark(symbol, status)
+            if on_status:
+                on_status(symbol, status)
+
+        fetch_hist_to_buffer(config, todo, start_date, end_date, latest=latest, on_status=record, logger=logger)
+
+        summary = job.summary()
+        if not job.pending():
+            job.finish()
+        return summary
+    finally:
+        job.close()
@@ -0,0 +1,500 @@
+"""
+本地列式日K存储 (BarStore)
+每只股票的历史日K在每一列中占一段连续区间, 每列存为一个 .npy 文件, 读取时使用内存映射
+每段区间末尾预留 SLACK_DAYS 行空位 (日期为 NaT, 数值为 NaN), lengths.npy 记录每只股票的实际行数
+AK004 写入年表后调用 append_daily_table 追加当日数据: 当日K线直接写入各股票区间的空位,
+只替换 lengths.npy 和 meta.json, 不重写整列; 某只股票空位用完时才整体重排 (约每 SLACK_DAYS 个交易日一次)
+各加载器 (AK006/AK007/AK008/AKFilter1~3/Triangle_v2) 优先从本存储读取, 不可用时回退到 SQL
+首次使用或数据修复后请执行本文件重建: python -m CommonFunc.bar_store [QA|PROD]
+"""
+
+import os
+import sys
+import json
+import shutil
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from CommonFunc.DBconnection import find_config_path, load_config, db_con_pymysql, set_log
+
+# 价格/成交列, 与 StockMain 列的对应关系
+COLUMN_MAP = {
+    'open': 'open_price',
+    'high': 'high',
+    'low': 'low',
+    'close': 'close_price',
+    'volume': 'volume',
+    'chg_percen': 'chg_percen',
+}
+
+
+class BarStore:
+    """按股票分段、按列存储的日K数据"""
+
+    COLUMNS = tuple(COLUMN_MAP.keys())
+    # 每只股票区间末尾预留的行数
+    SLACK_DAYS = 60
+
+    def __init__(self, store_dir, mmap=True):
+        """
+        Args:
+            store_dir (str): 存储目录
+            mmap (bool): 是否以内存映射方式读取
+        """
+        self.store_dir = store_dir
+        self.mmap = mmap
+        self._arrays = None
+        self._ids = None
+        self._offsets = None
+        self._lengths = None
+        self._id_index = None
+        self._meta = None
+
+    # ---------- 基础信息 ----------
+
+    def _path(self, name):
+        return os.path.join(self.store_dir, name)
+
+    def exists(self):
+        """存储是否已建立且有效"""
+        return os.path.exists(self._path('meta.json'))
+
+    def _ensure_loaded(self):
+        if self._arrays is not None:
+            return
+        if not self.exists():
+            raise FileNotFoundError(f"BarStore 不存在: {self.store_dir}")
+        mode = 'r' if self.mmap else None
+        with open(self._path('meta.json'), 'r') as f:
+            self._meta = json.load(f)
+        self._ids = np.load(self._path('ids.npy'))
+        self._offsets = np.load(self._path('offsets.npy'))
+        # 旧版存储没有 lengths.npy, 区间没有空位
+        if os.path.exists(self._path('lengths.npy')):
+            self._lengths = np.load(self._path('lengths.npy'))
+        else:
+            self._lengths = np.diff(self._offsets)
+        self._arrays = {'date': np.load(self._path('date.npy'), mmap_mode=mode)}
+        for col in self.COLUMNS:
+            self._arrays[col] = np.load(self._path(f'{col}.npy'), mmap_mode=mode)
+        self._id_index = {stock_id: i for i, stock_id in enumerate(self._ids.tolist())}
+
+    def reload(self):
+        """丢弃已映射的数组, 下次访问时重新读取"""
+        self._arrays = None
+        self._ids = None
+        self._offsets = None
+        self._lengths = None
+        self._id_index = None
+        self._meta = None
+
+    @property
+    def ids(self):
+        self._ensure_loaded()
+        return self._ids
+
+    @property
+    def last_date(self):
+        """存储中最新的交易日 (datetime.date)"""
+        self._ensure_loaded()
+        last = self._meta.get('last_date')
+        return datetime.strptime(last, '%Y-%m-%d').date() if last else None
+
+    def covers(self, trade_date):
+        """存储是否已包含指定交易日"""
+        if not self.exists():
+            return False
+        last = self.last_date
+        return last is not None and last >= pd.Timestamp(trade_date).date()
+
+    def invalidate(self):
+        """标记存储失效, 之后的加载器会回退到 SQL"""
+        if self.exists():
+            os.remove(self._path('meta.json'))
+        self.reload()
+
+    # ---------- 读取 ----------
+
+    def _block(self, stock_id):
+        """返回股票在各列中的 [start, end) 区间"""
+        self._ensure_loaded()
+        i = self._id_index.get(str(stock_id).zfill(6))
+        if i is None:
+            return None
+        return int(self._offsets[i]), int(self._offsets[i] + self._lengths[i])
+
+    def slice(self, stock_id, days=None, start_date=None, end_date=None, columns=None):
+        """
+        获取单只股票的列切片 (不拷贝)
+
+        Args:
+            stock_id (str): 股票代码
+            days (int): 只取最近 days 根K线
+            start_date, end_date: 日期范围 (含两端)
+            columns (tuple): 需要的列, 默认全部
+
+        Returns:
+            dict: {'date': ndarray, 列名: ndarray}, 股票不存在时返回 None
+        """
+        block = self._block(stock_id)
+        if block is None:
+            return None
+        start, end = block
+        dates = self._arrays['date']
+        if start_date is not None:
+            start = start + int(np.searchsorted(dates[start:end], np.datetime64(pd.Timestamp(start_date).date(), 'D'), 'left'))
+        if end_date is not None:
+            end = start + int(np.searchsorted(dates[start:end], np.datetime64(pd.Timestamp(end_date).date(), 'D'), 'right'))
+        if days is not None:
+            start = max(start, end - days)
+        columns = self.COLUMNS if columns is None else columns
+        result = {'date': dates[start:end]}
+        for col in columns:
+            result[col] = self._arrays[col][start:end]
+        return result
+
+    def get_frame(self, stock_id, days=None, start_date=None, end_date=None, columns=None):
+        """获取单只股票的 DataFrame, 以 date 为索引"""
+        data = self.slice(stock_id, days, start_date, end_date, columns)
+        if data is None or len(data['date']) == 0:
+            return None
+        df = pd.DataFrame({k: np.asarray(v) for k, v in data.items() if k != 'date'},
+                          index=pd.DatetimeIndex(np.asarray(data['date']), name='date'))
+        df.name = str(stock_id).zfill(6)
+        return df
+
+    def get_frames(self, stock_ids, days=None, start_date=None, end_date=None, columns=None):
+        """批量获取多只股票的 DataFrame, 返回 {stock_id: DataFrame}"""
+        result = {}
+        for stock_id in stock_ids:
+            df = self.get_frame(stock_id, days, start_date, end_date, columns)
+            if df is not None:
+                result[df.name] = df
+        return result
+
+    def to_frame(self, stock_ids=None, start_date=None, end_date=None, columns=None):
+        """
+        以长表形式 (id, date, 列...) 返回多只股票的数据, 用于替换 SQL 查询结果
+
+        Args:
+            stock_ids (list): 股票代码, None 表示全部
+            start_date, end_date: 日期范围 (含两端)
+            columns (tuple): 需要的列, 默认全部
+        """
+        self._ensure_loaded()
+        columns = self.COLUMNS if columns is None else columns
+        if stock_ids is None:
+            codes = np.arange(len(self._ids))
+        else:
+            codes = [self._id_index.get(str(s).zfill(6)) for s in stock_ids]
+            codes = np.array(sorted({c for c in codes if c is not None}), dtype=np.int64)
+
+        starts = self._offsets[codes]
+        lengths = self._lengths[codes]
+        rows = _ranges_to_index(starts, lengths)
+        ids = np.repeat(self._ids[codes], lengths)
+
+        dates = np.asarray(self._arrays['date'][rows])
+        mask = np.ones(len(rows), dtype=bool)
+        if start_date is not None:
+            mask &= dates >= np.datetime64(pd.Timestamp(start_date).date(), 'D')
+        if end_date is not None:
+            mask &= dates <= np.datetime64(pd.Timestamp(end_date).date(), 'D')
+        rows = rows[mask]
+
+        data = {'id': ids[mask], 'date': dates[mask]}
+        for col in columns:
+            data[col] = np.asarray(self._arrays[col][rows])
+        return pd.DataFrame(data)
+
+    def rows_on(self, trade_date, stock_ids=None, columns=None):
+        """获取指定交易日的数据 (id, date, 列...)"""
+        return self.to_frame(stock_ids, trade_date, trade_date, columns)
+
+    def last_rows_before(self, trade_date, stock_ids=None, columns=None):
+        """获取每只股票在指定交易日之前 (不含) 的最后一根K线"""
+        self._ensure_loaded()
+        columns = self.COLUMNS if columns is None else columns
+        if stock_ids is None:
+            codes = np.arange(len(self._ids))
+        else:
+            codes = [self._id_index.get(str(s).zfill(6)) for s in stock_ids]
+            codes = np.array(sorted({c for c in codes if c is not None}), dtype=np.int64)
+        target = np.datetime64(pd.Timestamp(trade_date).date(), 'D')
+        dates = self._arrays['date']
+
+        rows, keep = [], []
+        for code in codes:
+            start = int(self._offsets[code])
+            end = start + int(self._lengths[code])
+            pos = start + int(np.searchsorted(dates[start:end], target, 'left')) - 1
+            if pos >= start:
+                rows.append(pos)
+                keep.append(code)
+        rows = np.array(rows, dtype=np.int64)
+        data = {'id': self._ids[np.array(keep, dtype=np.int64)], 'date': np.asarray(dates[rows])}
+        for col in columns:
+            data[col] = np.asarray(self._arrays[col][rows])
+        return pd.DataFrame(data)
+
+    def recent_dates(self, n, stock_ids=None):
+        """返回最近 n 个交易日 (升序), 可限定股票范围"""
+        self._ensure_loaded()
+        if stock_ids is None:
+            dates = np.asarray(self._arrays['date'])
+            dates = dates[~np.isnat(dates)]
+        else:
+            dates = self.to_frame(stock_ids, columns=())['date'].values
+        return np.unique(dates)[-n:]
+
+    # ---------- 写入 ----------
+
+    def write(self, df):
+        """
+        用长表 (id, date, 列...) 全量重建存储, 每只股票区间末尾预留 SLACK_DAYS 行空位
+
+        Args:
+            df (pandas.DataFrame): 每个 (id, date) 一行
+        """
+        df = _normalize(df).drop_duplicates(['id', 'date'], keep='last')
+        df = df.sort_values(['id', 'date'], kind='mergesort').reset_index(drop=True)
+
+        ids, first, lengths = np.unique(df['id'].values, return_index=True, return_counts=True)
+        offsets = np.concatenate(([0], np.cumsum(lengths + self.SLACK_DAYS))).astype(np.int64)
+        rows = _ranges_to_index(offsets[:-1], lengths)
+        arrays = {'date': np.full(offsets[-1], np.datetime64('NaT'), dtype='datetime64[D]')}
+        arrays['date'][rows] = df['date'].values.astype('datetime64[D]')
+        for col in self.COLUMNS:
+            arrays[col] = np.full(offsets[-1], np.nan)
+            arrays[col][rows] = df[col].values.astype(np.float64)
+        self._save(ids, offsets, lengths.astype(np.int64), arrays)
+
+    def append(self, df):
+        """
+        合并新数据 (通常为一个交易日)
+
+        每只股票至多一行、日期晚于已有最后一天且区间还有空位时, 直接写入各自区间的空位,
+        只替换 lengths.npy 和 meta.json; 否则 (新股票、重复日期、补历史数据、空位用完) 走全量合并
+        """
+        df = _normalize(df)
+        if df.empty:
+            return 0
+        if not self.exists():
+            self.write(df)
+            return len(df)
+
+        self._ensure_loaded()
+        codes = df['id'].map(self._id_index)
+        fast_path = codes.notna().all() and not df['id'].duplicated().any()
+        if fast_path:
+            codes = codes.astype(np.int64).values
+            lengths = self._lengths[codes]
+            ends = self._offsets[codes] + lengths
+            last_dates = np.asarray(self._arrays['date'])[np.maximum(ends - 1, 0)]
+            new_dates = df['date'].values.astype('datetime64[D]')
+            has_slack = ends < self._offsets[codes + 1]
+            fast_path = bool(np.all(((lengths == 0) | (new_dates > last_dates)) & has_slack))
+
+        if not fast_path:
+            existing = self.to_frame()
+            self.write(pd.concat([existing, df], ignore_index=True))
+            return len(df)
+
+        # 先写入空位 (lengths 未更新前读取方看不到这些行), 再替换 lengths.npy 和 meta.json
+        values = {'date': new_dates}
+        values.update({col: df[col].values.astype(np.float64) for col in self.COLUMNS})
+        new_lengths = self._lengths.copy()
+        new_lengths[codes] += 1
+        last_date = max(np.datetime64(self.last_date, 'D'), new_dates.max()) if self.last_date else new_dates.max()
+        self.reload()
+        for name, data in values.items():
+            column = np.load(self._path(f'{name}.npy'), mmap_mode='r+')
+            column[ends] = data
+            del column
+        self._replace_file('lengths.npy', lambda f: np.save(f, new_lengths))
+        self._write_meta(self.store_dir, int(new_lengths.sum()), len(new_lengths), last_date)
+        self.reload()
+        return len(df)
+
+    def _replace_file(self, name, write):
+        """先写临时文件再替换, 读取方不会读到写了一半的文件"""
+        tmp_path = self._path(f'{name}.tmp')
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, self._path(name))
+
+    @staticmethod
+    def _write_meta(directory, rows, stocks, last_date):
+        """写入 meta.json (先写临时文件再替换)"""
+        tmp_path = os.path.join(directory, 'meta.json.tmp')
+        meta = {
+            'rows': rows,
+            'stocks': stocks,
+            'last_date': str(last_date) if last_date is not None else None,
+            'update_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=4)
+        os.replace(tmp_path, os.path.join(directory, 'meta.json'))
+
+    def _save(self, ids, offsets, lengths, arrays):
+        """写入临时目录后整体替换, 避免读到写了一半的文件"""
+        tmp_dir = self.store_dir.rstrip(os.sep) + '.tmp'
+        old_dir = self.store_dir.rstrip(os.sep) + '.old'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        np.save(os.path.join(tmp_dir, 'ids.npy'), np.asarray(ids, dtype='<U6'))
+        np.save(os.path.join(tmp_dir, 'offsets.npy'), offsets)
+        np.save(os.path.join(tmp_dir, 'lengths.npy'), lengths)
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), np.ascontiguousarray(arr))
+
+        dates = arrays['date']
+        dates = dates[~np.isnat(dates)]
+        self._write_meta(tmp_dir, int(lengths.sum()), len(ids), dates.max() if len(dates) else None)
+
+        self.reload()
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.store_dir):
+            os.replace(self.store_dir, old_dir)
+        os.replace(tmp_dir, self.store_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _ranges_to_index(starts, lengths):
+    """把多个 [start, start+length) 区间展开成一个索引数组"""
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    block_starts = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return block_starts + np.arange(total, dtype=np.int64)
+
+
+def _normalize(df):
+    """统一列名与类型: 接受 StockMain 列名或存储列名"""
+    df = df.rename(columns={v: k for k, v in COLUMN_MAP.items()})
+    df = df.copy()
+    df['id'] = df['id'].astype(str).str.zfill(6)
+    df['date'] = pd.to_datetime(df['date']).values.astype('datetime64[D]')
+    for col in BarStore.COLUMNS:
+        if col not in df.columns:
+            df[col] = np.nan
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype(np.float64)
+    return df[['id', 'date', *BarStore.COLUMNS]]
+
+
+def get_store_path(config):
+    """根据配置返回存储目录, 未配置时返回 None"""
+    store_config = config.get('BarStore', {})
+    if not store_config.get('enabled', False):
+        return None
+    _, _, root_dir = find_config_path()
+    return os.path.join(root_dir, store_config['path'])
+
+
+def open_bar_store(config, required_date=None):
+    """
+    打开本地存储供加载器使用
+
+    Args:
+        config (dict): 配置
+        required_date: 需要包含的交易日, 存储未更新到该日时返回 None
+
+    Returns:
+        BarStore 或 None (未启用 / 未建立 / 数据过旧), 调用方应回退到 SQL
+    """
+    path = get_store_path(config)
+    if path is None:
+        return None
+    store = BarStore(path)
+    if not store.exists():
+        return None
+    if required_date is not None and not store.covers(required_date):
+        return None
+    return store
+
+
+def append_daily_table(config, daily_table, trade_date, logger=None):
+    """
+    将日表 (stock_zh_a_spot_em 快照) 中的当日数据追加到本地存储, 由 AK004 调用
+    存储未建立时跳过; 追加失败时使存储失效, 加载器回退到 SQL
+
+    Returns:
+        bool: 是否追加成功
+    """
+    path = get_store_path(config)
+    if path is None:
+        return False
+    store = BarStore(path)
+    if not store.exists():
+        if logger:
+            logger.info_print(f"BarStore 未建立, 跳过追加 (请先运行 CommonFunc/bar_store.py 重建)")
+        return False
+
+    connection = None
+    try:
+        connection = db_con_pymysql(config)
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT Id AS id, opentoday AS open_price, newprice AS close_price,
+                       high, low, volume, chg_percen
+                FROM {daily_table}
+            """)
+            df = pd.DataFrame(cursor.fetchall())
+        if df.empty:
+            return False
+        df['date'] = trade_date
+        added = store.append(df)
+        if logger:
+            logger.info_print(f"BarStore 已追加 {trade_date} 共 {added} 条数据")
+        return True
+    except Exception as e:
+        store.invalidate()
+        if logger:
+            logger.error_print(f"BarStore 追加失败, 已标记失效: {str(e)}")
+        return False
+    finally:
+        if connection:
+            connection.close()
+
+
+def rebuild_from_db(config, logger=None):
+    """从主表 (Latest = 1) 全量重建本地存储"""
+    path = get_store_path(config)
+    if path is None:
+        raise ValueError("配置文件中未启用 BarStore")
+    main_table = config['DB_tables']['main_query_table']
+    connection = db_con_pymysql(config)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT id, date, open_price, high, low, close_price, volume, chg_percen
+                FROM {main_table}
+                WHERE Latest = 1
+            """)
+            df = pd.DataFrame(cursor.fetchall())
+    finally:
+        connection.close()
+    if df.empty:
+        raise ValueError(f"{main_table} 中没有 Latest = 1 的数据")
+    store = BarStore(path)
+    store.write(df)
+    if logger:
+        logger.info_print(f"BarStore 重建完成: {store.ids.size} 只股票, 最新日期 {store.last_date}")
+    return store
+
+
+def main():
+    env = sys.argv[1] if len(sys.argv) > 1 else "PROD"
+    config_path_QA, config_path_PROD, _ = find_config_path()
+    config = load_config(config_path_QA if env == "QA" else config_path_PROD)
+    logger = set_log(config, "bar_store.log", prefix=env)
+    rebuild_from_db(config, logger)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"处理失败：{str(e)}")
@@ -0,0 +1,132 @@
+"""
+批量写入数据库
+以列数组 (每列一个数组) 为输入, 提供两种写入方式:
+    executemany: 分块多行 INSERT (pymysql 会把每块改写为一条多行 INSERT 语句)
+    load_data:   先写入内存 CSV, 再用 LOAD DATA LOCAL INFILE 导入; 不可用时自动回退到 executemany
+写入方式由配置文件中的 BulkInsert 决定, 连接需在 DBConnection 中开启 local_infile 才能使用 load_data
+"""
+
+import io
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+DEFAULT_METHOD = 'executemany'
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def get_bulk_options(config):
+    """从配置中读取写入方式和分块大小"""
+    bulk_config = config.get('BulkInsert', {})
+    return bulk_config.get('method', DEFAULT_METHOD), bulk_config.get('chunk_size', DEFAULT_CHUNK_SIZE)
+
+
+def _to_frame(columns):
+    """把 {列名: 数组或常量} 整理为 DataFrame, 常量会被广播到所有行"""
+    lengths = [len(v) for v in columns.values() if isinstance(v, (list, tuple, np.ndarray, pd.Series, pd.Index))]
+    if not lengths:
+        raise ValueError("至少需要一列数组")
+    n = lengths[0]
+    if any(length != n for length in lengths):
+        raise ValueError(f"各列长度不一致: {lengths}")
+    data = {}
+    for name, values in columns.items():
+        if isinstance(values, (list, tuple, np.ndarray, pd.Series, pd.Index)):
+            data[name] = np.asarray(values, dtype=object) if isinstance(values, (list, tuple)) else np.asarray(values)
+        else:
+            data[name] = [values] * n
+    return pd.DataFrame(data)
+
+
+def _to_rows(df):
+    """转换为 Python 原生类型的行元组, 空值转为 None"""
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = [None if pd.isna(v) else v.to_pydatetime() for v in series]
+        else:
+            values = series.astype(object).where(series.notna(), None).tolist()
+        columns.append(values)
+    return list(zip(*columns))
+
+
+def _insert_sql(table, names, update_columns=None):
+    """构造 INSERT 语句, VALUES 中只使用 %s 以便 pymysql 改写为多行插入"""
+    sql = (f"INSERT INTO {table} ({', '.join(names)}) "
+           f"VALUES ({', '.join(['%s'] * len(names))})")
+    if update_columns:
+        sql += " ON DUPLICATE KEY UPDATE " + ", ".join(f"{c} = VALUES({c})" for c in update_columns)
+    return sql
+
+
+def insert_executemany(connection, table, df, chunk_size=DEFAULT_CHUNK_SIZE, update_columns=None):
+    """分块 executemany 写入, 返回写入行数"""
+    sql = _insert_sql(table, list(df.columns), update_columns)
+    rows = _to_rows(df)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), chunk_size):
+            cursor.executemany(sql, rows[start:start + chunk_size])
+    return len(rows)
+
+
+def insert_load_data(connection, table, df):
+    """
+    通过 LOAD DATA LOCAL INFILE 写入, 返回写入行数
+
+    数据先生成到内存 CSV 缓冲区; pymysql 只能从文件路径读取本地文件, 因此缓冲区会写到临时文件后再导入
+    """
+    buffer = io.StringIO()
+    df.to_csv(buffer, header=False, index=False, na_rep='\\N', lineterminator='\n',
+              date_format='%Y-%m-%d %H:%M:%S')
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(buffer.getvalue())
+        sql = (f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} "
+               f"CHARACTER SET utf8mb4 "
+               f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+               f"LINES TERMINATED BY '\\n' "
+               f"({', '.join(df.columns)})")
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (path,))
+    finally:
+        os.remove(path)
+    return len(df)
+
+
+def bulk_insert(connection, table, columns, method=DEFAULT_METHOD, chunk_size=DEFAULT_CHUNK_SIZE,
+                update_columns=None, logger=None):
+    """
+    批量写入数据 (不提交事务, 由调用方 commit)
+
+    Args:
+        connection: pymysql 连接
+        table (str): 目标表
+        columns (dict): {列名: 数组或常量}, 常量 (如写入时间) 会被广播到所有行
+        method (str): 'executemany' 或 'load_data'
+        chunk_size (int): executemany 每块行数
+        update_columns (list): 指定时生成 ON DUPLICATE KEY UPDATE (只能使用 executemany)
+        logger: 日志对象, 回退时记录警告
+
+    Returns:
+        int: 写入行数
+    """
+    df = _to_frame(columns)
+    if df.empty:
+        return 0
+    if method == 'load_data' and not update_columns:
+        try:
+            return insert_load_data(connection, table, df)
+        except Exception as e:
+            if logger:
+                logger.warning(f"LOAD DATA 写入 {table} 失败, 改用 executemany: {str(e)}")
+    return insert_executemany(connection, table, df, chunk_size, update_columns)
+
+
+def bulk_insert_df(connection, table, df, config=None, update_columns=None, logger=None):
+    """按配置写入 DataFrame, 列名即数据库列名"""
+    method, chunk_size = get_bulk_options(config or {})
+    return bulk_insert(connection, table, {c: df[c].values for c in df.columns},
+                       method, chunk_size, update_columns, logger)
@@ -0,0 +1,95 @@
+"""
+K线特征
+每只股票只计算一次实体上下沿、实体高度、上下影线长度和影线分段数, 供 Triangle_v2、Week_K_v2 和缺口计算共用,
+避免在内层循环中对每个右侧点重复计算, 也避免在热路径上反复把 DataFrame 转换为 numpy 数组
+价格数组的最后一维为K线 (天/周), 前面的维度可以是股票 (批量计算时的靠右对齐张量)
+"""
+
+import numpy as np
+
+OHLC_COLUMNS = ('open', 'high', 'low', 'close')
+
+# 影线分段数: 影线/实体 比例 × 6, 最少 2 段, 最多 8 段; 十字星固定 4 段
+MIN_SEGMENTS = 2
+MAX_SEGMENTS = 8
+DOJI_SEGMENTS = 4
+# 影线短于实体高度的该比例时不作为左侧点
+MIN_SHADOW_RATIO = 0.2
+
+
+class CandleFeatures:
+    """
+    一只股票 (或一组靠右对齐的股票) 的K线特征
+
+    Attributes:
+        ohlc (np.ndarray): (..., n, 4) 的 open/high/low/close
+        open, high, low, close (np.ndarray): (..., n) 连续存储的价格数组
+        body_high, body_low, body_height (np.ndarray): 实体上沿、下沿、高度
+        upper_shadow, lower_shadow (np.ndarray): 上影线、下影线长度
+        upper_segments, lower_segments (np.ndarray): 影线分段数, 0 表示该K线的影线不能作为左侧点
+        day_index (np.ndarray): (n,) K线序号
+        dates (np.ndarray): (n,) 日期, 只在输出结果时使用, 可为 None
+    """
+
+    def __init__(self, ohlc, dates=None):
+        self.ohlc = np.ascontiguousarray(ohlc, dtype=np.float64)
+        self.open = np.ascontiguousarray(self.ohlc[..., 0])
+        self.high = np.ascontiguousarray(self.ohlc[..., 1])
+        self.low = np.ascontiguousarray(self.ohlc[..., 2])
+        self.close = np.ascontiguousarray(self.ohlc[..., 3])
+        self.body_high = np.maximum(self.open, self.close)
+        self.body_low = np.minimum(self.open, self.close)
+        self.body_height = self.body_high - self.body_low
+        self.upper_shadow = self.high - self.body_high
+        self.lower_shadow = self.body_low - self.low
+        self.upper_segments = shadow_segments(self.upper_shadow, self.body_height)
+        self.lower_segments = shadow_segments(self.lower_shadow, self.body_height)
+        self.day_index = np.arange(self.ohlc.shape[-2], dtype=np.int64)
+        self.dates = None if dates is None else np.asarray(dates)
+
+    @classmethod
+    def from_frame(cls, df, columns=OHLC_COLUMNS, date_column=None):
+        """
+        从 DataFrame 生成
+
+        Args:
+            df (pandas.DataFrame): K线数据, 按日期升序
+            columns (tuple): open/high/low/close 对应的列名
+            date_column (str): 日期列名, None 表示使用索引
+        """
+        dates = df.index.values if date_column is None else df[date_column].values
+        return cls(df[list(columns)].to_numpy(dtype=np.float64), dates)
+
+    def __len__(self):
+        return self.ohlc.shape[-2]
+
+    def take(self, rows):
+        """批量计算时取出部分股票, 不重新计算特征"""
+        subset = object.__new__(CandleFeatures)
+        for name, value in self.__dict__.items():
+            subset.__dict__[name] = value if name in ('day_index', 'dates') or value is None else value[rows]
+        return subset
+
+    def edge(self, upper):
+        """影线起点 (实体上沿/下沿)、影线终点 (最高价/最低价) 和分段数"""
+        if upper:
+            return self.body_high, self.high, self.upper_segments
+        return self.body_low, self.low, self.lower_segments
+
+
+def shadow_segments(shadow_length, body_height):
+    """
+    影线分段数, 影线太短或没有影线时为 0
+
+    Args:
+        shadow_length, body_height (np.ndarray): 影线长度和实体高度, 形状相同
+
+    Returns:
+        np.ndarray: 与输入形状相同的 int64 数组
+    """
+    has_body = body_height > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        usable = ~(has_body & (shadow_length < body_height * MIN_SHADOW_RATIO)) & (shadow_length > 0)
+        ratio_segments = np.clip(np.trunc(shadow_length / body_height * 6), MIN_SEGMENTS, MAX_SEGMENTS)
+    segments = np.where(has_body, ratio_segments, DOJI_SEGMENTS)
+    return np.where(usable, segments, 0).astype(np.int64)
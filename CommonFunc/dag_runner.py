@@ -0,0 +1,206 @@
+"""
+按依赖关系并发执行程序序列
+每个步骤声明输入和输出 (表名/CSV 等资源名), 某资源的输出步骤即为读取该资源步骤的上游
+    inputs:      上游成功后才执行, 上游失败或跳过时本步骤跳过
+    soft_inputs: 只等待上游结束, 无论成败都执行 (例如过滤程序在 AK 序列失败时仍然执行)
+互不依赖的步骤在进程池中并发执行, 每个步骤的耗时写入日志目录下的 DAG_timings.jsonl
+步骤函数返回 None 或 False 视为失败, 与原顺序执行时的判断一致
+"""
+
+import os
+import json
+import time
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class Step:
+    """单个步骤"""
+
+    def __init__(self, name, func, inputs=(), outputs=(), soft_inputs=()):
+        """
+        Args:
+            name (str): 步骤名, 例如 'AK006'
+            func (callable): 模块级函数 (需可被 pickle), 无参数
+            inputs (list): 读取的资源, 上游必须成功
+            outputs (list): 写入的资源
+            soft_inputs (list): 读取的资源, 只需上游结束
+        """
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.soft_inputs = list(soft_inputs)
+
+
+def _call_step(func):
+    """在子进程中执行步骤, 只返回成败和起止时间, 避免回传大对象"""
+    start = time.time()
+    result = func()
+    return result is not None and result is not False, start, time.time()
+
+
+def resolve_dependencies(steps):
+    """
+    根据输入输出计算每个步骤的上游
+
+    Returns:
+        dict: {步骤名: (硬依赖集合, 软依赖集合)}
+    """
+    producers = {}
+    for step in steps:
+        for output in step.outputs:
+            if output in producers:
+                raise ValueError(f"资源 {output} 同时由 {producers[output]} 和 {step.name} 输出")
+            producers[output] = step.name
+
+    dependencies = {}
+    for step in steps:
+        hard = {producers[r] for r in step.inputs if r in producers and producers[r] != step.name}
+        soft = {producers[r] for r in step.soft_inputs if r in producers and producers[r] != step.name} - hard
+        dependencies[step.name] = (hard, soft)
+
+    # 检查环
+    visited, finished = set(), set()
+
+    def visit(name, path):
+        if name in finished:
+            return
+        if name in visited:
+            raise ValueError(f"步骤依赖存在环: {' -> '.join(path + [name])}")
+        visited.add(name)
+        hard, soft = dependencies[name]
+        for upstream in hard | soft:
+            visit(upstream, path + [name])
+        finished.add(name)
+
+    for step in steps:
+        visit(step.name, [])
+    return dependencies
+
+
+class DAGRunner:
+    """按依赖关系并发执行步骤"""
+
+    def __init__(self, steps, max_workers=3, use_processes=True, timings_path=None, logger=None):
+        """
+        Args:
+            steps (list[Step]): 步骤列表, 同时就绪的步骤按列表顺序提交
+            max_workers (int): 并发数
+            use_processes (bool): True 使用进程池, False 使用线程池 (调试用)
+            timings_path (str): 耗时记录文件 (jsonl), 为 None 时不写文件
+            logger: 日志对象
+        """
+        self.steps = {step.name: step for step in steps}
+        self.order = [step.name for step in steps]
+        self.dependencies = resolve_dependencies(steps)
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self.timings_path = timings_path
+        self.logger = logger
+        self.records = {}
+
+    def _log(self, level, message):
+        if self.logger:
+            getattr(self.logger, level)(message)
+
+    def _ready(self, name):
+        """所有上游都已结束时返回 (True, 是否需要跳过)"""
+        hard, soft = self.dependencies[name]
+        if any(upstream not in self.records for upstream in hard | soft):
+            return False, False
+        skip = any(self.records[upstream]["status"] != "success" for upstream in hard)
+        return True, skip
+
+    def run(self):
+        """
+        执行全部步骤
+
+        Returns:
+            dict: {步骤名: {status, start, end, duration}}, status 为 success / failed / skipped
+        """
+        run_start = time.time()
+        pending = list(self.order)
+        running = {}
+        executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        with executor_class(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name in list(pending):
+                    ready, skip = self._ready(name)
+                    if not ready:
+                        continue
+                    pending.remove(name)
+                    if skip:
+                        self.records[name] = {"status": "skipped", "start": None, "end": None, "duration": 0.0}
+                        self._log('error_print', f"{name} 的上游执行失败, 跳过")
+                        continue
+                    self._log('info_print', f"开始执行 {name}")
+                    running[executor.submit(_call_step, self.steps[name].func)] = name
+
+                if not running:
+                    # 剩余步骤都已被跳过
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        success, start, end = future.result()
+                        self.records[name] = {
+                            "status": "success" if success else "failed",
+                            "start": start, "end": end, "duration": end - start
+                        }
+                        if success:
+                            self._log('info_print', f"{name} 执行成功, 耗时 {end - start:.1f} 秒")
+                        else:
+                            self._log('error_print', f"{name} 执行失败")
+                    except Exception as e:
+                        now = time.time()
+                        self.records[name] = {"status": "failed", "start": None, "end": now, "duration": 0.0}
+                        self._log('error_print', f"{name} 执行过程中发生错误: {str(e)}")
+
+        wall_clock = time.time() - run_start
+        total = sum(record["duration"] for record in self.records.values())
+        self._log('info_print', f"全部步骤结束, 总耗时 {wall_clock:.1f} 秒 (各步骤耗时之和 {total:.1f} 秒)")
+        self._save_timings(run_start, wall_clock)
+        return self.records
+
+    def success(self):
+        """全部步骤是否成功"""
+        return all(record["status"] == "success" for record in self.records.values())
+
+    def _save_timings(self, run_start, wall_clock):
+        if not self.timings_path:
+            return
+        entry = {
+            "run_start": datetime.fromtimestamp(run_start).strftime("%Y-%m-%d %H:%M:%S"),
+            "wall_clock": round(wall_clock, 2),
+            "steps": {
+                name: {
+                    "status": record["status"],
+                    "start": datetime.fromtimestamp(record["start"]).strftime("%H:%M:%S") if record["start"] else None,
+                    "duration": round(record["duration"], 2)
+                }
+                for name, record in self.records.items()
+            }
+        }
+        try:
+            with open(self.timings_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            self._log('warning_print', f"写入耗时记录失败: {str(e)}")
+
+
+def run_steps(config, steps, logger=None):
+    """按配置文件中的 Scheduler 参数执行步骤, 返回是否全部成功"""
+    options = config.get("Scheduler", {})
+    timings_file = options.get("timings_file", "DAG_timings.jsonl")
+    runner = DAGRunner(
+        steps,
+        max_workers=options.get("max_workers", 3),
+        use_processes=options.get("use_processes", True),
+        timings_path=os.path.join(config["Log"]["log_path"], timings_file) if timings_file else None,
+        logger=logger
+    )
+    runner.run()
+    return runner.success()
@@ -0,0 +1,259 @@
+"""
+进程内共享的数据库连接池
+    ConnectionPool:   pymysql 连接池, db_con_pymysql 从池中取连接, 调用 close() 时归还而不是断开
+    get_engine:       每个进程每个数据库只创建一个 SQLAlchemy engine, 复用其内置连接池
+    - 连接数上限: 连接全部被占用时等待归还, 超时抛出异常
+    - pre-ping: 取出连接时检查连接是否可用, 断开时自动重连
+    - recycle: 超过指定时间的连接丢弃重建, 避免被服务端 wait_timeout 断开
+    - 多线程: 每个连接同一时间只交给一个线程使用
+    - fork: 子进程不复用父进程的连接 (socket 不能共享), 首次使用时重新建立连接池
+参数由配置文件 DBPool 决定, enabled 为 false 时 db_con_pymysql / db_con_sqlalchemy 保持每次新建连接
+"""
+
+import os
+import time
+import atexit
+import threading
+import pymysql
+from pymysql.constants import SERVER_STATUS
+from sqlalchemy import create_engine
+
+DEFAULT_OPTIONS = {
+    "enabled": True,
+    "max_size": 16,        # 每个进程每个数据库最多同时打开的 pymysql 连接数
+    "max_idle": 8,         # 最多保留的空闲连接数
+    "timeout": 60,         # 等待空闲连接的最长时间 (秒)
+    "recycle": 3600,       # 连接最长使用时间 (秒)
+    "pre_ping": True,
+    "engine_pool_size": 5,
+    "engine_max_overflow": 10,
+}
+
+_lock = threading.Lock()
+_pools = {}
+_engines = {}
+_pid = os.getpid()
+
+
+def get_pool_options(config):
+    """从配置中读取连接池参数"""
+    return {**DEFAULT_OPTIONS, **config.get("DBPool", {})}
+
+
+def _connect_kwargs(config):
+    db_config = config["DBConnection"]
+    return {
+        "host": db_config["host"],
+        "user": db_config["user"],
+        "password": db_config["password"],
+        "database": db_config["database"],
+        "cursorclass": pymysql.cursors.DictCursor,
+        "local_infile": db_config.get("local_infile", False),
+    }
+
+
+def _key(config):
+    db_config = config["DBConnection"]
+    return (db_config["host"], db_config["user"], db_config["database"], db_config.get("local_infile", False))
+
+
+class PooledConnection:
+    """
+    池中取出的连接, 用法与 pymysql 连接相同
+    close() 把连接归还到池中; 未提交的事务在归还时回滚, 与直接断开连接的效果一致
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get("_raw")
+        if raw is None:
+            raise pymysql.err.InterfaceError(0, "连接已归还到连接池")
+        return getattr(raw, name)
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """pymysql 连接池"""
+
+    def __init__(self, connect_kwargs, max_size=16, max_idle=8, timeout=60, recycle=3600, pre_ping=True):
+        self.connect_kwargs = connect_kwargs
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.pid = os.getpid()
+        self._idle = []                      # [(连接, 创建时间)]
+        self._created = {}                   # id(连接) -> 创建时间
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+
+    def _new_connection(self):
+        raw = pymysql.connect(**self.connect_kwargs)
+        with self._lock:
+            self._created[id(raw)] = time.monotonic()
+        return raw
+
+    def _discard(self, raw):
+        with self._lock:
+            self._created.pop(id(raw), None)
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """取出一个连接, 返回 PooledConnection"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise pymysql.err.OperationalError(
+                2013, f"等待数据库连接超时 ({self.timeout} 秒), 连接池上限 {self.max_size}")
+        try:
+            while True:
+                with self._lock:
+                    raw = self._idle.pop()[0] if self._idle else None
+                if raw is None:
+                    return PooledConnection(self, self._new_connection())
+                if time.monotonic() - self._created.get(id(raw), 0) > self.recycle:
+                    self._discard(raw)
+                    continue
+                if self.pre_ping:
+                    try:
+                        raw.ping(reconnect=True)
+                    except Exception:
+                        self._discard(raw)
+                        continue
+                return PooledConnection(self, raw)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, raw):
+        """归还连接"""
+        if os.getpid() != self.pid:
+            # fork 前取出的连接不能归还到子进程的池中
+            return
+        try:
+            if raw.open:
+                if raw.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    raw.rollback()
+                if raw.get_autocommit() != raw.autocommit_mode:
+                    raw.autocommit(raw.autocommit_mode)
+            keep = raw.open
+        except Exception:
+            keep = False
+        with self._lock:
+            if keep and len(self._idle) < self.max_idle:
+                self._idle.append((raw, self._created.get(id(raw), time.monotonic())))
+                raw = None
+        if raw is not None:
+            self._discard(raw)
+        self._slots.release()
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for raw, _ in idle:
+            self._discard(raw)
+
+
+def _reset_after_fork():
+    """子进程中丢弃父进程的连接池和 engine, 不关闭父进程的连接"""
+    global _lock, _pid
+    _lock = threading.Lock()
+    _pid = os.getpid()
+    _pools.clear()
+    for engine in _engines.values():
+        try:
+            engine.dispose(close=False)
+        except TypeError:
+            pass
+    _engines.clear()
+
+
+def _check_pid():
+    if os.getpid() != _pid:
+        _reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_pool(config):
+    """当前进程中该数据库的连接池"""
+    _check_pid()
+    key = _key(config)
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = get_pool_options(config)
+            pool = ConnectionPool(
+                _connect_kwargs(config),
+                max_size=options["max_size"],
+                max_idle=options["max_idle"],
+                timeout=options["timeout"],
+                recycle=options["recycle"],
+                pre_ping=options["pre_ping"],
+            )
+            _pools[key] = pool
+        return pool
+
+
+def get_engine(config):
+    """
+    当前进程中该数据库的 SQLAlchemy engine
+
+    Returns:
+        (Engine, bool): engine 以及是否为本次新建
+    """
+    _check_pid()
+    key = _key(config)
+    db_config = config["DBConnection"]
+    with _lock:
+        engine = _engines.get(key)
+        if engine is not None:
+            return engine, False
+        options = get_pool_options(config)
+        engine = create_engine(
+            f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}",
+            pool_size=options["engine_pool_size"],
+            max_overflow=options["engine_max_overflow"],
+            pool_timeout=options["timeout"],
+            pool_recycle=options["recycle"],
+            pool_pre_ping=options["pre_ping"],
+        )
+        _engines[key] = engine
+        return engine, True
+
+
+def close_all():
+    """关闭当前进程的所有空闲连接 (进程退出时自动调用)"""
+    if os.getpid() != _pid:
+        return
+    for pool in list(_pools.values()):
+        pool.close_all()
+    for engine in list(_engines.values()):
+        engine.dispose()
+
+
+atexit.register(close_all)
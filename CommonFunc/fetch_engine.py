@@ -0,0 +1,334 @@
+"""
+历史数据并发请求引擎
+    AdaptiveTokenBucket: 令牌桶限速, 根据请求失败率和响应时间自动调整速率 (失败时减半, 正常时缓慢回升)
+    FetchEngine: 有界并发请求 + 单只股票重试退避 + 生产者/消费者队列, 请求线程只负责获取数据,
+                 写库线程合并多只股票的数据后批量写入, 整个过程只使用一个数据库连接
+请求函数和写入函数均可注入, 便于对接本地桩服务器测试
+"""
+
+import time
+import queue
+import random
+import threading
+import pandas as pd
+from requests.exceptions import RequestException
+from CommonFunc.DBconnection import db_con_pymysql
+from CommonFunc.bulk_insert import bulk_insert, get_bulk_options
+
+# stock_zh_a_hist 返回列与 buffer_table 列的对应关系
+HIST_COLUMN_MAP = {
+    "日期": "date",
+    "开盘": "open_price",
+    "收盘": "close_price",
+    "最高": "high",
+    "最低": "low",
+    "成交量": "volume",
+    "成交额": "turnover",
+    "振幅": "amplitude",
+    "涨跌幅": "chg_percen",
+    "涨跌额": "chg_amount",
+    "换手率": "turnover_rate",
+}
+
+# 需要重试的异常 (网络错误/超时/SSL 错误均为 RequestException 的子类)
+RETRYABLE_EXCEPTIONS = (RequestException, ConnectionError, TimeoutError)
+
+_STOP = object()
+
+
+class AdaptiveTokenBucket:
+    """自适应令牌桶"""
+
+    def __init__(self, rate=2.0, burst=4, min_rate=0.1, max_rate=10.0,
+                 target_latency=3.0, increase_step=0.1, decrease_factor=0.5):
+        """
+        Args:
+            rate (float): 初始速率 (次/秒)
+            burst (int): 桶容量, 允许的瞬时并发请求数
+            min_rate, max_rate (float): 速率上下限
+            target_latency (float): 响应时间超过该值 (秒) 时降低速率
+            increase_step (float): 每次成功请求增加的速率
+            decrease_factor (float): 请求失败时速率乘以该系数
+        """
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.target_latency = target_latency
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """获取一个令牌, 令牌不足时阻塞等待"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def record(self, success, latency=None):
+        """
+        根据请求结果调整速率
+
+        Args:
+            success (bool): 请求是否成功
+            latency (float): 响应时间 (秒)
+        """
+        with self.lock:
+            if not success:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                # 清空令牌, 让退避立即生效
+                self.tokens = min(self.tokens, 0)
+            elif latency is not None and latency > self.target_latency:
+                self.rate = max(self.min_rate, self.rate * 0.9)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+
+class FetchEngine:
+    """并发请求 + 批量写库"""
+
+    def __init__(self, fetch_func, write_func, limiter=None, max_workers=8, retries=3,
+                 backoff_base=2.0, backoff_max=60.0, write_batch_rows=20000, queue_size=64,
+                 on_status=None, logger=None):
+        """
+        Args:
+            fetch_func (callable): fetch_func(symbol) -> DataFrame 或 None (无数据)
+            write_func (callable): write_func(DataFrame) 批量写入, 由写库线程调用
+            limiter (AdaptiveTokenBucket): 限速器
+            max_workers (int): 请求线程数
+            retries (int): 单只股票最多重试次数
+            backoff_base, backoff_max (float): 指数退避的基数和上限 (秒)
+            write_batch_rows (int): 累计达到该行数后写库一次
+            queue_size (int): 待写入队列长度, 队列满时请求线程等待 (背压)
+            on_status (callable): on_status(symbol, status) 每只股票完成时回调
+            logger: 日志对象
+        """
+        self.fetch_func = fetch_func
+        self.write_func = write_func
+        self.limiter = limiter or AdaptiveTokenBucket()
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.write_batch_rows = write_batch_rows
+        self.queue_size = queue_size
+        self.on_status = on_status
+        self.logger = logger
+        self.status = {}
+        self._status_lock = threading.Lock()
+
+    def _set_status(self, symbols, status):
+        with self._status_lock:
+            for symbol in symbols:
+                self.status[symbol] = status
+                if self.on_status:
+                    self.on_status(symbol, status)
+
+    def _log(self, level, message):
+        if self.logger:
+            getattr(self.logger, level)(message)
+
+    def _fetch_with_retry(self, symbol):
+        """请求单只股票, 网络类错误按指数退避重试"""
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                data = self.fetch_func(symbol)
+                self.limiter.record(True, time.monotonic() - start)
+                return data
+            except RETRYABLE_EXCEPTIONS as e:
+                self.limiter.record(False)
+                if attempt == self.retries:
+                    self._log('error', f"{symbol} 重试 {self.retries} 次后仍然失败: {str(e)[:80]}")
+                    raise
+                wait = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.5)
+                self._log('warning', f"{symbol} 请求失败, {wait:.1f}s 后第 {attempt + 1} 次重试: {str(e)[:80]}")
+                time.sleep(wait)
+
+    def _worker(self, symbols, results):
+        while True:
+            try:
+                symbol = symbols.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                data = self._fetch_with_retry(symbol)
+            except Exception as e:
+                if not isinstance(e, RETRYABLE_EXCEPTIONS):
+                    self._log('error', f"{symbol} 请求异常: {str(e)[:80]}")
+                self._set_status([symbol], "api_fail")
+                continue
+            if data is None or data.empty:
+                self._set_status([symbol], "no_data")
+                continue
+            results.put((symbol, data))
+
+    def _flush(self, pending):
+        symbols = [symbol for symbol, _ in pending]
+        try:
+            self.write_func(pd.concat([data for _, data in pending], ignore_index=True))
+            self._set_status(symbols, "success")
+        except Exception as e:
+            self._log('error', f"批量写入 {len(symbols)} 只股票失败: {str(e)[:80]}")
+            self._set_status(symbols, "db_fail")
+
+    def _writer(self, results):
+        pending, rows = [], 0
+        while True:
+            item = results.get()
+            if item is _STOP:
+                break
+            pending.append(item)
+            rows += len(item[1])
+            if rows >= self.write_batch_rows:
+                self._flush(pending)
+                pending, rows = [], 0
+        if pending:
+            self._flush(pending)
+
+    def run(self, symbols):
+        """
+        请求并写入全部股票
+
+        Returns:
+            dict: {symbol: status}, status 为 success / no_data / api_fail / db_fail
+        """
+        todo = queue.Queue()
+        for symbol in symbols:
+            todo.put(symbol)
+        results = queue.Queue(maxsize=self.queue_size)
+
+        writer = threading.Thread(target=self._writer, args=(results,), daemon=True)
+        writer.start()
+        workers = [threading.Thread(target=self._worker, args=(todo, results), daemon=True)
+                   for _ in range(min(self.max_workers, max(1, len(symbols))))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        results.put(_STOP)
+        writer.join()
+        return dict(self.status)
+
+    def summary(self):
+        """按状态统计数量"""
+        counts = {}
+        for status in self.status.values():
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+
+def make_hist_fetcher(start_date, end_date, period="daily", adjust="qfq", timeout=30):
+    """返回请求 stock_zh_a_hist 的函数"""
+    import akshare as ak
+
+    def fetch(symbol):
+        return ak.stock_zh_a_hist(
+            symbol=symbol,
+            period=period,
+            start_date=start_date,
+            end_date=end_date,
+            adjust=adjust,
+            timeout=timeout
+        )
+    return fetch
+
+
+def to_buffer_frame(symbol, data):
+    """把 stock_zh_a_hist 结果整理为 buffer_table 的列"""
+    df = data.rename(columns=HIST_COLUMN_MAP)[list(HIST_COLUMN_MAP.values())].copy()
+    df.insert(1, "id", symbol)
+    return df
+
+
+class BufferTableWriter:
+    """写库线程使用的 buffer_table 写入器, 复用同一个连接"""
+
+    def __init__(self, config, table=None, latest=0, logger=None):
+        self.config = config
+        self.table = table or config["DB_tables"]["buffer_table"]
+        self.latest = latest
+        self.logger = logger
+        self.method, self.chunk_size = get_bulk_options(config)
+        self.connection = None
+
+    def __call__(self, df):
+        if self.connection is None:
+            self.connection = db_con_pymysql(self.config)
+        try:
+            bulk_insert(self.connection, self.table, {
+                **{c: df[c].values for c in df.columns},
+                "Insrt_time": pd.Timestamp.now().to_pydatetime(),
+                "Latest": self.latest
+            }, self.method, self.chunk_size, logger=self.logger)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def get_engine_options(config):
+    """从配置中读取 FetchEngine 参数"""
+    options = config.get("FetchEngine", {})
+    limiter = AdaptiveTokenBucket(
+        rate=options.get("rate", 2.0),
+        burst=options.get("burst", 4),
+        min_rate=options.get("min_rate", 0.1),
+        max_rate=options.get("max_rate", 10.0),
+        target_latency=options.get("target_latency", 3.0)
+    )
+    return {
+        "limiter": limiter,
+        "max_workers": options.get("max_workers", 8),
+        "retries": options.get("retries", 3),
+        "backoff_base": options.get("backoff_base", 2.0),
+        "write_batch_rows": options.get("write_batch_rows", 20000),
+    }
+
+
+def fetch_hist_to_buffer(config, symbols, start_date, end_date, latest=0, on_status=None, logger=None):
+    """
+    并发请求日K历史数据并批量写入 buffer_table
+
+    Returns:
+        FetchEngine: 可通过 engine.status / engine.summary() 查看结果
+    """
+    fetch = make_hist_fetcher(start_date, end_date)
+
+    def fetch_buffer_frame(symbol):
+        data = fetch(symbol)
+        if data is None or data.empty:
+            return None
+        return to_buffer_frame(symbol, data)
+
+    writer = BufferTableWriter(config, latest=latest, logger=logger)
+    engine = FetchEngine(
+        fetch_func=fetch_buffer_frame,
+        write_func=writer,
+        on_status=on_status,
+        logger=logger,
+        **get_engine_options(config)
+    )
+    try:
+        engine.run(symbols)
+    finally:
+        writer.close()
+    return engine
@@ -0,0 +1,128 @@
+"""
+下跌缺口引擎 (Init_Gap 共用)
+所有股票的K线整理为靠右对齐的 (股票 × K线) 矩阵, 按K线顺序只扫描一遍, 每一步同时处理所有股票:
+    - 每只股票未填补的缺口保存在一个栈中. 缺口未填补说明此后的最高价都低于缺口上沿,
+      而新缺口的上沿 (前一根K线最低价) 不高于前一根K线的最高价, 所以栈中缺口的上沿从栈底到栈顶严格递减
+    - 新K线的最高价达到栈顶缺口上沿时该缺口被填补, 依次出栈, 直到栈顶缺口上沿高于最高价
+    - 未填补缺口的下沿为缺口出现以来的最高价. 栈中每一层只记录本层入栈后的最高价,
+      出栈时并入下一层, 因此每根K线只更新栈顶一层
+每个缺口只入栈、出栈一次, 总计算量与K线数量成正比
+结果与逐个缺口向后扫描的原算法 (Init_Gap.calculate_down_gap) 相同
+"""
+
+import numpy as np
+import pandas as pd
+
+# 缺口记录: 股票行号、缺口开始K线 (缺口前一根K线) 和填补K线的序号 (-1 表示未填补)、缺口上沿、缺口下沿
+GAP_DTYPE = np.dtype([
+    ('stock', 'i4'),
+    ('start', 'i4'),
+    ('fill', 'i4'),
+    ('gap_high', 'f8'),
+    ('gap_low', 'f8'),
+])
+
+
+def stack_price_rows(data, id_column='id', date_column='date'):
+    """
+    把长表 (多只股票, 顺序不限) 按股票整理为靠右对齐的行号矩阵
+
+    Returns:
+        tuple: (ids, df, rows)
+            ids: 股票代码 (升序)
+            df: 按股票代码、日期排序后的长表
+            rows: (股票数, 最大K线数) 的 df 行号矩阵, 靠右对齐, 不足部分为 -1
+    """
+    df = data.sort_values([id_column, date_column], kind='stable').reset_index(drop=True)
+    codes, ids = pd.factorize(df[id_column], sort=True)
+    counts = np.bincount(codes, minlength=len(ids))
+    depth = int(counts.max()) if len(counts) else 0
+    # 相对该股票最后一根K线的位置: 0 为最后一根, 之前的K线为负数
+    pos = np.arange(len(df)) - np.repeat(np.cumsum(counts) - 1, counts)
+    rows = np.full((len(ids), depth), -1, dtype=np.int64)
+    rows[codes, depth - 1 + pos] = np.arange(len(df))
+    return np.asarray(ids), df, rows
+
+
+def find_down_gaps(high, low):
+    """
+    找出所有下跌缺口及其填补位置
+
+    下跌缺口: 当根K线最高价低于前一根K线最低价, 缺口上沿为前一根最低价, 下沿为当根最高价
+    填补: 之后某根K线最高价 ≥ 缺口上沿; 填补前每根K线的最高价 (低于上沿) 都会把下沿提高到该最高价
+
+    Args:
+        high, low (np.ndarray): (股票数, K线数) 靠右对齐的最高价、最低价, 空缺为 NaN
+
+    Returns:
+        np.ndarray: GAP_DTYPE 结构化数组, 按股票行号、开始位置排序.
+                    已填补缺口的 gap_low 为填补前的下沿, 与原算法一致
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    S, D = high.shape
+    if D < 2:
+        return np.zeros(0, dtype=GAP_DTYPE)
+
+    # 缺口出现的位置 (第 t 根K线的最高价低于第 t-1 根的最低价), 编号按股票、位置顺序
+    with np.errstate(invalid='ignore'):
+        is_gap = high[:, 1:] < low[:, :-1]
+    gap_stock, gap_bar = np.nonzero(is_gap)
+    gap_bar = gap_bar + 1
+    gaps = np.zeros(len(gap_stock), dtype=GAP_DTYPE)
+    gaps['stock'] = gap_stock
+    gaps['start'] = gap_bar - 1
+    gaps['fill'] = -1
+    gaps['gap_high'] = low[gap_stock, gap_bar - 1]
+    if len(gaps) == 0:
+        return gaps
+    gap_ids = np.full((S, D), -1, dtype=np.int64)
+    gap_ids[gap_stock, gap_bar] = np.arange(len(gaps))
+
+    # 每只股票一个栈: 缺口编号、缺口上沿、本层入栈后的最高价
+    capacity = int(np.bincount(gap_stock, minlength=S).max())
+    stack_ids = np.zeros((S, capacity), dtype=np.int64)
+    stack_high = np.zeros((S, capacity))
+    stack_max = np.zeros((S, capacity))
+    top = np.full(S, -1, dtype=np.int64)
+
+    for t in range(1, D):
+        h = high[:, t]
+
+        # 1. 填补: 栈顶缺口上沿 ≤ 当根最高价时出栈, 本层最高价并入下一层
+        active = np.flatnonzero(top >= 0)
+        while len(active):
+            level = top[active]
+            hit = stack_high[active, level] <= h[active]
+            active, level = active[hit], level[hit]
+            if len(active) == 0:
+                break
+            filled = stack_ids[active, level]
+            gaps['fill'][filled] = t
+            gaps['gap_low'][filled] = stack_max[active, level]
+            below = level - 1
+            keep = below >= 0
+            rows, below_level = active[keep], below[keep]
+            stack_max[rows, below_level] = np.fmax(stack_max[rows, below_level], stack_max[rows, level[keep]])
+            top[active] = below
+            active = rows
+
+        # 2. 未填补: 当根最高价提高栈顶缺口的下沿
+        rows = np.flatnonzero(top >= 0)
+        stack_max[rows, top[rows]] = np.fmax(stack_max[rows, top[rows]], h[rows])
+
+        # 3. 新缺口入栈, 下沿为当根最高价
+        rows = np.flatnonzero(gap_ids[:, t] >= 0)
+        if len(rows):
+            top[rows] += 1
+            stack_ids[rows, top[rows]] = gap_ids[rows, t]
+            stack_high[rows, top[rows]] = low[rows, t - 1]
+            stack_max[rows, top[rows]] = h[rows]
+
+    # 扫描结束仍在栈中的缺口: 下沿为本层及以上各层最高价的最大值
+    running = np.full(S, np.nan)
+    for level in range(capacity - 1, -1, -1):
+        rows = np.flatnonzero(top >= level)
+        running[rows] = np.fmax(running[rows], stack_max[rows, level])
+        gaps['gap_low'][stack_ids[rows, level]] = running[rows]
+    return gaps
@@ -0,0 +1,459 @@
+"""
+连线穿越检查的计算内核 (Triangle_v2 / Week_K_v2 共用)
+    - 连线是否穿过实体 (上边界 / 下边界)
+    - 穿越的上影线 / 下影线数量, 以及周K使用的最长连续穿越数量
+    - 一只股票所有候选连线的批量检查 (Triangle_v2 LineSearch 使用)
+    - 剪枝: 用区间界 (实体边沿的后缀最大值、影线端点的后缀第 k 大值) 跳过必然失败的连线
+安装了 numba 时使用 JIT 编译的逐元素循环 (不分配临时数组, 穿过实体时立即退出),
+否则使用 numpy 实现; 两种实现的计算式相同, 结果一致
+位置参数均为K线序号 (整数), 右侧点位置为 right_idx
+微基准测试: python -m CommonFunc.line_kernels
+"""
+
+import time
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+_backend = 'numba' if HAVE_NUMBA else 'numpy'
+
+
+def get_backend():
+    return _backend
+
+
+def set_backend(name):
+    """切换实现 ('numba' / 'numpy'), 未安装 numba 时只能使用 numpy"""
+    global _backend
+    if name == 'numba' and not HAVE_NUMBA:
+        raise ImportError("未安装 numba")
+    if name not in ('numba', 'numpy'):
+        raise ValueError(f"未知的实现: {name}")
+    _backend = name
+
+
+# ---------- numpy 实现 ----------
+
+def _line_prices_np(left_idx, left_price, right_idx, right_price, end_idx):
+    """左右两点连线在 (left_idx, end_idx) 之间各K线上的价格, 以及每根K线的斜率"""
+    days = np.arange(1, end_idx - left_idx)
+    daily_slope = (right_price - left_price) / (right_idx - left_idx)
+    return left_price + daily_slope * days, daily_slope
+
+
+def _crosses_body_np(prices, left_idx, left_price, right_idx, right_price, upper):
+    between = prices[left_idx + 1:right_idx]
+    if len(between) == 0:
+        return True
+    line_prices, daily_slope = _line_prices_np(left_idx, left_price, right_idx, right_price, right_idx)
+    if upper:
+        body_high = np.maximum(between[:, 0], between[:, 3])
+        return not np.any(line_prices <= body_high + abs(daily_slope))
+    body_low = np.minimum(between[:, 0], between[:, 3])
+    return not np.any(line_prices >= body_low - abs(daily_slope))
+
+
+def _shadow_crosses_np(prices, left_idx, left_price, right_idx, right_price, base_idx, upper):
+    end_idx = min(right_idx, base_idx)
+    between = prices[left_idx + 1:end_idx]
+    if len(between) == 0:
+        return np.zeros(0, dtype=bool)
+    line_prices, _ = _line_prices_np(left_idx, left_price, right_idx, right_price, end_idx)
+    if upper:
+        body_high = np.maximum(between[:, 0], between[:, 3])
+        return (line_prices >= body_high) & (line_prices <= between[:, 1])
+    body_low = np.minimum(between[:, 0], between[:, 3])
+    return (line_prices >= between[:, 2]) & (line_prices < body_low)
+
+
+def _count_crossed_np(prices, left_idx, left_price, right_idx, right_price, base_idx, upper):
+    return int(np.sum(_shadow_crosses_np(prices, left_idx, left_price, right_idx, right_price, base_idx, upper)))
+
+
+def _max_consecutive_crossed_np(prices, left_idx, left_price, right_idx, right_price, base_idx):
+    crosses = _shadow_crosses_np(prices, left_idx, left_price, right_idx, right_price, base_idx, True)
+    max_consecutive = 0
+    current_consecutive = 0
+    for cross in crosses:
+        if cross:
+            current_consecutive += 1
+            max_consecutive = max(max_consecutive, current_consecutive)
+        else:
+            current_consecutive = 0
+    return max_consecutive
+
+
+def _evaluate_lines_np(prices, right_prices, day_idx, left_prices, upper):
+    n = len(prices)
+    right_idx = n - 1
+    total_days = (right_idx - day_idx).astype(np.float64)                        # (J,)
+    slope = (right_prices[:, None] - left_prices[None, :]) / total_days[None, :]  # (R, J)
+
+    t = np.arange(n)
+    days = t[None, :] - day_idx[:, None]                                        # (J, n)
+    between = (days > 0) & (t[None, :] < right_idx)                             # (J, n)
+    line = left_prices[None, :, None] + slope[:, :, None] * days[None, :, :]    # (R, J, n)
+    extension = np.abs(slope)[:, :, None]
+
+    if upper:
+        body_high = np.maximum(prices[:, 0], prices[:, 3])
+        touches_body = line <= body_high + extension
+        in_shadow = (line >= body_high) & (line <= prices[:, 1])
+    else:
+        body_low = np.minimum(prices[:, 0], prices[:, 3])
+        touches_body = line >= body_low - extension
+        in_shadow = (line >= prices[:, 2]) & (line < body_low)
+
+    body_ok = ~np.any(touches_body & between[None, :, :], axis=2)
+    crossed = np.sum(in_shadow & between[None, :, :], axis=2)
+    return body_ok, crossed
+
+
+def _line_bounds_np(prices, upper, min_crossed):
+    # 下边界把价格取负, 统一按上边界方向计算
+    if upper:
+        edge = np.maximum(prices[..., 0], prices[..., 3])
+        end = prices[..., 1]
+    else:
+        edge = -np.minimum(prices[..., 0], prices[..., 3])
+        end = -prices[..., 2]
+    n = edge.shape[-1]
+    edge_bound = np.full(edge.shape, -np.inf)
+    shadow_bound = np.full(edge.shape, -np.inf if min_crossed > 0 else np.inf)
+    if n < 3:
+        return edge_bound, shadow_bound
+
+    # 左侧点 w 对应的区间为 w+1 .. n-2
+    edge_bound[..., :n - 2] = np.maximum.accumulate(edge[..., n - 2:0:-1], axis=-1)[..., ::-1]
+    if min_crossed > 0:
+        # 从右向左逐根插入, top 保存区间内最大的 min_crossed 个影线端点 (降序), nan 不计入
+        end = np.where(np.isnan(end), -np.inf, end)
+        top = np.full(edge.shape[:-1] + (min_crossed,), -np.inf)
+        for w in range(n - 3, -1, -1):
+            value = end[..., w + 1]
+            for i in range(min_crossed):
+                higher = np.maximum(top[..., i], value)
+                value = np.minimum(top[..., i], value)
+                top[..., i] = higher
+            shadow_bound[..., w] = top[..., min_crossed - 1]
+    return edge_bound, shadow_bound
+
+
+# ---------- numba 实现 ----------
+
+if HAVE_NUMBA:
+
+    @njit(cache=True)
+    def _crosses_body_nb(prices, left_idx, left_price, right_idx, right_price, upper):
+        daily_slope = (right_price - left_price) / (right_idx - left_idx)
+        extension = abs(daily_slope)
+        for t in range(left_idx + 1, right_idx):
+            line_price = left_price + daily_slope * (t - left_idx)
+            if upper:
+                if line_price <= max(prices[t, 0], prices[t, 3]) + extension:
+                    return False
+            elif line_price >= min(prices[t, 0], prices[t, 3]) - extension:
+                return False
+        return True
+
+    @njit(cache=True)
+    def _count_crossed_nb(prices, left_idx, left_price, right_idx, right_price, base_idx, upper):
+        daily_slope = (right_price - left_price) / (right_idx - left_idx)
+        count = 0
+        for t in range(left_idx + 1, min(right_idx, base_idx)):
+            line_price = left_price + daily_slope * (t - left_idx)
+            if upper:
+                if line_price >= max(prices[t, 0], prices[t, 3]) and line_price <= prices[t, 1]:
+                    count += 1
+            elif line_price >= prices[t, 2] and line_price < min(prices[t, 0], prices[t, 3]):
+                count += 1
+        return count
+
+    @njit(cache=True)
+    def _max_consecutive_crossed_nb(prices, left_idx, left_price, right_idx, right_price, base_idx):
+        daily_slope = (right_price - left_price) / (right_idx - left_idx)
+        max_consecutive = 0
+        current_consecutive = 0
+        for t in range(left_idx + 1, min(right_idx, base_idx)):
+            line_price = left_price + daily_slope * (t - left_idx)
+            if line_price >= max(prices[t, 0], prices[t, 3]) and line_price <= prices[t, 1]:
+                current_consecutive += 1
+                if current_consecutive > max_consecutive:
+                    max_consecutive = current_consecutive
+            else:
+                current_consecutive = 0
+        return max_consecutive
+
+    @njit(cache=True)
+    def _line_bounds_nb(prices, upper, min_crossed):
+        n = prices.shape[0]
+        edge_bound = np.full(n, -np.inf)
+        shadow_bound = np.full(n, -np.inf if min_crossed > 0 else np.inf)
+        top = np.full(max(min_crossed, 1), -np.inf)
+        running = -np.inf
+        for w in range(n - 3, -1, -1):
+            t = w + 1
+            if upper:
+                edge = max(prices[t, 0], prices[t, 3])
+                end = prices[t, 1]
+            else:
+                edge = -min(prices[t, 0], prices[t, 3])
+                end = -prices[t, 2]
+            # 与 np.maximum.accumulate 一致: 出现 nan 后界为 nan (不剪枝)
+            if running == running and not running >= edge:
+                running = edge
+            edge_bound[w] = running
+            if min_crossed > 0:
+                if end != end:
+                    end = -np.inf
+                for i in range(min_crossed):
+                    if end > top[i]:
+                        top[i], end = end, top[i]
+                shadow_bound[w] = top[min_crossed - 1]
+        return edge_bound, shadow_bound
+
+    @njit(cache=True)
+    def _evaluate_lines_nb(prices, right_prices, day_idx, left_prices, upper, alive, edge_bound, shadow_bound):
+        n = prices.shape[0]
+        right_idx = n - 1
+        R = right_prices.shape[0]
+        J = day_idx.shape[0]
+        sign = 1.0 if upper else -1.0
+        body_ok = np.ones((R, J), dtype=np.bool_)
+        crossed = np.zeros((R, J), dtype=np.int64)
+        for r in range(R):
+            for j in range(J):
+                left_idx = day_idx[j]
+                left_price = left_prices[j]
+                # 与 prune_lines 相同的剪枝条件
+                oriented_left = sign * left_price
+                oriented_right = sign * right_prices[r]
+                if (not alive[r, j]
+                        or edge_bound[left_idx] >= max(oriented_left, oriented_right)
+                        or shadow_bound[left_idx] < min(oriented_left, oriented_right)):
+                    body_ok[r, j] = False
+                    continue
+                slope = (right_prices[r] - left_price) / float(right_idx - left_idx)
+                extension = abs(slope)
+                count = 0
+                for t in range(left_idx + 1, right_idx):
+                    line_price = left_price + slope * (t - left_idx)
+                    if upper:
+                        body_high = max(prices[t, 0], prices[t, 3])
+                        if line_price <= body_high + extension:
+                            body_ok[r, j] = False
+                            break
+                        if line_price >= body_high and line_price <= prices[t, 1]:
+                            count += 1
+                    else:
+                        body_low = min(prices[t, 0], prices[t, 3])
+                        if line_price >= body_low - extension:
+                            body_ok[r, j] = False
+                            break
+                        if line_price >= prices[t, 2] and line_price < body_low:
+                            count += 1
+                crossed[r, j] = count
+        return body_ok, crossed
+
+
+# ---------- 对外接口 ----------
+
+def _as_prices(prices):
+    return np.ascontiguousarray(prices, dtype=np.float64)
+
+
+def line_crosses_body(prices, left_idx, left_price, right_idx, right_price, upper=True):
+    """
+    连线是否不穿过 (left_idx, right_idx) 之间的实体 (实体边界按斜率绝对值扩展)
+
+    Returns:
+        bool: True 表示连线在实体之外 (上边界在上方 / 下边界在下方)
+    """
+    if _backend == 'numba':
+        return bool(_crosses_body_nb(_as_prices(prices), int(left_idx), float(left_price),
+                                     int(right_idx), float(right_price), upper))
+    return _crosses_body_np(prices, left_idx, left_price, right_idx, right_price, upper)
+
+
+def count_crossed_shadows(prices, left_idx, left_price, right_idx, right_price, base_idx, upper=True):
+    """连线在 (left_idx, min(right_idx, base_idx)) 之间穿越的上影线 (upper) 或下影线数量"""
+    if _backend == 'numba':
+        return int(_count_crossed_nb(_as_prices(prices), int(left_idx), float(left_price),
+                                     int(right_idx), float(right_price), int(base_idx), upper))
+    return _count_crossed_np(prices, left_idx, left_price, right_idx, right_price, base_idx, upper)
+
+
+def max_consecutive_crossed_shadows(prices, left_idx, left_price, right_idx, right_price, base_idx):
+    """连线连续穿越上影线的最长长度 (周K使用)"""
+    if _backend == 'numba':
+        return int(_max_consecutive_crossed_nb(_as_prices(prices), int(left_idx), float(left_price),
+                                               int(right_idx), float(right_price), int(base_idx)))
+    return _max_consecutive_crossed_np(prices, left_idx, left_price, right_idx, right_price, base_idx)
+
+
+def evaluate_lines(prices, right_prices, day_idx, left_prices, upper=True, alive=None, bounds=None):
+    """
+    检查一只股票所有 (右侧点 × 左侧点) 连线, 右侧点均位于最后一根K线
+
+    Args:
+        alive (np.ndarray): (R, J) 布尔矩阵, 为 False 的连线不计算, body_ok 记为 False
+        bounds (tuple): line_bounds 的返回值, 给出时跳过 prune_lines 判定为无效的连线 (body_ok 记为 False);
+                        numba 实现在内核中逐条判断, numpy 实现只计算未被剪掉的左侧点
+
+    Returns:
+        tuple: (body_ok, crossed), 形状均为 (R, J); crossed 只在 body_ok 为 True 时有意义
+    """
+    right_prices = np.ascontiguousarray(right_prices, dtype=np.float64)
+    day_idx = np.asarray(day_idx, dtype=np.int64)
+    left_prices = np.asarray(left_prices, dtype=np.float64)
+    if _backend == 'numba':
+        n = len(prices)
+        if alive is None:
+            alive = np.ones((len(right_prices), len(day_idx)), dtype=np.bool_)
+        if bounds is None:
+            bounds = (np.full(n, -np.inf), np.full(n, np.inf))
+        return _evaluate_lines_nb(_as_prices(prices), right_prices, day_idx, left_prices, upper,
+                                  np.ascontiguousarray(alive, dtype=np.bool_), bounds[0], bounds[1])
+
+    if bounds is not None:
+        pruned = prune_lines(bounds, right_prices, day_idx, left_prices, upper)
+        alive = pruned if alive is None else alive & pruned
+    if alive is None:
+        return _evaluate_lines_np(prices, right_prices, day_idx, left_prices, upper)
+
+    # 只计算至少有一个右侧点未被剪枝的左侧点
+    body_ok = np.zeros(alive.shape, dtype=bool)
+    crossed = np.zeros(alive.shape, dtype=np.int64)
+    columns = np.flatnonzero(alive.any(axis=0))
+    if len(columns):
+        body_ok[:, columns], crossed[:, columns] = _evaluate_lines_np(
+            prices, right_prices, day_idx[columns], left_prices[columns], upper)
+        body_ok &= alive
+    return body_ok, crossed
+
+
+def line_bounds(prices, upper=True, min_crossed=0):
+    """
+    剪枝用的区间界: 右侧点位于最后一根K线 (n-1) 时, 左侧点位于 w 的连线经过 w+1 .. n-2 之间的K线
+    按上边界方向表示 (下边界把价格取负):
+        edge_bound[w]:   区间内实体边沿的最大值
+        shadow_bound[w]: 区间内影线端点的第 min_crossed 大值, 不足 min_crossed 根时为 -inf
+
+    Args:
+        prices (np.ndarray): (..., n, 4), 前面的维度可以是股票 (numba 实现只用于单只股票)
+        upper (bool): 上边界 (实体上沿/最高价) 或下边界 (实体下沿/最低价)
+        min_crossed (int): 最少穿越影线数量, 0 表示不检查穿越数量
+
+    Returns:
+        tuple: (edge_bound, shadow_bound), 形状均为 (..., n)
+    """
+    if _backend == 'numba' and np.ndim(prices) == 2:
+        return _line_bounds_nb(_as_prices(prices), upper, int(min_crossed))
+    return _line_bounds_np(np.asarray(prices, dtype=np.float64), upper, int(min_crossed))
+
+
+def prune_lines(bounds, right_prices, day_idx, left_prices, upper=True):
+    """
+    用 line_bounds 的区间界判断哪些连线可能有效, 被剪掉的连线一定不满足条件
+
+    连线在各K线上的价格 (left_price + slope * days, 与检查时的计算式相同) 不会越过左右两点价格之间的范围, 因此:
+        - 区间内有实体边沿不低于 max(左, 右) 时, 连线必然穿过该实体
+        - 区间内不低于 min(左, 右) 的影线端点少于 min_crossed 根时, 穿越影线数量必然不足
+
+    Args:
+        bounds (tuple): line_bounds 的返回值, (..., n)
+        right_prices (np.ndarray): (..., R) 右侧点价格, 右侧点均位于最后一根K线
+        day_idx, left_prices (np.ndarray): (..., J) 左侧点位置和价格
+
+    Returns:
+        np.ndarray: (..., R, J) 布尔数组, False 表示可以跳过
+    """
+    edge_bound, shadow_bound = bounds
+    sign = 1.0 if upper else -1.0
+    day_idx = np.asarray(day_idx, dtype=np.int64)
+    edge = np.take_along_axis(edge_bound, day_idx, axis=-1)[..., None, :]
+    shadow = np.take_along_axis(shadow_bound, day_idx, axis=-1)[..., None, :]
+    left = sign * np.asarray(left_prices, dtype=np.float64)[..., None, :]
+    right = sign * np.asarray(right_prices, dtype=np.float64)[..., :, None]
+    return ~((edge >= np.maximum(left, right)) | (shadow < np.minimum(left, right)))
+
+
+# ---------- 微基准测试 ----------
+
+def _random_bars(n, seed):
+    """生成随机游走的 OHLC 数据"""
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_price = close * np.exp(rng.normal(0, 0.01, n))
+    high = np.maximum(open_price, close) * (1 + np.abs(rng.normal(0, 0.015, n)))
+    low = np.minimum(open_price, close) * (1 - np.abs(rng.normal(0, 0.015, n)))
+    return np.column_stack([open_price, high, low, close])
+
+
+def benchmark(lengths=(150, 80), lines=20000, repeat=3):
+    """
+    对比 numpy 与 numba 实现的耗时
+
+    Args:
+        lengths (tuple): K线数量, 150 对应 Triangle_v2 日K窗口, 80 对应 Week_K_v2 周K窗口
+        lines (int): 每种检查调用的次数
+
+    Returns:
+        dict: {(长度, 检查): {实现: 秒}}
+    """
+    backends = ['numpy'] + (['numba'] if HAVE_NUMBA else [])
+    previous = _backend
+    results = {}
+    try:
+        for n in lengths:
+            prices = _random_bars(n, n)
+            rng = np.random.default_rng(0)
+            left = rng.integers(0, n - 8, lines)
+            left_price = prices[left, 1] * (1 + rng.random(lines) * 0.05)
+            right_price = prices[-1, 1] * (1 + rng.random(lines) * 0.05)
+            cases = {
+                'crosses_body': lambda i: line_crosses_body(prices, left[i], left_price[i], n - 1, right_price[i]),
+                'count_shadows': lambda i: count_crossed_shadows(prices, left[i], left_price[i], n - 1, right_price[i], n - 1),
+                'max_consecutive': lambda i: max_consecutive_crossed_shadows(prices, left[i], left_price[i], n - 1, right_price[i], n - 1),
+            }
+            day_idx = np.unique(left)
+            for backend in backends:
+                set_backend(backend)
+                # 预热 (numba 首次调用时编译)
+                for func in cases.values():
+                    func(0)
+                evaluate_lines(prices, right_price[:6], day_idx, prices[day_idx, 1])
+                for name, func in cases.items():
+                    best = min(_timed(lambda: [func(i) for i in range(lines)]) for _ in range(repeat))
+                    results.setdefault((n, name), {})[backend] = best
+                best = min(_timed(lambda: evaluate_lines(prices, right_price[:6], day_idx, prices[day_idx, 1]))
+                           for _ in range(repeat))
+                results.setdefault((n, 'evaluate_lines'), {})[backend] = best
+                # 含区间界计算的剪枝版本, 与不剪枝的有效连线相同
+                pruned = lambda: evaluate_lines(prices, right_price[:6], day_idx, prices[day_idx, 1],
+                                                bounds=line_bounds(prices, True, 3))
+                pruned()
+                best = min(_timed(pruned) for _ in range(repeat))
+                results.setdefault((n, 'evaluate_pruned'), {})[backend] = best
+    finally:
+        set_backend(previous)
+    return results
+
+
+def _timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    print(f"numba: {'已安装' if HAVE_NUMBA else '未安装, 仅测试 numpy 实现'}")
+    for (n, name), timings in benchmark().items():
+        line = f"{n:>4} 根K线 {name:<16}" + "".join(f" {backend}: {seconds * 1000:9.3f} ms" for backend, seconds in timings.items())
+        if 'numba' in timings:
+            line += f"  加速 {timings['numpy'] / timings['numba']:.1f}x"
+        print(line)
@@ -0,0 +1,82 @@
+"""
+连线结果记录 (Triangle_v2 / Week_K_v2 共用)
+分析过程中点和连线的位置都用K线序号 (整数) 表示, 以结构化数组保存:
+    - 检查连线时不需要把日期换算回位置
+    - 进程间传递的分析结果更小
+只在输出 (打印、画图) 时用 points_to_tuples / connections_to_dicts 换算为日期和点名称
+"""
+
+import numpy as np
+import pandas as pd
+
+# 点: K线序号、价格、点编号 (从 1 开始, 与点名称中的编号一致)
+POINT_DTYPE = np.dtype([
+    ('idx', 'i4'),
+    ('price', 'f8'),
+    ('no', 'i2'),
+])
+
+# 连线: 左侧点、右侧点和穿越影线数量
+CONNECTION_DTYPE = np.dtype([
+    ('left_idx', 'i4'),
+    ('left_price', 'f8'),
+    ('left_no', 'i2'),
+    ('right_idx', 'i4'),
+    ('right_price', 'f8'),
+    ('right_no', 'i2'),
+    ('crossed_shadows', 'i2'),
+])
+
+
+def make_points(prices, idx):
+    """
+    同一根K线上的一组点
+
+    Args:
+        prices (array-like): 点的价格, 按编号顺序
+        idx (int): K线序号
+
+    Returns:
+        np.ndarray: POINT_DTYPE 结构化数组
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    points = np.zeros(len(prices), dtype=POINT_DTYPE)
+    points['idx'] = idx
+    points['price'] = prices
+    points['no'] = np.arange(1, len(prices) + 1)
+    return points
+
+
+def make_connections(rows):
+    """
+    Args:
+        rows (list): [(left_idx, left_price, left_no, right_idx, right_price, right_no, crossed_shadows)]
+
+    Returns:
+        np.ndarray: CONNECTION_DTYPE 结构化数组
+    """
+    return np.array(rows, dtype=CONNECTION_DTYPE)
+
+
+def points_to_tuples(points, dates, prefix):
+    """转换为 [(价格, 日期, 名称)], 名称为 prefix + 编号"""
+    return [(float(point['price']), pd.Timestamp(dates[point['idx']]), f"{prefix}{point['no']}")
+            for point in points]
+
+
+def connections_to_dicts(connections, dates, left_prefix, right_prefix):
+    """
+    转换为 [{'left_point': (价格, 日期, 名称), 'right_point': (...), 'crossed_shadows': 数量}]
+
+    Args:
+        connections (np.ndarray): CONNECTION_DTYPE 结构化数组
+        dates (array-like): K线日期, 与分析时的序号对应
+        left_prefix, right_prefix (str): 左侧点、右侧点名称前缀
+    """
+    return [{
+        'left_point': (float(conn['left_price']), pd.Timestamp(dates[conn['left_idx']]),
+                       f"{left_prefix}{conn['left_no']}"),
+        'right_point': (float(conn['right_price']), pd.Timestamp(dates[conn['right_idx']]),
+                        f"{right_prefix}{conn['right_no']}"),
+        'crossed_shadows': int(conn['crossed_shadows'])
+    } for conn in connections]
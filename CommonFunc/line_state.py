@@ -0,0 +1,263 @@
+"""
+连线分析的增量状态 (QAFilter5 日K三角形 / QAFilter4 周K阻力线共用)
+每只股票保存分析窗口内的K线 (靠右对齐, 与 stack_stock_frames 的张量相同) 和上次分析的结果代码
+夜间运行时:
+    - 只读取最近几根K线合并进窗口, 不再读取整个窗口
+    - 窗口没有变化的股票 (停牌、同一天重跑) 沿用上次的结果代码
+    - 只有窗口变化的股票重新搜索以新 base day 为右侧点的连线
+连线的右侧点都在最后一根K线上, 新K线会改变所有候选连线, 因此沿用的单位是整只股票的结果, 而不是单条连线
+状态保存为 .npz 文件, 分析条件 (key) 改变时由调用方丢弃重建
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from CommonFunc.candle_features import OHLC_COLUMNS
+
+# 窗口定义
+WINDOW_DATES = 'dates'   # 全部股票最近 depth 个交易日 (Triangle_v2 DataLoader._get_all_stock_data)
+WINDOW_BARS = 'bars'     # 每只股票最近 depth 根K线 (Week_K_v2 DataLoader.get_stock_weekly_data)
+
+
+class IncrementalLineState:
+    """
+    Attributes:
+        ids (np.ndarray): 股票代码
+        ohlc (np.ndarray): (S, depth, 4) 靠右对齐的 open/high/low/close, 空缺为 NaN
+        dates (np.ndarray): (S, depth) datetime64[D], 空缺为 NaT
+        synced (np.ndarray): (S,) 每只股票的数据已完整合并到的日期
+        codes (np.ndarray): (S,) 上次分析的结果代码 (含义由调用方定义)
+        analyzed (np.ndarray): (S,) 结果代码是否对应当前窗口
+        calendar (np.ndarray): 最近 depth 个交易日 (WINDOW_DATES 使用)
+    """
+
+    def __init__(self, depth, window, key, ids=None, ohlc=None, dates=None, synced=None,
+                 codes=None, analyzed=None, calendar=None):
+        """
+        Args:
+            depth (int): 窗口长度 (天数或周数)
+            window (str): WINDOW_DATES / WINDOW_BARS
+            key (str): 分析条件 (参数、阈值等), 与本次运行不一致时状态作废
+        """
+        self.depth = int(depth)
+        self.window = window
+        self.key = key
+        self.ids = np.zeros(0, dtype='<U6') if ids is None else np.asarray(ids).astype('<U6')
+        n = len(self.ids)
+        self.ohlc = np.full((n, self.depth, 4), np.nan) if ohlc is None else ohlc
+        self.dates = (np.full((n, self.depth), np.datetime64('NaT'), dtype='datetime64[D]')
+                      if dates is None else np.asarray(dates).astype('datetime64[D]'))
+        self.synced = (np.full(n, np.datetime64('NaT'), dtype='datetime64[D]')
+                       if synced is None else np.asarray(synced).astype('datetime64[D]'))
+        self.codes = np.zeros(n, dtype=np.uint8) if codes is None else codes.astype(np.uint8)
+        self.analyzed = np.zeros(n, dtype=bool) if analyzed is None else analyzed.astype(bool)
+        self.calendar = (np.zeros(0, dtype='datetime64[D]') if calendar is None
+                         else np.asarray(calendar).astype('datetime64[D]'))
+        self._index = {code: i for i, code in enumerate(self.ids.tolist())}
+
+    # ---------- 读写 ----------
+
+    @classmethod
+    def load(cls, path):
+        """从 .npz 文件读取状态"""
+        with np.load(path, allow_pickle=False) as f:
+            return cls(int(f['depth']), str(f['window']), str(f['key']), f['ids'], f['ohlc'], f['dates'],
+                       f['synced'], f['codes'], f['analyzed'], f['calendar'])
+
+    def save(self, path):
+        """写入 .npz 文件 (先写临时文件再替换)"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, depth=np.array(self.depth), window=np.array(self.window), key=np.array(self.key),
+                 ids=self.ids, ohlc=self.ohlc, dates=self.dates, synced=self.synced, codes=self.codes,
+                 analyzed=self.analyzed, calendar=self.calendar)
+        os.replace(tmp_path, path)
+
+    # ---------- 查询 ----------
+
+    def rows(self, stock_ids):
+        """
+        Returns:
+            tuple: (在状态中的股票代码, 对应的行号), 保持输入顺序
+        """
+        found = [(code, self._index[code]) for code in stock_ids if code in self._index]
+        return [code for code, _ in found], np.array([row for _, row in found], dtype=np.int64)
+
+    def missing(self, stock_ids):
+        """返回不在状态中的股票代码, 这些股票需要用完整窗口初始化"""
+        return [code for code in stock_ids if code not in self._index]
+
+    def lengths(self, rows=None):
+        """每只股票窗口内的K线数量"""
+        dates = self.dates if rows is None else self.dates[rows]
+        return (~np.isnat(dates)).sum(axis=1).astype(np.int64)
+
+    def calendar_days(self, rows):
+        """(len(rows), depth) 每根K线距最后一根K线的自然日天数, 与 stack_stock_frames 相同"""
+        dates = self.dates[rows]
+        days = (dates[:, -1:] - dates).astype('timedelta64[D]').astype(np.int64)
+        return np.where(np.isnat(dates), 0, days)
+
+    # ---------- 更新 ----------
+
+    def add_frames(self, frames, synced_date=None):
+        """
+        用完整窗口的数据加入股票 (已存在的股票会被替换)
+
+        Args:
+            frames (dict): {stock_id: DataFrame}, 索引为日期, 包含 open/high/low/close 列
+            synced_date: 数据读取到的日期, 默认为各股票最后一根K线的日期
+        """
+        frames = {str(k).zfill(6): v for k, v in frames.items() if v is not None and len(v)}
+        new_ids = [code for code in frames if code not in self._index]
+        if new_ids:
+            n = len(new_ids)
+            self.ids = np.concatenate((self.ids, np.asarray(new_ids, dtype='<U6')))
+            self.ohlc = np.concatenate((self.ohlc, np.full((n, self.depth, 4), np.nan)))
+            self.dates = np.concatenate((self.dates, np.full((n, self.depth), np.datetime64('NaT'), dtype='datetime64[D]')))
+            self.synced = np.concatenate((self.synced, np.full(n, np.datetime64('NaT'), dtype='datetime64[D]')))
+            self.codes = np.concatenate((self.codes, np.zeros(n, dtype=np.uint8)))
+            self.analyzed = np.concatenate((self.analyzed, np.zeros(n, dtype=bool)))
+            self._index = {code: i for i, code in enumerate(self.ids.tolist())}
+
+        for code, df in frames.items():
+            row = self._index[code]
+            dates, values = _frame_arrays(df)
+            self._write_row(row, dates, values)
+            self.synced[row] = dates[-1] if synced_date is None else _to_day(synced_date)
+            self.analyzed[row] = False
+        self._extend_calendar(frames)
+        self.trim()
+
+    def update(self, frames, stock_ids, since=None):
+        """
+        合并最近几根K线: 与窗口重叠的日期以新数据为准, 之后的K线追加到窗口末尾
+
+        Args:
+            frames (dict): {stock_id: DataFrame} 最近几根K线
+            stock_ids (list): 本次读取的股票 (包括没有返回数据的股票)
+            since: 读取范围的起始日期 (所有股票相同时给出, 如最近 N 个交易日),
+                   用于判断没有返回数据的股票是否遗漏了K线
+
+        Returns:
+            tuple: (窗口发生变化的行号, 需要重新初始化的股票代码)
+                   股票不在状态中, 或与上次合并之间可能缺少K线时需要重新初始化
+        """
+        frames = {str(k).zfill(6): v for k, v in frames.items() if v is not None and len(v)}
+        since = None if since is None else _to_day(since)
+        latest = max((_frame_arrays(df)[0][-1] for df in frames.values()), default=None)
+        changed, stale = [], []
+        for code in stock_ids:
+            row = self._index.get(code)
+            if row is None:
+                stale.append(code)
+                continue
+            df = frames.get(code)
+            if df is None:
+                # 没有新数据: 读取范围之前的数据必须已经合并过
+                if since is not None and not self.synced[row] >= since:
+                    stale.append(code)
+                elif latest is not None:
+                    self.synced[row] = _later(self.synced[row], latest)
+                continue
+            dates, values = _frame_arrays(df)
+            n = int(self.lengths([row])[0])
+            last = self.dates[row, -1] if n else np.datetime64('NaT')
+            # 新数据的第一根K线必须与窗口重叠, 否则中间可能缺少K线
+            covered = since is not None and self.synced[row] >= since
+            if not (n and (dates[0] <= last or covered)):
+                stale.append(code)
+                continue
+            old_dates = self.dates[row, self.depth - n:]
+            old_values = self.ohlc[row, self.depth - n:]
+            keep = old_dates < dates[0]
+            merged_dates = np.concatenate((old_dates[keep], dates))
+            merged_values = np.concatenate((old_values[keep], values))
+            if (len(merged_dates) != n or not np.array_equal(merged_dates, old_dates)
+                    or not np.array_equal(merged_values, old_values, equal_nan=True)):
+                self._write_row(row, merged_dates, merged_values)
+                self.analyzed[row] = False
+                changed.append(row)
+            self.synced[row] = _later(self.synced[row], latest)
+        self._extend_calendar(frames)
+        changed.extend(self.trim())
+        return np.unique(np.array(changed, dtype=np.int64)), stale
+
+    def trim(self):
+        """
+        WINDOW_DATES: 去掉早于最近 depth 个交易日的K线
+
+        Returns:
+            list: 窗口发生变化的行号
+        """
+        if self.window != WINDOW_DATES or len(self.calendar) < self.depth:
+            return []
+        expired = self.dates < self.calendar[-self.depth]
+        rows = np.flatnonzero(expired.any(axis=1))
+        self.dates[expired] = np.datetime64('NaT')
+        self.ohlc[expired] = np.nan
+        self.analyzed[rows] = False
+        return rows.tolist()
+
+    def drop_expired(self):
+        """
+        WINDOW_DATES: 删除最后一次合并早于窗口起点的股票 (已无法增量更新, 下次用到时重新初始化)
+        会改变行号, 在保存前调用
+        """
+        if self.window != WINDOW_DATES or len(self.calendar) < self.depth:
+            return
+        keep = ~(self.synced < self.calendar[-self.depth])
+        if keep.all():
+            return
+        self.ids, self.ohlc, self.dates = self.ids[keep], self.ohlc[keep], self.dates[keep]
+        self.synced, self.codes, self.analyzed = self.synced[keep], self.codes[keep], self.analyzed[keep]
+        self._index = {code: i for i, code in enumerate(self.ids.tolist())}
+
+    def set_codes(self, rows, codes):
+        """保存分析结果"""
+        self.codes[rows] = codes
+        self.analyzed[rows] = True
+
+    def _write_row(self, row, dates, values):
+        """把一只股票的K线靠右写入窗口 (超出窗口的最早K线被丢弃)"""
+        dates, values = dates[-self.depth:], values[-self.depth:]
+        self.dates[row] = np.datetime64('NaT')
+        self.ohlc[row] = np.nan
+        if len(dates):
+            self.dates[row, self.depth - len(dates):] = dates
+            self.ohlc[row, self.depth - len(dates):] = values
+
+    def _extend_calendar(self, frames):
+        if self.window != WINDOW_DATES:
+            return
+        dates = [self.calendar] + [_frame_arrays(df)[0] for df in frames.values()]
+        self.calendar = np.unique(np.concatenate(dates))[-self.depth:]
+
+
+def _later(a, b):
+    """两个日期中较晚的一个, NaT 视为最早"""
+    if np.isnat(a):
+        return b
+    return a if a >= b else b
+
+
+def _to_day(value):
+    return np.datetime64(pd.Timestamp(value).date(), 'D')
+
+
+def _frame_arrays(df):
+    """DataFrame (按日期升序) → (dates datetime64[D], ohlc (n, 4))"""
+    dates = np.asarray(df.index.values).astype('datetime64[D]')
+    return dates, df[list(OHLC_COLUMNS)].to_numpy(dtype=np.float64)
+
+
+def load_line_state(path, depth, window, key):
+    """
+    读取增量状态, 文件不存在或窗口、分析条件不一致时返回 None (调用方改为全量计算并重建状态)
+    """
+    if not path or not os.path.exists(path):
+        return None
+    state = IncrementalLineState.load(path)
+    if state.depth != depth or state.window != window or state.key != key:
+        return None
+    return state
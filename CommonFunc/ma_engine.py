@@ -0,0 +1,261 @@
+"""
+批量均线计算引擎
+把所有股票的收盘价整理成 (股票 × 交易日) 的右对齐矩阵, 用累加和差分一次算出全部股票的 MA
+结果与 pandas rolling(window).mean() 一致: 窗口内数据不足或含空值时为 NaN
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+
+def build_close_matrix(data, depth, value_col='close_price'):
+    """
+    把长表 (id, date, 收盘价) 整理为右对齐的收盘价矩阵
+
+    Args:
+        data (DataFrame): 包含 id, date 和 value_col 的长表, 顺序不限
+        depth (int): 每只股票保留的最近交易日数量 (通常为最长均线周期)
+        value_col (str): 收盘价列名
+
+    Returns:
+        tuple: (ids, last_dates, matrix)
+            ids: 股票代码数组
+            last_dates: 每只股票最后一个交易日
+            matrix: shape (股票数, depth) 的 float64 矩阵, 最后一列为最新交易日, 不足部分以 NaN 填充
+    """
+    df = data[['id', 'date', value_col]].sort_values(['id', 'date'])
+    codes, ids = pd.factorize(df['id'], sort=True)
+    # 距最新交易日的位置, 0 表示最新
+    pos = df.groupby(codes).cumcount(ascending=False).values
+    keep = pos < depth
+
+    matrix = np.full((len(ids), depth), np.nan)
+    matrix[codes[keep], depth - 1 - pos[keep]] = pd.to_numeric(df[value_col], errors='coerce').values[keep]
+    last_dates = df['date'].values[pos == 0]
+    return np.asarray(ids), last_dates, matrix
+
+
+def latest_means(matrix, windows):
+    """
+    只计算最新一列的各周期均值: 从最新交易日向前做一次累加和, 各周期直接取对应位置
+
+    Returns:
+        dict: {window: ndarray(股票数)}
+    """
+    reverse = matrix[:, ::-1]
+    csum = np.cumsum(np.nan_to_num(reverse, nan=0.0), axis=1)
+    ccount = np.cumsum(~np.isnan(reverse), axis=1)
+    result = {}
+    for window in windows:
+        if window > matrix.shape[1]:
+            result[window] = np.full(matrix.shape[0], np.nan)
+            continue
+        counts = ccount[:, window - 1]
+        result[window] = np.where(counts == window, csum[:, window - 1] / window, np.nan)
+    return result
+
+
+def calculate_latest_ma(data, ma_days, value_col='close_price'):
+    """
+    计算每只股票最新交易日的 MA 值
+
+    Args:
+        data (DataFrame): 长表 (id, date, 收盘价)
+        ma_days (list): 均线周期, 例如 [7, 30, 60, 120, 250]
+
+    Returns:
+        DataFrame: date, id, MA{n}... 每只股票一行
+    """
+    if data.empty:
+        return pd.DataFrame(columns=['date', 'id', *[f'MA{ma}' for ma in ma_days]])
+    ids, last_dates, matrix = build_close_matrix(data, max(ma_days), value_col)
+    means = latest_means(matrix, ma_days)
+    return pd.DataFrame({
+        'date': last_dates,
+        'id': ids,
+        **{f'MA{ma}': means[ma] for ma in ma_days}
+    })
+
+
+def trim_to_depth(data, depth):
+    """只保留每只股票最近 depth 个交易日, 用于分批读取时控制内存"""
+    data = data.sort_values(['id', 'date'])
+    return data[data.groupby('id').cumcount(ascending=False) < depth]
+
+
+class IncrementalMAState:
+    """
+    增量均线状态: 每只股票保存最近 max(windows) 个收盘价的环形缓冲区, 以及每个周期的窗口累加和与有效个数
+    每个新交易日只需 O(1) 更新每只股票每个周期的 MA, 不再依赖完整历史
+    状态保存为 .npz 文件, 由 AK006 增量模式读写
+    """
+
+    # 累加和每更新多少个交易日按缓冲区重新校准一次, 消除浮点累计误差
+    RESYNC_DAYS = 250
+
+    def __init__(self, windows, ids, buffer, head, last_dates, updates=0):
+        """
+        Args:
+            windows (list): 均线周期
+            ids (ndarray): 股票代码 (升序)
+            buffer (ndarray): shape (股票数, max(windows)) 的环形缓冲区
+            head (ndarray): 每只股票下一次写入的位置
+            last_dates (ndarray): 每只股票最后一个交易日 (datetime64[D])
+            updates (int): 自上次校准以来的更新次数
+        """
+        self.windows = [int(w) for w in windows]
+        self.depth = max(self.windows)
+        self.ids = np.asarray(ids).astype('<U6')
+        self.buffer = buffer
+        self.head = head.astype(np.int64)
+        self.last_dates = np.asarray(last_dates).astype('datetime64[D]')
+        self.updates = updates
+        self._index = {code: i for i, code in enumerate(self.ids)}
+        self.resync()
+
+    @classmethod
+    def from_history(cls, data, windows, value_col='close_price'):
+        """用历史数据 (id, date, 收盘价) 初始化状态"""
+        depth = max(windows)
+        ids, last_dates, matrix = build_close_matrix(data, depth, value_col)
+        # 右对齐矩阵即 head = 0 的环形缓冲区
+        head = np.zeros(len(ids), dtype=np.int64)
+        return cls(windows, ids, matrix, head, last_dates)
+
+    @classmethod
+    def load(cls, path):
+        """从 .npz 文件读取状态"""
+        with np.load(path, allow_pickle=False) as f:
+            return cls(f['windows'], f['ids'], f['buffer'], f['head'], f['last_dates'], int(f['updates']))
+
+    def save(self, path):
+        """写入 .npz 文件 (先写临时文件再替换)"""
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, windows=np.array(self.windows), ids=self.ids, buffer=self.buffer,
+                 head=self.head, last_dates=self.last_dates, updates=np.array(self.updates))
+        os.replace(tmp_path, path)
+
+    @property
+    def last_date(self):
+        """状态中最新的交易日"""
+        return self.last_dates.max() if len(self.last_dates) else None
+
+    def resync(self):
+        """按缓冲区重新计算各周期的累加和与有效个数"""
+        n = len(self.ids)
+        # 按时间从新到旧排列缓冲区: 第 k 列为倒数第 k+1 个收盘价
+        order = (self.head[:, None] - 1 - np.arange(self.depth)[None, :]) % self.depth
+        recent = self.buffer[np.arange(n)[:, None], order]
+        csum = np.cumsum(np.nan_to_num(recent, nan=0.0), axis=1)
+        ccount = np.cumsum(~np.isnan(recent), axis=1)
+        self.sums = {w: csum[:, w - 1].copy() for w in self.windows}
+        self.counts = {w: ccount[:, w - 1].copy() for w in self.windows}
+        self.updates = 0
+
+    def missing(self, stock_ids):
+        """返回不在状态中的股票代码, 这些股票需要用历史数据初始化"""
+        return [code for code in stock_ids if code not in self._index]
+
+    def stale(self, stock_ids, prev_date):
+        """
+        返回状态中最后交易日早于 prev_date (上一个交易日) 的股票代码
+        这些股票有交易日没有写入缓冲区 (例如当天不在股票列表中), 需要用历史数据重新初始化
+        """
+        prev_date = np.datetime64(pd.Timestamp(prev_date).date(), 'D')
+        return [code for code in stock_ids if code in self._index and self.last_dates[self._index[code]] < prev_date]
+
+    def add_history(self, data, value_col='close_price', as_of=None):
+        """
+        用历史数据加入新股票 (已存在的股票会被替换)
+
+        Args:
+            as_of: 历史数据已完整读取到该交易日; 停牌股票的最后交易日早于该日, 记为 as_of 以免被当作 stale
+        """
+        ids, last_dates, matrix = build_close_matrix(data, self.depth, value_col)
+        last_dates = np.asarray(last_dates).astype('datetime64[D]')
+        if as_of is not None:
+            last_dates = np.maximum(last_dates, np.datetime64(pd.Timestamp(as_of).date(), 'D'))
+        keep = ~np.isin(self.ids, ids)
+        all_ids = np.concatenate((self.ids[keep], ids))
+        order = np.argsort(all_ids, kind='stable')
+        self.ids = all_ids[order]
+        self.buffer = np.concatenate((self.buffer[keep], matrix))[order]
+        self.head = np.concatenate((self.head[keep], np.zeros(len(ids), dtype=np.int64)))[order]
+        self.last_dates = np.concatenate((self.last_dates[keep], last_dates))[order]
+        self._index = {code: i for i, code in enumerate(self.ids)}
+        self.resync()
+
+    def update(self, trade_date, stock_ids, closes, prev_date=None):
+        """
+        追加一个交易日的收盘价
+
+        同一交易日重复执行时替换当日收盘价, 早于状态最后交易日的数据会被忽略
+
+        Args:
+            trade_date: 交易日
+            stock_ids (list): 股票代码 (必须已在状态中)
+            closes (array): 对应的收盘价
+            prev_date: 上一个交易日; 指定时检查每只股票, 缓冲区缺少交易日 (stale) 的股票不能直接追加
+
+        Returns:
+            ndarray: 本次更新的股票在状态中的行号
+        """
+        date = np.datetime64(pd.Timestamp(trade_date).date(), 'D')
+        rows = np.array([self._index[code] for code in stock_ids], dtype=np.int64)
+        closes = np.asarray(closes, dtype=np.float64)
+
+        same_day = self.last_dates[rows] == date
+        new_day = self.last_dates[rows] < date
+        if prev_date is not None:
+            stale = new_day & (self.last_dates[rows] < np.datetime64(pd.Timestamp(prev_date).date(), 'D'))
+            if stale.any():
+                raise ValueError(f"{int(stale.sum())} 支股票的增量状态缺少交易日, 需先用历史数据重新初始化: "
+                                 f"{', '.join(self.ids[rows[stale]][:10])}")
+
+        # 同一交易日重跑: 最新值被替换
+        r, x = rows[same_day], closes[same_day]
+        latest = (self.head[r] - 1) % self.depth
+        self._replace(r, latest, x)
+
+        # 新交易日: 写入 head 位置, 各周期移出最旧的值
+        r, x = rows[new_day], closes[new_day]
+        slot = self.head[r]
+        for w in self.windows:
+            leaving = self.buffer[r, (slot - w) % self.depth]
+            self.sums[w][r] += np.nan_to_num(x, nan=0.0) - np.nan_to_num(leaving, nan=0.0)
+            self.counts[w][r] += (~np.isnan(x)).astype(np.int64) - (~np.isnan(leaving)).astype(np.int64)
+        self.buffer[r, slot] = x
+        self.head[r] = (slot + 1) % self.depth
+        self.last_dates[r] = date
+
+        self.updates += 1
+        if self.updates >= self.RESYNC_DAYS:
+            self.resync()
+        return rows[same_day | new_day]
+
+    def _replace(self, rows, slots, values):
+        """替换缓冲区中的最新值, 同步修正所有周期的累加和"""
+        old = self.buffer[rows, slots]
+        for w in self.windows:
+            self.sums[w][rows] += np.nan_to_num(values, nan=0.0) - np.nan_to_num(old, nan=0.0)
+            self.counts[w][rows] += (~np.isnan(values)).astype(np.int64) - (~np.isnan(old)).astype(np.int64)
+        self.buffer[rows, slots] = values
+
+    def latest_ma(self, rows=None):
+        """
+        返回最新交易日的 MA 值
+
+        Args:
+            rows (ndarray): 只返回这些行, 默认全部
+
+        Returns:
+            DataFrame: date, id, MA{n}...
+        """
+        rows = np.arange(len(self.ids)) if rows is None else rows
+        return pd.DataFrame({
+            'date': self.last_dates[rows],
+            'id': self.ids[rows],
+            **{f'MA{w}': np.where(self.counts[w][rows] == w, self.sums[w][rows] / w, np.nan)
+               for w in self.windows}
+        })
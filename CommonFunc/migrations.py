@@ -0,0 +1,201 @@
+"""
+数据库结构迁移
+每个迁移有一个版本号, 执行前先检查线上表结构, 已满足时只记录不重复执行
+已执行的迁移记录在 schema_migrations 表中
+用法: python -m CommonFunc.migrations [QA|PROD] [--dry-run] [--status]
+按年分区为可选项, 需在配置文件 Migrations.partition_main_table 中开启
+"""
+
+import sys
+from datetime import datetime
+from CommonFunc.DBconnection import find_config_path, load_config, db_con_pymysql, set_log
+
+MIGRATION_TABLE = "schema_migrations"
+
+
+# ---------- 线上表结构检查 ----------
+
+def get_index_columns(cursor, table):
+    """返回 {索引名: [列名...]}"""
+    cursor.execute("""
+        SELECT INDEX_NAME, COLUMN_NAME
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """, (table,))
+    indexes = {}
+    for row in cursor.fetchall():
+        indexes.setdefault(row['INDEX_NAME'], []).append(row['COLUMN_NAME'].lower())
+    return indexes
+
+
+def has_index_prefix(cursor, table, columns):
+    """是否已有以 columns 为前缀的索引 (包括主键)"""
+    columns = [c.lower() for c in columns]
+    return any(cols[:len(columns)] == columns for cols in get_index_columns(cursor, table).values())
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("""
+        SELECT COUNT(*) AS cnt
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+    """, (table,))
+    return cursor.fetchone()['cnt'] > 0
+
+
+# ---------- 迁移定义 ----------
+
+class Migration:
+    """单个迁移: check 返回 True 表示线上结构已满足"""
+
+    def __init__(self, version, description, check, apply, enabled=None):
+        self.version = version
+        self.description = description
+        self.check = check
+        self.apply = apply
+        self.enabled = enabled or (lambda config: True)
+
+
+def _add_index(table_key, name, columns):
+    def check(cursor, config):
+        return has_index_prefix(cursor, config['DB_tables'][table_key], columns)
+
+    def apply(cursor, config):
+        cursor.execute(f"ALTER TABLE {config['DB_tables'][table_key]} ADD INDEX {name} ({', '.join(columns)})")
+    return check, apply
+
+
+def _check_year_partitions(cursor, config):
+    return is_partitioned(cursor, config['DB_tables']['main_query_table'])
+
+
+def _apply_year_partitions(cursor, config):
+    """按 date 的年份做 RANGE 分区, 从最早数据年份到下一年, 另加 MAXVALUE 分区"""
+    table = config['DB_tables']['main_query_table']
+    cursor.execute(f"SELECT MIN(YEAR(date)) AS first_year FROM {table}")
+    first_year = cursor.fetchone()['first_year'] or datetime.now().year
+    last_year = datetime.now().year + 1
+    partitions = [f"PARTITION p{year} VALUES LESS THAN ({year + 1})" for year in range(first_year, last_year + 1)]
+    partitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    cursor.execute(f"ALTER TABLE {table} PARTITION BY RANGE (YEAR(date)) ({', '.join(partitions)})")
+
+
+MIGRATIONS = [
+    Migration("001", "StockMain (id, date) 索引", *_add_index('main_query_table', 'idx_id_date', ['id', 'date'])),
+    Migration("002", "StockMain (date, Latest) 索引", *_add_index('main_query_table', 'idx_date_latest', ['date', 'Latest'])),
+    Migration("003", "MA (id, date) 索引", *_add_index('ma_table_name', 'idx_id_date', ['id', 'date'])),
+    Migration("004", "StockMain 按年 RANGE 分区", _check_year_partitions, _apply_year_partitions,
+              enabled=lambda config: config.get('Migrations', {}).get('partition_main_table', False)),
+    Migration("005", "Gap (filled, id) 索引", *_add_index('gap_table', 'idx_filled_id', ['filled', 'id'])),
+]
+
+
+# ---------- 执行 ----------
+
+def ensure_migration_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MIGRATION_TABLE} (
+            version varchar(10) NOT NULL,
+            description varchar(100) DEFAULT NULL,
+            applied_at datetime NOT NULL,
+            skipped tinyint NOT NULL DEFAULT 0 COMMENT '1: 执行前线上结构已满足',
+            PRIMARY KEY (version)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+
+
+def applied_versions(cursor):
+    cursor.execute(f"SELECT version FROM {MIGRATION_TABLE}")
+    return {row['version'] for row in cursor.fetchall()}
+
+
+def record(cursor, migration, skipped):
+    cursor.execute(
+        f"INSERT INTO {MIGRATION_TABLE} (version, description, applied_at, skipped) VALUES (%s, %s, %s, %s)",
+        (migration.version, migration.description, datetime.now(), int(skipped))
+    )
+
+
+def _with_table_names(config):
+    """迁移中使用的表名, MA 表名在 MA_config 中"""
+    config = dict(config)
+    config['DB_tables'] = dict(config['DB_tables'], ma_table_name=config['MA_config']['ma_table'])
+    return config
+
+
+def migrate(config, logger, dry_run=False):
+    """
+    执行所有未记录的迁移
+
+    Returns:
+        list: [(version, 结果)], 结果为 applied / skipped / pending (dry run) / disabled
+    """
+    config = _with_table_names(config)
+    results = []
+    connection = db_con_pymysql(config)
+    try:
+        with connection.cursor() as cursor:
+            ensure_migration_table(cursor)
+            done = applied_versions(cursor)
+            for migration in MIGRATIONS:
+                if migration.version in done:
+                    continue
+                if not migration.enabled(config):
+                    results.append((migration.version, "disabled"))
+                    continue
+                if migration.check(cursor, config):
+                    logger.info_print(f"{migration.version} {migration.description}: 线上结构已满足, 仅记录")
+                    if not dry_run:
+                        record(cursor, migration, skipped=True)
+                        connection.commit()
+                    results.append((migration.version, "skipped"))
+                    continue
+                if dry_run:
+                    logger.info_print(f"{migration.version} {migration.description}: 待执行")
+                    results.append((migration.version, "pending"))
+                    continue
+                logger.info_print(f"{migration.version} {migration.description}: 执行中...")
+                migration.apply(cursor, config)
+                record(cursor, migration, skipped=False)
+                connection.commit()
+                results.append((migration.version, "applied"))
+                logger.info_print(f"{migration.version} {migration.description}: 完成")
+        return results
+    finally:
+        connection.close()
+
+
+def show_status(config, logger):
+    """列出迁移记录"""
+    connection = db_con_pymysql(config)
+    try:
+        with connection.cursor() as cursor:
+            ensure_migration_table(cursor)
+            cursor.execute(f"SELECT version, description, applied_at, skipped FROM {MIGRATION_TABLE} ORDER BY version")
+            rows = {row['version']: row for row in cursor.fetchall()}
+        for migration in MIGRATIONS:
+            row = rows.get(migration.version)
+            state = "未执行" if row is None else f"{row['applied_at']}{' (已满足, 跳过)' if row['skipped'] else ''}"
+            logger.info_print(f"{migration.version} {migration.description}: {state}")
+    finally:
+        connection.close()
+
+
+def main():
+    args = sys.argv[1:]
+    env = "QA" if "QA" in args else "PROD"
+    config_path_QA, config_path_PROD, _ = find_config_path()
+    config = load_config(config_path_QA if env == "QA" else config_path_PROD)
+    logger = set_log(config, "migrations.log", prefix=env)
+    if "--status" in args:
+        show_status(config, logger)
+    else:
+        migrate(config, logger, dry_run="--dry-run" in args)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"处理失败：{str(e)}")
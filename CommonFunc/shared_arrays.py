@@ -0,0 +1,92 @@
+"""
+进程间共享的 numpy 数组
+多个数组按偏移量依次放进同一块 multiprocessing.shared_memory, 偏移量索引 (spec) 只有几百字节,
+子进程根据 spec 映射出同样的数组, 不需要 pickle 数据本身
+    SharedArrays(arrays):  主进程创建共享内存并复制数据, 用完后 close() 释放
+    attach_arrays(spec):   子进程映射共享内存, 返回 (SharedMemory, {名称: 数组})
+    work_units(total, n):  把共享数组的行切分为交给子进程的 (start, stop) 区间
+子进程只读, 不要修改映射出的数组
+"""
+
+from multiprocessing import shared_memory
+import numpy as np
+
+# 每个数组的起始位置按 64 字节对齐
+ALIGNMENT = 64
+# 工作单元的最小行数 (股票数)
+MIN_WORK_UNIT = 16
+
+
+class SharedArrays:
+    """主进程持有的一块共享内存"""
+
+    def __init__(self, arrays):
+        """
+        Args:
+            arrays (dict): {名称: np.ndarray}, 只支持数值/布尔类型
+        """
+        layout = {}
+        offset = 0
+        for name, array in arrays.items():
+            array = np.asarray(array)
+            if array.dtype.hasobject:
+                raise TypeError(f"数组 {name} 为 object 类型, 不能放入共享内存")
+            layout[name] = (offset, array.shape, array.dtype.str)
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        self.arrays = _map_arrays(self._shm, layout)
+        for name, array in arrays.items():
+            self.arrays[name][...] = array
+        self.spec = {"name": self._shm.name, "layout": layout}
+
+    def close(self):
+        """释放共享内存 (子进程结束后调用)"""
+        if self._shm is None:
+            return
+        self.arrays = {}
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _map_arrays(shm, layout):
+    return {
+        name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        for name, (offset, shape, dtype) in layout.items()
+    }
+
+
+def attach_arrays(spec):
+    """
+    子进程中映射主进程创建的共享内存
+
+    Returns:
+        tuple: (SharedMemory, {名称: np.ndarray}), SharedMemory 需在数组不再使用后 close()
+    """
+    shm = shared_memory.SharedMemory(name=spec["name"])
+    return shm, _map_arrays(shm, spec["layout"])
+
+
+def work_units(total, max_workers, min_size=MIN_WORK_UNIT):
+    """
+    把 [0, total) 切分为逐渐变小的行号区间: 前面的单元大, 减少调度次数;
+    后面的单元小, 各进程在结束时的负载更均衡. 任何输入都不会产生空区间
+
+    Returns:
+        list: [(start, stop)]
+    """
+    units = []
+    start = 0
+    while start < total:
+        size = max(min_size, -(-(total - start) // (2 * max(1, max_workers))))
+        stop = min(total, start + size)
+        units.append((start, stop))
+        start = stop
+    return units
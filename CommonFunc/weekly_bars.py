@@ -0,0 +1,264 @@
+"""
+当前周周K的增量维护 (AK008 / QA008 共用)
+周K表中本周的行即为本周的运行状态: 开盘价取本周第一根日K, 最高/最低价为运行中的最大/最小值, 收盘价为最新日K (停牌日价格为空, 跳过)
+每天只读取当日日K把它并入本周的行, 再用一条批量 UPSERT 写回:
+    - 行的 WK_date 为上一个交易日 (上次正常运行) 或当日 (同一天重跑) 时直接合并
+    - 本周第一个交易日没有行的股票从空行开始合并
+    - 其余股票 (漏跑、新股、手工修改过的行) 读取本周全部日K重新汇总, 与原全量算法相同
+涨跌幅相对上周最后一个交易日的收盘价
+"""
+
+import datetime
+import numpy as np
+import pandas as pd
+import chinese_calendar as cc
+from CommonFunc.bulk_insert import bulk_insert_df
+
+# 周K表的列及 UPSERT 时更新的列
+WK_COLUMNS = ['id', 'wkn', 'WK_date', 'open', 'close', 'high', 'low', 'chg_percen', 'update_time', 'status']
+WK_UPDATE_COLUMNS = WK_COLUMNS[2:]
+PRICE_COLUMNS = ['open', 'close', 'high', 'low']
+
+
+def is_trade_day(day):
+    """A股交易日: 法定工作日中的周一至周五 (调休的周末不开市)"""
+    return day.weekday() < 5 and cc.is_workday(day)
+
+
+def week_trade_days(trade_date):
+    """trade_date 所在周 (周一至周日) 的交易日列表"""
+    day = pd.Timestamp(trade_date).date()
+    monday = day - datetime.timedelta(days=day.weekday())
+    days = [monday + datetime.timedelta(days=i) for i in range(5)]
+    return [d for d in days if is_trade_day(d)]
+
+
+def last_trade_day_before(day, max_days=30):
+    """day 之前 (不含) 的最后一个交易日"""
+    day = pd.Timestamp(day).date()
+    for i in range(1, max_days + 1):
+        check_date = day - datetime.timedelta(days=i)
+        if is_trade_day(check_date):
+            return check_date
+    return None
+
+
+def aggregate_week(bars):
+    """
+    把本周日K汇总为周K: 开盘价取第一个非空开盘价, 收盘价取最后一个非空收盘价, 最高/最低价取最大/最小值
+    停牌日 (价格为空) 被跳过, 与 fold_day 逐日合并的结果相同
+
+    Args:
+        bars (pd.DataFrame): id, date, open, close, high, low
+
+    Returns:
+        pd.DataFrame: 以 id 为索引的 open, close, high, low
+    """
+    if bars.empty:
+        return pd.DataFrame(columns=PRICE_COLUMNS, index=pd.Index([], name='id'), dtype=float)
+    bars = bars.sort_values(['id', 'date'], kind='stable')
+    grouped = bars.groupby('id', sort=True)
+    return pd.DataFrame({
+        'open': grouped['open'].first(),
+        'close': grouped['close'].last(),
+        'high': grouped['high'].max(),
+        'low': grouped['low'].min(),
+    }).astype(float)
+
+
+def resample_weekly(bars, week_label=None):
+    """
+    把全部股票的日K一次性重组为周K (Ini_WK_ReAsb 初始化周K表)
+    周的边界按日历: 同一 ISO 周 (周一至周日) 内的交易日为一根周K, 节假日自然不在日K中;
+    WK_date 为该周最后一个交易日, 涨跌幅相对同一股票上一根周K的收盘价 (第一根为 NaN)
+    开盘价或收盘价为空的停牌日不参与重组, 整周停牌的股票没有这一周的周K (与 API 周K相同)
+
+    Args:
+        bars (pd.DataFrame): id, date, open, close, high, low
+        week_label (callable): 周一日期 → 周数, 默认与 convert_date_to_week 相同的 'YYWww'
+
+    Returns:
+        pd.DataFrame: id, wkn, WK_date, open, close, high, low, chg_percen, 按 id、WK_date 排序
+    """
+    columns = ['id', 'wkn', 'WK_date'] + PRICE_COLUMNS + ['chg_percen']
+    if bars.empty:
+        return pd.DataFrame(columns=columns)
+    bars = bars.dropna(subset=['open', 'close'])
+    if bars.empty:
+        return pd.DataFrame(columns=columns)
+    bars = bars.sort_values(['id', 'date'], kind='stable').reset_index(drop=True)
+    ids = bars['id'].values
+    dates = pd.to_datetime(bars['date']).values.astype('datetime64[D]')
+    # 1970-01-01 是周四, 加 3 天后按 7 天取整即为所在周的周一
+    mondays = ((dates.astype(np.int64) + 3) // 7 * 7 - 3).astype('datetime64[D]')
+
+    # 股票或周变化处为每根周K的开始行
+    new_week = np.ones(len(bars), dtype=bool)
+    new_week[1:] = (ids[1:] != ids[:-1]) | (mondays[1:] != mondays[:-1])
+    starts = np.flatnonzero(new_week)
+    ends = np.append(starts[1:], len(bars)) - 1
+
+    prices = {c: bars[c].to_numpy(dtype=np.float64) for c in PRICE_COLUMNS}
+    close = prices['close'][ends]
+    prev_close = np.concatenate([[np.nan], close[:-1]])
+    prev_close[np.flatnonzero(ids[starts][1:] != ids[starts][:-1]) + 1] = np.nan
+
+    week_mondays = mondays[starts]
+    if week_label is None:
+        week_label = lambda monday: f"{str(monday.isocalendar()[0])[2:]}W{monday.isocalendar()[1]:02d}"
+    # 周数只对不同的周计算一次
+    unique_mondays, inverse = np.unique(week_mondays, return_inverse=True)
+    labels = np.array([week_label(pd.Timestamp(m).date()) for m in unique_mondays], dtype=object)
+
+    return pd.DataFrame({
+        'id': ids[starts],
+        'wkn': labels[inverse],
+        'WK_date': dates[ends],
+        'open': prices['open'][starts],
+        'close': close,
+        'high': np.fmax.reduceat(prices['high'], starts),
+        'low': np.fmin.reduceat(prices['low'], starts),
+        'chg_percen': (close - prev_close) / prev_close * 100,
+    })[columns]
+
+
+def fold_day(week, day):
+    """
+    把当日日K并入本周运行中的周K
+
+    Args:
+        week (pd.DataFrame): 以 id 为索引的 open, close, high, low (截至上一交易日, 没有数据为 NaN)
+        day (pd.DataFrame): 以 id 为索引的当日 open, close, high, low
+
+    Returns:
+        pd.DataFrame: 以 id 为索引, 包含两者全部股票; 当日没有数据的股票保持不变
+    """
+    result = week.reindex(week.index.union(day.index)).astype(float)
+    day = day.reindex(result.index).astype(float)
+    result['open'] = result['open'].fillna(day['open'])
+    result['close'] = day['close'].fillna(result['close'])
+    result['high'] = np.fmax(result['high'].values, day['high'].values)
+    result['low'] = np.fmin(result['low'].values, day['low'].values)
+    return result
+
+
+class WeeklyBarUpdater:
+    """从日K增量维护当前周周K"""
+
+    def __init__(self, config, connection, logger, store=None):
+        """
+        Args:
+            config (dict): 配置
+            connection: pymysql 连接 (DictCursor)
+            logger: 日志对象
+            store: BarStore, 可用时从本地存储读取日K, 否则查询主表
+        """
+        self.config = config
+        self.connection = connection
+        self.logger = logger
+        self.store = store
+        self.wk_table = config['DB_tables']['WK_table']
+        self.main_table = config['DB_tables']['main_query_table']
+
+    # ---------- 读取 ----------
+
+    def _query(self, sql, params):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return pd.DataFrame(cursor.fetchall())
+
+    def load_week_rows(self, wkn, stock_list):
+        """本周已有的周K行, 以 id 为索引的 WK_date 和价格列"""
+        df = self._query(f"SELECT id, WK_date, open, close, high, low FROM {self.wk_table} WHERE wkn = %s", (wkn,))
+        if df.empty:
+            return pd.DataFrame(columns=['WK_date'] + PRICE_COLUMNS, index=pd.Index([], name='id'))
+        df = df[df['id'].isin(stock_list)].set_index('id')
+        df['WK_date'] = pd.to_datetime(df['WK_date'])
+        df[PRICE_COLUMNS] = df[PRICE_COLUMNS].astype(float)
+        return df
+
+    def load_bars(self, stock_ids, start_date, end_date, columns=PRICE_COLUMNS):
+        """日K长表 (id, date, 列...), 列名使用存储中的 open/close/high/low"""
+        if self.store is not None:
+            return self.store.to_frame(stock_ids, start_date, end_date, tuple(columns))
+        select = ", ".join({'open': 'open_price AS open', 'close': 'close_price AS close'}.get(c, c) for c in columns)
+        df = self._query(f"""
+            SELECT id, date, {select} FROM {self.main_table}
+            WHERE date >= %s AND date <= %s AND Latest = 1
+        """, (pd.Timestamp(start_date).date(), pd.Timestamp(end_date).date()))
+        if df.empty:
+            return pd.DataFrame(columns=['id', 'date'] + list(columns))
+        df = df[df['id'].isin(stock_ids)]
+        df[list(columns)] = df[list(columns)].astype(float)
+        return df
+
+    # ---------- 更新 ----------
+
+    def update(self, trade_date, wkn, stock_list, debug=False):
+        """
+        把 trade_date 的日K并入本周周K并写回周K表 (不提交事务, 由调用方 commit)
+
+        Args:
+            trade_date: 日K数据所在交易日
+            wkn (str): trade_date 所在周的周数 (convert_date_to_week)
+            stock_list (list): 股票代码
+
+        Returns:
+            dict: folded (直接合并) / rebuilt (重新汇总) / active / st 的股票数量
+        """
+        trade_day = pd.Timestamp(trade_date).normalize()
+        week_days = [pd.Timestamp(d) for d in week_trade_days(trade_day)]
+        prev_days = [d for d in week_days if d < trade_day]
+        prev_day = prev_days[-1] if prev_days else None
+        week_start = week_days[0] if week_days else trade_day
+        stock_index = pd.Index(sorted(set(stock_list)), name='id')
+
+        rows = self.load_week_rows(wkn, stock_list)
+        in_sync = rows['WK_date'].isin([trade_day] + ([prev_day] if prev_day is not None else []))
+        # 本周第一个交易日没有行的股票, 运行状态为空
+        missing = stock_index.difference(rows.index)
+        synced_ids = rows.index[in_sync.values]
+        if prev_day is None:
+            synced_ids = synced_ids.union(missing)
+        stale_ids = stock_index.difference(synced_ids)
+
+        day = self.load_bars(list(synced_ids), trade_day, trade_day).set_index('id')[PRICE_COLUMNS]
+        running = rows.loc[rows.index.intersection(synced_ids), PRICE_COLUMNS].reindex(synced_ids)
+        folded = fold_day(running, day).reindex(synced_ids)
+        rebuilt = aggregate_week(self.load_bars(list(stale_ids), week_start, trade_day)) if len(stale_ids) else None
+        week = pd.concat([folded, rebuilt]) if rebuilt is not None else folded
+        week = week.reindex(stock_index)
+
+        # 涨跌幅相对上周最后一个交易日的收盘价
+        last_week_day = last_trade_day_before(week_start)
+        prev_close = pd.Series(np.nan, index=stock_index)
+        if last_week_day is not None:
+            closes = self.load_bars(list(stock_index), last_week_day, last_week_day, ['close']).set_index('id')['close']
+            prev_close = closes.reindex(stock_index).astype(float)
+        chg_percen = (week['close'] - prev_close) / prev_close * 100
+
+        if debug:
+            self.logger.info_print(f"{trade_day.date()} ({wkn}): 直接合并 {len(synced_ids)} 只, "
+                                   f"重新汇总 {len(stale_ids)} 只, 当日日K {len(day)} 条")
+
+        result = pd.DataFrame({
+            'id': stock_index,
+            'wkn': wkn,
+            'WK_date': trade_day.date(),
+            'open': week['open'].values,
+            'close': week['close'].values,
+            'high': week['high'].values,
+            'low': week['low'].values,
+            'chg_percen': chg_percen.values,
+            'update_time': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'status': np.where(week['open'].isna().values, 'st', 'active'),
+        })[WK_COLUMNS]
+        bulk_insert_df(self.connection, self.wk_table, result, self.config,
+                       update_columns=WK_UPDATE_COLUMNS, logger=self.logger)
+        active = int((result['status'] == 'active').sum())
+        return {
+            'folded': len(synced_ids),
+            'rebuilt': len(stale_ids),
+            'active': active,
+            'st': len(result) - active,
+        }
@@ -16,6 +16,7 @@ from CommonFunc.DBconnection import (
     set_log,
     find_config_path
 )
+from CommonFunc.bulk_insert import bulk_insert, get_bulk_options
 
 
 def fetch_stock_data():
@@ -45,28 +46,37 @@ def insert_data_to_mysql(data, table_name, config, logger):
     connection = db_con_pymysql(config)
     
     try:
-        with connection.cursor() as cursor:
-            insert_query = """
-            INSERT INTO {table} (
-                ord, Id, nname, newprice, chg_percen, chg_amount,
-                volume, turnover, amplitude, high, low, opentoday, closeyesterday, volume_ratio,
-                turnover_rate, pe_ratio, pb_ratio, market_cap, circulating_market_cap,
-                change_speed, change_5min, change_60d, change_ytd, insrt_time
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-            """.format(table=table_name)
-            
-            for idx, row in data.iterrows():
-                cursor.execute(insert_query, (
-                    idx, row['代码'], row['名称'], row['最新价'], row['涨跌幅'], row['涨跌额'],
-                    row['成交量'], row['成交额'], row['振幅'], row['最高'], row['最低'],
-                    row['今开'], row['昨收'], row['量比'], row['换手率'], row['市盈率-动态'],
-                    row['市净率'], row['总市值'], row['流通市值'], row['涨速'], row['5分钟涨跌'],
-                    row['60日涨跌幅'], row['年初至今涨跌幅']
-                ))
-            connection.commit()
-            log_message = f"PROD: 数据已成功插入到 {table_name} 表中。"
-            logger.info(log_message)
-            print(log_message)
+        method, chunk_size = get_bulk_options(config)
+        bulk_insert(connection, table_name, {
+            'ord': data.index.values,
+            'Id': data['代码'].values,
+            'nname': data['名称'].values,
+            'newprice': data['最新价'].values,
+            'chg_percen': data['涨跌幅'].values,
+            'chg_amount': data['涨跌额'].values,
+            'volume': data['成交量'].values,
+            'turnover': data['成交额'].values,
+            'amplitude': data['振幅'].values,
+            'high': data['最高'].values,
+            'low': data['最低'].values,
+            'opentoday': data['今开'].values,
+            'closeyesterday': data['昨收'].values,
+            'volume_ratio': data['量比'].values,
+            'turnover_rate': data['换手率'].values,
+            'pe_ratio': data['市盈率-动态'].values,
+            'pb_ratio': data['市净率'].values,
+            'market_cap': data['总市值'].values,
+            'circulating_market_cap': data['流通市值'].values,
+            'change_speed': data['涨速'].values,
+            'change_5min': data['5分钟涨跌'].values,
+            'change_60d': data['60日涨跌幅'].values,
+            'change_ytd': data['年初至今涨跌幅'].values,
+            'insrt_time': datetime.now()
+        }, method, chunk_size, logger=logger)
+        connection.commit()
+        log_message = f"PROD: 数据已成功插入到 {table_name} 表中。"
+        logger.info(log_message)
+        print(log_message)
             
     except Exception as e:
         error_message = f"PROD: 插入数据时出错: {str(e)}"
@@ -1,5 +1,8 @@
 '''
 本程序将数据库中的日表数据写入年表
+年表以 (id, date) 为主键, 使用 INSERT ... ON DUPLICATE KEY UPDATE 写入, 同一天重复执行结果不变
+每个 (id, date) 只保留一行, Latest 恒为 1, 不再需要 AK005 更新标识
+年表主键请先执行 PROD/SubFunc/Init_MainKey.py 建立
 '''
 from CommonFunc.DBconnection import (
     load_config,
@@ -7,6 +10,7 @@ from CommonFunc.DBconnection import (
     set_log,
     find_config_path
 )
+from CommonFunc.bar_store import append_daily_table
 
 def transfer_day_to_main_table(logger):
     '''将数据库中的日表数据写入年表'''
@@ -57,7 +61,8 @@ def transfer_day_to_main_table(logger):
         chg_percen,
         chg_amount,
         turnover_rate,
-        Insrt_time
+        Insrt_time,
+        Latest
     )
     SELECT 
         '{last_update_date}',             
@@ -72,9 +77,23 @@ def transfer_day_to_main_table(logger):
         chg_percen,
         chg_amount,
         turnover_rate,
-        NOW()                  
+        NOW(),
+        1
     FROM 
-        {daily_table};
+        {daily_table}
+    ON DUPLICATE KEY UPDATE
+        open_price = VALUES(open_price),
+        close_price = VALUES(close_price),
+        high = VALUES(high),
+        low = VALUES(low),
+        volume = VALUES(volume),
+        turnover = VALUES(turnover),
+        amplitude = VALUES(amplitude),
+        chg_percen = VALUES(chg_percen),
+        chg_amount = VALUES(chg_amount),
+        turnover_rate = VALUES(turnover_rate),
+        Insrt_time = VALUES(Insrt_time),
+        Latest = 1;
     """
 
     # 连接数据库并执行查询
@@ -86,7 +105,9 @@ def transfer_day_to_main_table(logger):
             log_message = f"PROD: 数据已成功从 {daily_table} --> {main_table}"  # 修改日志前缀
             logger.info(log_message)
             print(log_message)
-            return True
+        # 同步追加到本地列式存储, 失败时存储自动失效, 不影响主流程
+        append_daily_table(config, daily_table, last_update_date, logger)
+        return True
     except Exception as e:
         error_message = f"PROD: 数据转移过程中出错: {str(e)}"  # 修改错误信息前缀
         logger.error(error_message)
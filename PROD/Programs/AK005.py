@@ -1,5 +1,6 @@
 '''
 本程序将配置文件中 table_to_update_flag 指向的数据表中的 Latest更新
+数据表已建立 (id, date) 主键时 (见 PROD/SubFunc/Init_MainKey.py), 每个 (id, date) 只有一行且 Latest 恒为 1, 直接跳过
 '''
 
 import time
@@ -11,6 +12,24 @@ from CommonFunc.DBconnection import (
     find_config_path
 )
 
+def has_id_date_key(table, config):
+    '''数据表是否已建立 (id, date) 主键'''
+    connection = db_con_pymysql(config)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT COLUMN_NAME
+                FROM information_schema.KEY_COLUMN_USAGE
+                WHERE TABLE_SCHEMA = DATABASE()
+                AND TABLE_NAME = %s
+                AND CONSTRAINT_NAME = 'PRIMARY'
+                ORDER BY ORDINAL_POSITION
+            """, (table,))
+            columns = [row['COLUMN_NAME'].lower() for row in cursor.fetchall()]
+        return columns == ['id', 'date']
+    finally:
+        connection.close()
+
 def update_latest_flag(table, config):
     '''更新 Latest 列，只更新最近5天的数据'''
     connection = db_con_pymysql(config)
@@ -65,6 +84,11 @@ def main():
         # 获取需要更新的表名
         table_name = config["DB_tables"]["table_to_update_flag"]
         
+        # 已有 (id, date) 主键时 AK004 以 upsert 写入, 无需更新 Latest
+        if has_id_date_key(table_name, config):
+            logger.info_print(f"PROD: {table_name} 已使用 (id, date) 主键, 跳过 Latest 标识符更新。")
+            return True
+        
         # 执行更新操作
         success = update_latest_flag(table_name, config)
         
@@ -2,14 +2,20 @@
 本程序计算MA并写入配置文件中 ma_table 指向的数据表
 '''
 import os
+import datetime
 import pandas as pd
+from chinese_calendar import get_workdays
 from sqlalchemy.sql import text
 from CommonFunc.DBconnection import (
     load_config,
     db_con_sqlalchemy,
+    release_sqlalchemy,
     set_log,
     find_config_path
 )
+from CommonFunc.bar_store import open_bar_store
+from CommonFunc.ma_engine import calculate_latest_ma, trim_to_depth, IncrementalMAState
+from CommonFunc.weekly_bars import last_trade_day_before
 
 def read_target_stock_codes(csv_file, root_dir):
     """从CSV文件中读取目标股票代码"""
@@ -42,21 +48,100 @@ def fetch_stock_data(engine, source_table, stock_codes):
     logger.info_print(f"PROD: 返回数据行数：{len(data)}")
     return data
 
+def fetch_stock_data_from_store(store, stock_codes):
+    """从本地列式存储提取收盘价, 结果与 fetch_stock_data 一致"""
+    data = store.to_frame(stock_codes, columns=('close', 'high'))
+    data = data[data['high'].notna()]
+    data = data.rename(columns={'close': 'close_price'})[['id', 'date', 'close_price']]
+    logger.info_print(f"PROD: 返回数据行数：{len(data)}")
+    return data
+
+def fetch_daily_closes(engine, source_table, stock_codes, trade_date):
+    """从数据库提取指定交易日的收盘价"""
+    query = f"""
+    SELECT id, close_price
+    FROM {source_table}
+    WHERE id IN :stock_codes AND date = :trade_date AND Latest = 1 AND high IS NOT NULL
+    """
+    with engine.connect() as connection:
+        data = pd.read_sql_query(
+            sql=text(query),
+            con=connection,
+            params={'stock_codes': tuple(stock_codes), 'trade_date': trade_date}
+        )
+    return data
+
+def fetch_daily_closes_from_store(store, stock_codes, trade_date):
+    """从本地列式存储提取指定交易日的收盘价"""
+    data = store.rows_on(trade_date, stock_codes, columns=('close', 'high'))
+    data = data[data['high'].notna()]
+    return data.rename(columns={'close': 'close_price'})[['id', 'close_price']]
+
+def load_recent_history(engine, config, store, stock_codes, depth, batch_size):
+    """分批读取收盘价, 每只股票只保留计算所需的最近 depth 个交易日"""
+    if store is not None:
+        return trim_to_depth(fetch_stock_data_from_store(store, stock_codes), depth)
+    batches = []
+    for i in range(0, len(stock_codes), batch_size):
+        batch = stock_codes[i:i + batch_size]
+        logger.info_print(f"PROD: 开始读取第 {i // batch_size + 1} 批，共 {len(batch)} 支股票。")
+        batch_data = fetch_stock_data(engine, config['DB_tables']['main_query_table'], batch)
+        if batch_data.empty:
+            logger.info_print(f"PROD: 第 {i // batch_size + 1} 批没有有效数据，跳过。")
+            continue
+        batches.append(trim_to_depth(batch_data, depth))
+    return pd.concat(batches, ignore_index=True) if batches else pd.DataFrame()
+
+def state_is_current(state, trade_date):
+    """增量状态是否只差最新一个交易日 (或已包含该交易日)"""
+    if state.last_date is None:
+        return False
+    last_date = pd.Timestamp(state.last_date).date()
+    trade_date = pd.Timestamp(trade_date).date()
+    if last_date >= trade_date:
+        return True
+    # 两次更新之间不能有遗漏的交易日
+    start = last_date + datetime.timedelta(days=1)
+    end = trade_date - datetime.timedelta(days=1)
+    if start > end:
+        return True
+    return len(get_workdays(start, end, include_weekends=False)) == 0
+
+def update_ma_incremental(engine, config, store, state, stock_codes, trade_date, batch_size):
+    """用当日收盘价增量更新状态, 返回当日有交易股票的MA"""
+    if store is not None:
+        daily = fetch_daily_closes_from_store(store, stock_codes, trade_date)
+    else:
+        daily = fetch_daily_closes(engine, config['DB_tables']['main_query_table'], stock_codes, trade_date)
+    if daily.empty:
+        return pd.DataFrame()
+    daily['id'] = daily['id'].astype(str)
+
+    # 新加入的股票, 以及缺少交易日的股票 (例如前一交易日涨停未进入 Filter0Out), 先用历史数据 (不含当日) 重新初始化
+    prev_date = last_trade_day_before(trade_date)
+    missing = state.missing(daily['id'].tolist())
+    stale = state.stale(daily['id'].tolist(), prev_date)
+    if missing or stale:
+        logger.info_print(f"PROD: {len(missing)} 支股票不在增量状态中，{len(stale)} 支股票缺少交易日，使用历史数据初始化。")
+        history = load_recent_history(engine, config, store, missing + stale, state.depth + 1, batch_size)
+        history = history[pd.to_datetime(history['date']) < pd.Timestamp(trade_date)]
+        if not history.empty:
+            state.add_history(history, as_of=prev_date)
+        # 没有历史数据的新股用空缓冲区初始化
+        new_ids = state.missing(missing)
+        if new_ids:
+            state.add_history(pd.DataFrame({
+                'id': new_ids,
+                'date': pd.Timestamp(trade_date) - pd.Timedelta(days=1),
+                'close_price': float('nan')
+            }))
+
+    rows = state.update(trade_date, daily['id'].tolist(), daily['close_price'].astype(float).values, prev_date)
+    return state.latest_ma(rows)
+
 def calculate_ma(data, ma_days):
-    """使用Pandas计算MA值"""
-    results = []
-    for stock_code, group in data.groupby('id'):
-        group = group.sort_values('date')  # 确保按时间升序排列
-        for ma in ma_days:
-            group[f'MA{ma}'] = group['close_price'].rolling(window=ma).mean()
-        # 提取最新日期的 MA 值
-        latest_row = group.iloc[-1]
-        results.append({
-            'date': latest_row['date'],
-            'id': stock_code,
-            **{f'MA{ma}': latest_row[f'MA{ma}'] for ma in ma_days}
-        })
-    return pd.DataFrame(results)
+    """使用批量均线引擎一次计算所有股票最新交易日的MA值"""
+    return calculate_latest_ma(data, ma_days)
 
 def insert_results_to_db(engine, ma_table, results):
     """将结果插入到数据库"""
@@ -64,17 +149,21 @@ def insert_results_to_db(engine, ma_table, results):
     dtype_mapping = {
         'date': Date,
         'id': String(10),
-        **{f'MA{ma}': Float for ma in range(1, 6)}
+        **{col: Float for col in results.columns if col.startswith('MA')}
     }
-    results.to_sql(ma_table, engine, if_exists='append', index=False, method='multi', dtype=dtype_mapping)
+    results.to_sql(ma_table, engine, if_exists='append', index=False, method='multi',
+                   chunksize=5000, dtype=dtype_mapping)
     logger.info_print(f"PROD: 插入完成，共插入 {len(results)} 条记录。")
 
-def clear_ma_table(engine, ma_table):
-    """清空目标表"""
-    logger.info_print(f"PROD: 清空目标表 {ma_table}...")
-    with engine.connect() as connection:
-        connection.execute(text(f"TRUNCATE TABLE {ma_table}"))
-    logger.info_print(f"PROD: 目标表 {ma_table} 已清空。开始计算MA")
+def delete_existing_rows(engine, ma_table, results):
+    """删除本次将要写入的 (id, date) 记录, 保留其余历史MA"""
+    with engine.begin() as connection:
+        for date, group in results.groupby('date'):
+            connection.execute(
+                text(f"DELETE FROM {ma_table} WHERE date = :date AND id IN :ids"),
+                {'date': pd.Timestamp(date).date(), 'ids': tuple(group['id'])}
+            )
+    logger.info_print(f"PROD: 已删除目标表 {ma_table} 中待更新的 {len(results)} 条记录。")
  
 def main():
     """
@@ -104,31 +193,57 @@ def main():
         try:
             # 读取目标股票代码
             stock_codes = read_target_stock_codes(csv_path, root_dir)
-            
-            # 清空目标表
-            clear_ma_table(engine, ma_table)
 
-            # 分批处理
-            for i in range(0, len(stock_codes), batch_size):
-                batch = stock_codes[i:i + batch_size]
-                logger.info_print(f"PROD: 开始处理第 {i // batch_size + 1} 批，共 {len(batch)} 支股票。")
+            # 本地存储已更新到最新交易日时优先使用
+            store = open_bar_store(config, config['DBinput']['last_update_date'])
+            if store is not None:
+                logger.info_print("PROD: 使用本地列式存储读取收盘价")
+            
+            trade_date = config['DBinput']['last_update_date']
+            depth = max(ma_days)
+            ma_mode = ma_config.get('ma_mode', 'full')
+            state_path = os.path.join(root_dir, ma_config['ma_state_path']) if ma_config.get('ma_state_path') else None
 
-                data = fetch_stock_data(engine, config['DB_tables']['main_query_table'], batch)
+            state = None
+            if ma_mode == 'incremental' and state_path and os.path.exists(state_path):
+                state = IncrementalMAState.load(state_path)
+                if list(state.windows) != list(ma_days) or not state_is_current(state, trade_date):
+                    logger.info_print("PROD: 增量状态与配置或交易日不一致，改为全量计算并重建状态。")
+                    state = None
 
+            if state is not None:
+                # 增量模式: 每只股票只更新当日
+                ma_results = update_ma_incremental(engine, config, store, state, stock_codes, trade_date, batch_size)
+                logger.info_print(f"PROD: MA增量更新完成，共 {len(ma_results)} 支股票。")
+            else:
+                data = load_recent_history(engine, config, store, stock_codes, depth, batch_size)
                 if data.empty:
-                    logger.info_print(f"PROD: 第 {i // batch_size + 1} 批没有有效数据，跳过。")
-                    continue
+                    logger.error_print("PROD: 没有可用于计算MA的数据")
+                    return False
 
+                # 一次性计算全部股票的MA
                 ma_results = calculate_ma(data, ma_days)
+                logger.info_print(f"PROD: MA计算完成，共 {len(ma_results)} 支股票。")
+                if ma_mode == 'incremental' and state_path:
+                    state = IncrementalMAState.from_history(data, ma_days)
+
+            # 替换本次计算的 (id, date) 记录, 保留历史MA
+            if not ma_results.empty:
+                delete_existing_rows(engine, ma_table, ma_results)
                 insert_results_to_db(engine, ma_table, ma_results)
-                logger.info_print(f"PROD: 第 {i // batch_size + 1} 批处理完成，已插入结果。")
+
+            # 数据库写入成功后再保存状态
+            if state is not None:
+                os.makedirs(os.path.dirname(state_path), exist_ok=True)
+                state.save(state_path)
+                logger.info_print(f"PROD: 增量状态已保存至 {os.path.basename(state_path)}")
 
             return True
         except Exception as e:
             logger.error_print(f"PROD: 处理过程中出现错误: {str(e)}")
             return False
         finally:
-            engine.dispose()
+            release_sqlalchemy(config, engine)
     except Exception as e:
         logger.error_print(f"PROD: 配置文件读取错误: {str(e)}")
         return False
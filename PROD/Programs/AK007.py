@@ -12,7 +12,17 @@ from sqlalchemy.engine import Engine
 from pymysql.connections import Connection
 from pathlib import Path
 import os
-from CommonFunc.DBconnection import find_config_path, load_config, db_con_pymysql, db_con_sqlalchemy, set_log
+import time
+from CommonFunc.DBconnection import find_config_path, load_config, db_con_pymysql, db_con_sqlalchemy, release_sqlalchemy, set_log
+from CommonFunc.bar_store import open_bar_store
+from CommonFunc.bulk_insert import bulk_insert_df
+
+# 集合更新时暂存当日最高价的临时表 (只在当前连接中可见)
+DAY_HIGH_TABLE = "tmp_gap_day_high"
+
+# 集合更新中各情况的判断条件 (g: 缺口表, h: 当日最高价); 无今日数据时 h.high 为 NULL, 两个条件都不成立
+GAP_FILLED = "g.to_price < h.high AND g.from_price <= h.high"
+GAP_REDUCED = "g.to_price < h.high AND g.from_price > h.high"
 
 class GapManager:
     def __init__(self, env: str, logger, connection: Connection, engine: Engine, config: Dict[str, Any]):
@@ -23,9 +33,15 @@ class GapManager:
         self.config = config
         self.gap_table = config["DB_tables"]["gap_table"]
         self.main_query_table = config["DB_tables"]["main_query_table"]
+        # rows: 读取缺口到 pandas 后逐行更新; set: 在数据库中用一条关联 UPDATE 更新
+        self.update_mode = config.get("Programs", {}).get("AK007", {}).get("update_mode", "rows")
         
     def update_existing_gaps(self, trade_date: str, debug: bool = False) -> None:
         """更新现有尚未填满的缺口信息"""
+        if self.update_mode == "set":
+            self.update_existing_gaps_set(trade_date, debug)
+            return
+        
         # 读取未填满的缺口
         query_gaps = f"SELECT * FROM `{self.gap_table}` WHERE filled = 0"
         gaps_df = pd.read_sql(query_gaps, self.engine)
@@ -33,17 +49,21 @@ class GapManager:
             self.logger.debug(f"Debug: Found {len(gaps_df)} unfilled gaps")
         
         stock_ids = tuple(gaps_df['id'].unique())
-        query_high = f"""
-        SELECT id, high 
-        FROM `{self.main_query_table}` 
-        WHERE id IN {stock_ids if len(stock_ids) > 1 else f"('{stock_ids[0]}')"} 
-        AND date = '{trade_date}'
-        AND Latest = 1
-        """
-        if debug:
-            self.logger.debug(f"Debug: Query for high prices: {query_high}")
-        
-        high_prices_df = pd.read_sql(query_high, self.engine)
+        store = open_bar_store(self.config, trade_date)
+        if store is not None:
+            high_prices_df = store.rows_on(trade_date, stock_ids, columns=('high',))[['id', 'high']]
+        else:
+            query_high = f"""
+            SELECT id, high 
+            FROM `{self.main_query_table}` 
+            WHERE id IN {stock_ids if len(stock_ids) > 1 else f"('{stock_ids[0]}')"} 
+            AND date = '{trade_date}'
+            AND Latest = 1
+            """
+            if debug:
+                self.logger.debug(f"Debug: Query for high prices: {query_high}")
+            
+            high_prices_df = pd.read_sql(query_high, self.engine)
         if debug:
             self.logger.debug(f"Debug: Found {len(high_prices_df)} records with high prices")
         
@@ -150,6 +170,112 @@ class GapManager:
         self.connection.commit()
         self.logger.info("PROD: 现有缺口更新完成。")
 
+    def update_existing_gaps_set(self, trade_date: str, debug: bool = False) -> Dict[str, int]:
+        """
+        集合方式更新未填满的缺口: 当日最高价暂存到临时表, 先统计各情况数量, 再用一条关联 UPDATE 按 CASE 同时处理
+            无今日数据 / 缺口没有缩小: 只更新时间戳
+            最高价 >= from_price: 缺口填满, 记录 edate
+            to_price < 最高价 < from_price: 缺口缩小, to_price 改为最高价
+        结果与逐行更新相同, 数据只在数据库内流动, 缺口表增长时耗时基本不变
+
+        Returns:
+            dict: 各情况的缺口数量 (total, no_data, unchanged, filled, reduced)
+        """
+        start_time = time.time()
+        with self.connection.cursor() as cursor:
+            staged = self._stage_day_highs(cursor, trade_date)
+            if debug:
+                self.logger.debug(f"Debug: 暂存 {staged} 只股票的当日最高价")
+            
+            cursor.execute(f"""
+                SELECT COUNT(*) AS total,
+                       SUM(h.high IS NULL) AS no_data,
+                       SUM(g.to_price >= h.high) AS unchanged,
+                       SUM({GAP_FILLED}) AS filled,
+                       SUM({GAP_REDUCED}) AS reduced
+                FROM `{self.gap_table}` g
+                LEFT JOIN `{DAY_HIGH_TABLE}` h ON h.id = g.id
+                WHERE g.filled = 0
+            """)
+            counts = {key: int(value or 0) for key, value in cursor.fetchone().items()}
+            
+            if counts['total']:
+                # 各赋值的条件只依赖 to_price/from_price 和当日最高价, 两个条件互斥,
+                # 填满的缺口 to_price 不变, 缩小后的缺口不满足填满条件, 因此与赋值顺序无关
+                cursor.execute(f"""
+                    UPDATE `{self.gap_table}` g
+                    LEFT JOIN `{DAY_HIGH_TABLE}` h ON h.id = g.id
+                    SET g.filled = CASE WHEN {GAP_FILLED} THEN 1 ELSE g.filled END,
+                        g.edate = CASE WHEN {GAP_FILLED} THEN %s ELSE g.edate END,
+                        g.to_price = CASE WHEN {GAP_REDUCED} THEN h.high ELSE g.to_price END,
+                        g.gap_update_time = NOW()
+                    WHERE g.filled = 0
+                """, (trade_date,))
+            cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{DAY_HIGH_TABLE}`")
+        self.connection.commit()
+        
+        if counts['total'] == 0:
+            self.logger.info("PROD: 没有未填满的缺口需要更新。")
+            return counts
+        self.logger.info_print(f"PROD: 共有 {counts['total']} 个未填满的缺口, "
+                               f"{counts['no_data']} 个无今日数据, {counts['unchanged']} 个没有缩小, "
+                               f"{counts['filled']} 个已填满, {counts['reduced']} 个缩小")
+        self.logger.info(f"PROD: 现有缺口集合更新完成, 耗时 {time.time() - start_time:.2f} 秒。")
+        return counts
+
+    def _stage_day_highs(self, cursor, trade_date: str) -> int:
+        """
+        把当日最高价写入临时表: 本地存储可用时从存储写入, 否则在数据库内直接从主表复制
+
+        Returns:
+            int: 暂存的股票数量
+        """
+        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{DAY_HIGH_TABLE}`")
+        cursor.execute(f"""
+            CREATE TEMPORARY TABLE `{DAY_HIGH_TABLE}` (
+                id varchar(10) NOT NULL PRIMARY KEY,
+                high decimal(10,2) NOT NULL
+            ) ENGINE=MEMORY
+        """)
+        store = open_bar_store(self.config, trade_date)
+        if store is not None:
+            highs = store.rows_on(trade_date, columns=('high',))[['id', 'high']].dropna()
+            return bulk_insert_df(self.connection, DAY_HIGH_TABLE, highs, self.config, logger=self.logger)
+        return cursor.execute(f"""
+            INSERT IGNORE INTO `{DAY_HIGH_TABLE}` (id, high)
+            SELECT id, high FROM `{self.main_query_table}`
+            WHERE date = %s AND Latest = 1 AND high IS NOT NULL
+        """, (trade_date,))
+
+    def _fetch_gap_prices_from_db(self, trade_date: str, batch_codes: List[str]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """从数据库获取上一交易日最低价和当日最高价"""
+        # 批量获取上一交易日数据
+        prev_query = f"""
+        SELECT t1.id, t1.date as prev_date, t1.low as previous_low
+        FROM {self.main_query_table} t1
+        INNER JOIN (
+            SELECT id, MAX(date) as max_date
+            FROM {self.main_query_table}
+            WHERE date < '{trade_date}'
+            AND Latest = 1
+            AND id IN ({','.join(f"'{code}'" for code in batch_codes)})
+            GROUP BY id
+        ) t2 ON t1.id = t2.id AND t1.date = t2.max_date
+        WHERE t1.Latest = 1
+        """
+        prev_df = pd.read_sql(prev_query, self.engine)
+        
+        # 批量获取当日数据
+        current_query = f"""
+        SELECT id, high as current_high
+        FROM {self.main_query_table}
+        WHERE id IN ({','.join(f"'{code}'" for code in batch_codes)})
+        AND date = '{trade_date}'
+        AND Latest = 1
+        """
+        current_df = pd.read_sql(current_query, self.engine)
+        return prev_df, current_df
+
     def detect_new_gaps(self, trade_date: str, csv_path: str, debug: bool = False) -> None:
         """检测新的缺口"""
         # 读取股票代码
@@ -159,6 +285,9 @@ class GapManager:
         if debug:
             self.logger.info(f"PROD: 读取到 {len(stock_codes)} 个股票代码")
         
+        # 本地存储已更新到交易日时优先使用
+        store = open_bar_store(self.config, trade_date)
+        
         # 批处理大小
         batch_size = 600
         new_gaps = []
@@ -173,31 +302,14 @@ class GapManager:
             self.logger.debug(f"处理批次 {batch_num + 1}/{total_batches} ({start_idx + 1}-{end_idx})")
             print(f"处理批次 {batch_num + 1}/{total_batches} ({start_idx + 1}-{end_idx})")
             
-            # 批量获取上一交易日数据
-            prev_query = f"""
-            SELECT t1.id, t1.date as prev_date, t1.low as previous_low
-            FROM {self.main_query_table} t1
-            INNER JOIN (
-                SELECT id, MAX(date) as max_date
-                FROM {self.main_query_table}
-                WHERE date < '{trade_date}'
-                AND Latest = 1
-                AND id IN ({','.join(f"'{code}'" for code in batch_codes)})
-                GROUP BY id
-            ) t2 ON t1.id = t2.id AND t1.date = t2.max_date
-            WHERE t1.Latest = 1
-            """
-            prev_df = pd.read_sql(prev_query, self.engine)
-            
-            # 批量获取当日数据
-            current_query = f"""
-            SELECT id, high as current_high
-            FROM {self.main_query_table}
-            WHERE id IN ({','.join(f"'{code}'" for code in batch_codes)})
-            AND date = '{trade_date}'
-            AND Latest = 1
-            """
-            current_df = pd.read_sql(current_query, self.engine)
+            if store is not None:
+                prev_df = store.last_rows_before(trade_date, batch_codes, columns=('low',)).rename(
+                    columns={'date': 'prev_date', 'low': 'previous_low'})
+                prev_df['prev_date'] = prev_df['prev_date'].dt.date
+                current_df = store.rows_on(trade_date, batch_codes, columns=('high',)).rename(
+                    columns={'high': 'current_high'})[['id', 'current_high']]
+            else:
+                prev_df, current_df = self._fetch_gap_prices_from_db(trade_date, batch_codes)
             
             # 合并数据并检查缺口
             if not prev_df.empty and not current_df.empty:
@@ -312,8 +424,7 @@ def run_gap_detection(env: str, trade_date: str, run_update: bool = True,
     finally:
         if connection:
             connection.close()
-        if engine:
-            engine.dispose()
+        release_sqlalchemy(config, engine)
         logger.info_print("程序运行结束\n")
 
 def main():
@@ -5,10 +5,13 @@
 import pandas as pd
 import datetime
 import chinese_calendar as cc
-from CommonFunc.DBconnection import find_config_path, load_config, set_log, db_con_sqlalchemy
+from CommonFunc.DBconnection import find_config_path, load_config, set_log, db_con_sqlalchemy, db_con_pymysql
+from CommonFunc.bar_store import open_bar_store
+from CommonFunc.bulk_insert import bulk_insert_df
+from CommonFunc.weekly_bars import WeeklyBarUpdater, WK_COLUMNS, WK_UPDATE_COLUMNS
 from QA.SubFunc.Ini_WK_MuTh import convert_date_to_week
 import os
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine
 
 def get_stock_list(config, root_dir):
     """从CSV文件获取股票代码列表"""
@@ -53,6 +56,26 @@ def get_last_week_workday(current_date):
     # 返回上周最后一个工作日
     return last_week_workdays[-1] if last_week_workdays else None
 
+def update_weekly_incremental(config, logger, stock_list, debug_mode):
+    """
+    增量更新: 只把最新交易日的日K并入本周周K (见 CommonFunc/weekly_bars.py)
+    返回:
+        dict: 各类股票数量
+    """
+    trade_date = config['DBinput']['last_update_date']
+    store = open_bar_store(config, trade_date)
+    connection = db_con_pymysql(config)
+    try:
+        updater = WeeklyBarUpdater(config, connection, logger, store)
+        counts = updater.update(trade_date, convert_date_to_week(trade_date), stock_list, debug_mode)
+        connection.commit()
+        return counts
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
 def update_weekly_data():
     """更新当前周的周K数据"""
     # 获取配置信息
@@ -65,6 +88,8 @@ def update_weekly_data():
     
     # 获取debug模式设置
     debug_mode = config.get('Programs', {}).get('AK008', {}).get('DEBUG', False)
+    # full: 每天重新汇总本周全部日K (默认); incremental: 只合并当日日K
+    update_mode = config.get('Programs', {}).get('AK008', {}).get('update_mode', 'full')
     
     try:
         # 获取当前日期和计算周的起止时间
@@ -81,6 +106,18 @@ def update_weekly_data():
         stock_list = get_stock_list(config, root_dir)
         total_stocks = len(stock_list)
         
+        # 增量模式: 每天只合并当日日K, 批量写回
+        if update_mode == 'incremental':
+            counts = update_weekly_incremental(config, logger, stock_list, debug_mode)
+            logger.info_print(f"""
+=== AK008更新周K完成统计 (增量) ===
+总计处理: {total_stocks} 只股票
+直接合并: {counts['folded']} 只, 重新汇总: {counts['rebuilt']} 只
+正常股票: {counts['active']} 只 ({counts['active']/total_stocks:.1%})
+ST股票: {counts['st']} 只 ({counts['st']/total_stocks:.1%})
+""")
+            return True, "数据更新成功完成"
+        
         if debug_mode:
             logger.info_print(f"查询日期范围: {week_start.strftime('%Y-%m-%d')} 到 {week_end.strftime('%Y-%m-%d')}")
         
@@ -90,35 +127,48 @@ def update_weekly_data():
         # 获取上周最后一个工作日
         last_week_workday = get_last_week_workday(current_date)
         
-        # 修改查询语句，同时获取上周最后一个工作日的收盘价
-        stock_list_str = "','".join(stock_list)
-        sql = f"""
-        SELECT a.id, a.date, a.open_price, a.close_price, a.high, a.low,
-               b.close_price as last_week_close
-        FROM {config['DB_tables']['main_query_table']} a
-        LEFT JOIN (
-            SELECT id, close_price
-            FROM {config['DB_tables']['main_query_table']}
-            WHERE date = '{last_week_workday.strftime('%Y-%m-%d')}'
-        ) b ON a.id = b.id
-        WHERE a.id IN ('{stock_list_str}')
-        AND a.date >= '{week_start.strftime('%Y-%m-%d')}'
-        AND a.date <= '{week_end.strftime('%Y-%m-%d')}'
-        """
-        
-        print("正在查询数据...")
-        df = pd.read_sql_query(sql, engine)
+        # 本地存储已更新到今天时直接读取, 否则查询数据库
+        store = open_bar_store(config, config['DBinput']['last_update_date'])
+        if store is not None:
+            print("正在从本地存储读取数据...")
+            df = store.to_frame(stock_list, week_start, week_end, ('open', 'close', 'high', 'low')).rename(
+                columns={'open': 'open_price', 'close': 'close_price'})
+            last_close = store.rows_on(last_week_workday, stock_list, ('close',)).rename(
+                columns={'close': 'last_week_close'})
+            df = df.merge(last_close[['id', 'last_week_close']], on='id', how='left')
+        else:
+            # 修改查询语句，同时获取上周最后一个工作日的收盘价
+            stock_list_str = "','".join(stock_list)
+            sql = f"""
+            SELECT a.id, a.date, a.open_price, a.close_price, a.high, a.low,
+                   b.close_price as last_week_close
+            FROM {config['DB_tables']['main_query_table']} a
+            LEFT JOIN (
+                SELECT id, close_price
+                FROM {config['DB_tables']['main_query_table']}
+                WHERE date = '{last_week_workday.strftime('%Y-%m-%d')}'
+            ) b ON a.id = b.id
+            WHERE a.id IN ('{stock_list_str}')
+            AND a.date >= '{week_start.strftime('%Y-%m-%d')}'
+            AND a.date <= '{week_end.strftime('%Y-%m-%d')}'
+            """
+        
+            print("正在查询数据...")
+            df = pd.read_sql_query(sql, engine)
         
         if debug_mode:
             logger.info_print(f"查询到 {len(df)} 条数据")
         
         # 使用pandas进行分组计算，确保数值类型正确
+        # 开盘价取第一个非空值、收盘价取最后一个非空值 (跳过停牌日), 与增量模式 (CommonFunc/weekly_bars.py) 一致
         print("正在计算周K数据...")
-        weekly_data = df.groupby('id').agg({
-            'open_price': lambda x: float(x.iloc[0]) if pd.notna(x.iloc[0]) else None,
-            'close_price': lambda x: float(x.iloc[-1]) if pd.notna(x.iloc[-1]) else None,
-            'high': lambda x: float(x.max()) if pd.notna(x.max()) else None,
-            'low': lambda x: float(x.min()) if pd.notna(x.min()) else None,
+        price_columns = ['open_price', 'close_price', 'high', 'low', 'last_week_close']
+        df[price_columns] = df[price_columns].astype(float)
+        weekly_data = df.sort_values(['id', 'date']).groupby('id').agg({
+            'open_price': 'first',
+            'close_price': 'last',
+            'high': 'max',
+            'low': 'min',
             'last_week_close': 'first'  # 获取上周收盘价
         }).reset_index()
         
@@ -143,8 +193,8 @@ def update_weekly_data():
                 'id': list(missing_stocks),
                 'wkn': current_week,
                 'WK_date': current_date.strftime('%Y-%m-%d'),
-                'open': None,
-                'close': None,
+                'open_price': None,
+                'close_price': None,
                 'high': None,
                 'low': None,
                 'chg_percen': None,
@@ -159,40 +209,15 @@ def update_weekly_data():
             'close_price': 'close'
         })
         
-        # 批量更新数据库
+        # 批量写入数据库 (多行 INSERT ... ON DUPLICATE KEY UPDATE)
         print("正在更新数据库...")
-        def show_progress(current, total):
-            print(f"\r处理进度: {current}/{total} ({current/total:.1%})", end="", flush=True)
-        
-        for idx, row in weekly_data.iterrows():
-            show_progress(idx + 1, len(weekly_data))
-            
-            sql_update = text(f"""
-            INSERT INTO {config['DB_tables']['WK_table']} 
-            (id, wkn, WK_date, open, close, high, low, chg_percen, update_time, status)
-            VALUES ('{row['id']}', '{row['wkn']}', '{row['WK_date']}', 
-                    {row['open'] if pd.notna(row['open']) else 'NULL'}, 
-                    {row['close'] if pd.notna(row['close']) else 'NULL'}, 
-                    {row['high'] if pd.notna(row['high']) else 'NULL'}, 
-                    {row['low'] if pd.notna(row['low']) else 'NULL'},
-                    {row['chg_percen'] if pd.notna(row['chg_percen']) else 'NULL'},
-                    '{row['update_time']}', '{row['status']}')
-            ON DUPLICATE KEY UPDATE
-            WK_date = VALUES(WK_date),
-            open = VALUES(open),
-            close = VALUES(close),
-            high = VALUES(high),
-            low = VALUES(low),
-            chg_percen = VALUES(chg_percen),
-            update_time = VALUES(update_time),
-            status = VALUES(status)
-            """)
-            
-            with engine.connect() as conn:
-                conn.execute(sql_update)
-                conn.commit()
-        
-        print("\n")
+        connection = db_con_pymysql(config)
+        try:
+            bulk_insert_df(connection, config['DB_tables']['WK_table'], weekly_data[WK_COLUMNS], config,
+                           update_columns=WK_UPDATE_COLUMNS, logger=logger)
+            connection.commit()
+        finally:
+            connection.close()
         
         # 统计信息
         success_count = len(weekly_data[weekly_data['status'] == 'active'])
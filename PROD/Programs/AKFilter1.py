@@ -13,6 +13,7 @@ from CommonFunc.DBconnection import (
     db_con_pymysql,
     set_log
 )
+from CommonFunc.bar_store import open_bar_store
 from datetime import datetime
 from PROD.SubFunc.SubAK001 import save_filter_result
 import time
@@ -37,6 +38,15 @@ def fetch_all_data(cursor, stock_codes, table_name):
     cursor.execute(query, stock_codes)
     return cursor.fetchall()
 
+def fetch_all_data_from_store(store, stock_codes):
+    """从本地存储获取所有股票的最近三天数据 (与 fetch_all_data 结果一致)"""
+    # 最近三个有开盘价的交易日
+    candidates = store.recent_dates(10)
+    opens = store.to_frame(start_date=candidates[0], columns=('open',)).dropna(subset=['open'])
+    dates = np.unique(opens['date'].values)[-3:]
+    df = store.to_frame(stock_codes, start_date=dates[0], columns=('chg_percen',))
+    return df[df['date'].isin(dates)]
+
 def process_data_vectorized(data, logger):
     """使用向量化操作处理数据"""
     try:
@@ -120,8 +130,12 @@ def main():
         # 获取并处理数据
         start_time = time.time()
         
-        # 一次性获取所有数据
-        results = fetch_all_data(cursor, stock_codes, table_name)
+        # 一次性获取所有数据, 本地存储可用时优先使用
+        store = open_bar_store(config, config['DBinput']['last_update_date'])
+        if store is not None:
+            results = fetch_all_data_from_store(store, stock_codes)
+        else:
+            results = fetch_all_data(cursor, stock_codes, table_name)
         
         # 向量化处理数据
         gains_details = process_data_vectorized(results, logger)
@@ -25,7 +25,7 @@ def fetch_data_for_date(cursor, stock_codes, main_table, ma_table, processing_da
     query = f"""
     SELECT m.id, m.close_price, ma.MA120, ma.MA250
     FROM {main_table} m
-    LEFT JOIN {ma_table} ma ON m.id = ma.id AND m.date = m.date
+    LEFT JOIN {ma_table} ma ON m.id = ma.id AND ma.date = m.date
     WHERE m.id IN ({placeholders})
     AND m.date = %s
     """
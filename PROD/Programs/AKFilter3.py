@@ -15,6 +15,7 @@ from CommonFunc.DBconnection import (
     db_con_pymysql,
     set_log
 )
+from CommonFunc.bar_store import open_bar_store
 from datetime import datetime
 from PROD.SubFunc.SubAK001 import save_filter_result
 from PROD.Programs.AK002 import is_today_workday, last_workday
@@ -33,6 +34,11 @@ def fetch_latest_prices(cursor, stock_codes, main_table, processing_date):
     results = cursor.fetchall()
     return pd.DataFrame(results)
 
+def fetch_latest_prices_from_store(store, stock_codes, processing_date):
+    """从本地存储获取指定日期的收盘价"""
+    df = store.rows_on(processing_date, stock_codes, columns=('close',))
+    return df.rename(columns={'close': 'close_price'})[['id', 'close_price']]
+
 def fetch_unfilled_gaps(cursor, stock_codes, gap_table):
     """获取未填充的缺口数据"""
     placeholders = ', '.join(['%s'] * len(stock_codes))
@@ -192,7 +198,11 @@ def main():
             start_time = time.time()
             
             # 获取指定日期的收盘价
-            prices_df = fetch_latest_prices(cursor, stock_codes, main_table, processing_date)
+            store = open_bar_store(config, processing_date)
+            if store is not None:
+                prices_df = fetch_latest_prices_from_store(store, stock_codes, processing_date)
+            else:
+                prices_df = fetch_latest_prices(cursor, stock_codes, main_table, processing_date)
             if program_debug:
                 logger.debug(f"获取到 {len(prices_df)} 条收盘价数据")
             
@@ -0,0 +1,223 @@
+"""
+Filter1~3 合并执行:
+每个数据源只读取一次 (最近三天涨幅、处理日收盘价和 MA120/MA250、未填补缺口), 对输入的全部股票整理成一张表,
+各过滤条件在内存中计算为布尔掩码, 按顺序依次生效; 最后一次性写入各过滤程序的输出 CSV、
+过滤历史和 Filter0Out.csv 中的 FilteredBy 标注
+过滤条件与 AKFilter1/2/3 相同:
+    Filter1: 三天累计涨幅不超过 12%
+    Filter2: {收盘价 * 1.1 < MA120 & MA250} or {收盘价 > MA120 & MA250}
+    Filter3: 无缺口; 单个缺口且收盘价 * 1.1 < to_price; 多个缺口且收盘价 * 1.1 < 高于收盘价的最近缺口 (或没有高于收盘价的缺口)
+缺少数据的股票 (不足三天涨幅、处理日无收盘价) 与原程序一样不进入下一步, 也不标注
+输出: PROD/CSVs/Filter1Out.csv, Filter2Out.csv, Filter3Out.csv
+"""
+
+import pandas as pd
+import os
+import time
+from CommonFunc.DBconnection import (
+    find_config_path,
+    load_config,
+    db_con_pymysql,
+    set_log
+)
+from CommonFunc.bar_store import open_bar_store
+from PROD.SubFunc.SubAK001 import save_filter_result
+from PROD.Programs.AK002 import is_today_workday
+from PROD.Programs.AKFilter1 import fetch_all_data, fetch_all_data_from_store, process_data_vectorized
+from PROD.Programs.AKFilter2 import fetch_data_for_date
+from PROD.Programs.AKFilter3 import fetch_unfilled_gaps
+
+# Filter1 三天累计涨幅上限 (%)
+MAX_THREE_DAY_GAINS = 12
+# Filter2/Filter3 收盘价的放大系数
+PRICE_MARGIN = 1.1
+
+
+def build_filter_frame(stock_codes, gains, prices, gaps):
+    """
+    把各数据源整理为一张以股票代码为索引的表
+
+    Args:
+        stock_codes (list): 输入的股票代码 (6 位字符串)
+        gains (pd.DataFrame): AKFilter1.process_data_vectorized 的结果 (索引为 id, 含 sum_gains)
+        prices (pd.DataFrame): 处理日的 id, close_price, MA120, MA250
+        gaps (pd.DataFrame): 未填补缺口的 id, to_price
+
+    Returns:
+        pd.DataFrame: has_gains, sum_gains, has_price, close_price, MA120, MA250,
+                      gap_count, gap_price (第一个缺口), nearest_gap (高于收盘价的最低缺口)
+    """
+    index = pd.Index(stock_codes, name='id')
+    frame = pd.DataFrame(index=index)
+    frame['has_gains'] = index.isin(gains.index)
+    frame['sum_gains'] = gains['sum_gains'].reindex(index)
+
+    prices = prices.drop_duplicates('id').set_index('id') if not prices.empty else pd.DataFrame(
+        columns=['close_price', 'MA120', 'MA250'])
+    frame['has_price'] = index.isin(prices.index)
+    for column in ['close_price', 'MA120', 'MA250']:
+        frame[column] = pd.to_numeric(prices[column], errors='coerce').reindex(index)
+
+    gaps = gaps[['id', 'to_price']].copy()
+    gaps['to_price'] = pd.to_numeric(gaps['to_price'], errors='coerce')
+    gaps['close_price'] = frame['close_price'].reindex(gaps['id']).values
+    grouped = gaps.groupby('id')
+    frame['gap_count'] = grouped.size().reindex(index, fill_value=0)
+    frame['gap_price'] = grouped['to_price'].first().reindex(index)
+    above = gaps[gaps['to_price'] > gaps['close_price']]
+    frame['nearest_gap'] = above.groupby('id')['to_price'].min().reindex(index)
+    return frame
+
+
+def rule_three_day_gain(frame):
+    """Filter1: 三天累计涨幅不超过上限; 不足三天数据的股票无效"""
+    return frame['has_gains'], frame['sum_gains'] <= MAX_THREE_DAY_GAINS
+
+
+def rule_ma_pressure(frame):
+    """Filter2: 收盘价远低于 (留出 10% 空间) 或高于 MA120 和 MA250; 处理日无收盘价的股票无效"""
+    close = frame['close_price']
+    below = (close * PRICE_MARGIN < frame['MA120']) & (close * PRICE_MARGIN < frame['MA250'])
+    above = (close > frame['MA120']) & (close > frame['MA250'])
+    return frame['has_price'], below | above
+
+
+def rule_gap_resistance(frame):
+    """Filter3: 上方缺口 (阻力) 离收盘价留有 10% 空间; 处理日无收盘价的股票无效"""
+    margin_price = frame['close_price'] * PRICE_MARGIN
+    count = frame['gap_count']
+    passed = ((count == 0)
+              | ((count == 1) & (margin_price < frame['gap_price']))
+              | ((count > 1) & (frame['nearest_gap'].isna() | (margin_price < frame['nearest_gap']))))
+    return frame['has_price'], passed
+
+
+# 过滤条件: (名称, 过滤历史中的说明, 条件函数), 按顺序生效
+# 条件函数返回 (有效, 通过) 两个布尔序列; 有效但未通过的股票标注为被该过滤条件过滤
+FILTER_RULES = [
+    ("Filter1", "过滤三天累计涨幅超过12%的股票", rule_three_day_gain),
+    ("Filter2", "根据均线MA120和MA250进行过滤", rule_ma_pressure),
+    ("Filter3", "根据缺口数据进行过滤", rule_gap_resistance),
+]
+
+
+def evaluate_filters(frame, rules=FILTER_RULES):
+    """
+    按顺序计算各过滤条件
+
+    Returns:
+        tuple: (stages, filtered_by)
+            stages: 每个条件一项 (名称, 说明, 输入数量, 通过的股票代码列表)
+            filtered_by: 以股票代码为索引, 被过滤的股票为过滤条件名称, 其余为 None
+    """
+    remaining = pd.Series(True, index=frame.index)
+    filtered_by = pd.Series(None, index=frame.index, dtype=object)
+    stages = []
+    for name, details, rule in rules:
+        valid, passed = rule(frame)
+        valid, passed = valid.fillna(False).astype(bool), passed.fillna(False).astype(bool)
+        input_count = int(remaining.sum())
+        filtered_by[remaining & valid & ~passed] = name
+        remaining &= valid & passed
+        stages.append((name, details, input_count, frame.index[remaining.values].tolist()))
+    return stages, filtered_by
+
+
+def mark_filtered_stocks(filtered_by, input_csv, logger):
+    """在 Filter0Out.csv 中一次性标注各过滤条件过滤的股票"""
+    filter0_df = pd.read_csv(input_csv)
+    filter0_df['Stock Code'] = filter0_df['Stock Code'].astype(str).str.zfill(6)
+    if 'FilteredBy' not in filter0_df.columns:
+        filter0_df['FilteredBy'] = None
+    marks = filter0_df['Stock Code'].map(filtered_by.dropna())
+    filter0_df.loc[marks.notna(), 'FilteredBy'] = marks[marks.notna()]
+    filter0_df.to_csv(input_csv, index=False)
+    logger.info_print(f"已在 {os.path.basename(input_csv)} 中标注 {int(marks.notna().sum())} 只被过滤股票")
+
+
+def main():
+    """主函数"""
+    _, config_path_PROD, root_dir = find_config_path()
+    config = load_config(config_path_PROD)
+    program_debug = config.get('Programs', {}).get('FilterPipeline', {}).get('DEBUG', False)
+
+    logger = set_log(config, "FilterPipeline.log", prefix="PROD")
+    logger.info_print("开始执行 Filter1~3 合并过滤...")
+
+    is_today, processing_date = is_today_workday(logger)
+    main_table = config['DB_tables']['main_query_table']
+    ma_table = config['MA_config']['ma_table']
+    gap_table = config['DB_tables']['gap_table']
+
+    prod_dir = os.path.dirname(config_path_PROD)
+    filter_csvs = config['CSVs']['Filters']
+    input_csv = os.path.join(prod_dir, filter_csvs['Input'])
+
+    connection = None
+    try:
+        connection = db_con_pymysql(config)
+        cursor = connection.cursor()
+
+        # 读取股票代码
+        try:
+            stock_df = pd.read_csv(input_csv)
+            stock_codes = stock_df.iloc[:, 1].astype(str).str.zfill(6).tolist()
+            logger.info_print(f"成功读取 {len(stock_codes)} 个股票代码")
+        except Exception as e:
+            logger.error_print(f"读取股票代码文件失败: {str(e)}")
+            return False
+
+        # 每个数据源只读取一次, 本地存储可用时优先使用
+        start_time = time.time()
+        store = open_bar_store(config, config['DBinput']['last_update_date'])
+        if store is not None:
+            changes = fetch_all_data_from_store(store, stock_codes)
+        else:
+            changes = fetch_all_data(cursor, stock_codes, main_table)
+        gains = process_data_vectorized(changes, logger)
+        if gains.empty:
+            logger.error_print("没有获取到有效的涨幅数据")
+            return False
+        prices = pd.DataFrame(fetch_data_for_date(cursor, stock_codes, main_table, ma_table, processing_date))
+        gaps = fetch_unfilled_gaps(cursor, stock_codes, gap_table)
+        load_time = time.time() - start_time
+
+        frame = build_filter_frame(stock_codes, gains, prices, gaps)
+        stages, filtered_by = evaluate_filters(frame)
+
+        # 各过滤条件的输出 CSV 和过滤历史
+        source_file = os.path.basename(input_csv)
+        for name, details, input_count, survivors in stages:
+            output_csv = os.path.join(prod_dir, filter_csvs[name])
+            pd.DataFrame({
+                'Index': range(1, len(survivors) + 1),
+                'Stock Code': survivors
+            }).to_csv(output_csv, index=False)
+            output_file = os.path.basename(output_csv)
+            save_filter_result(cursor, config, name, input_count, len(survivors), logger,
+                               details, source_file, output_file)
+            logger.info_print(f"{name}: {input_count} → {len(survivors)}, 已保存至 {output_file}")
+            source_file = output_file
+        connection.commit()
+
+        mark_filtered_stocks(filtered_by, input_csv, logger)
+
+        if program_debug:
+            debug_file = os.path.join(prod_dir, 'CSVs', 'debug_filter_pipeline.csv')
+            frame.assign(FilteredBy=filtered_by).to_csv(debug_file)
+            logger.info_print(f"Debug信息已保存至 {os.path.basename(debug_file)}")
+
+        logger.info_print(f"Filter1~3 合并过滤完成, 读取数据耗时 {load_time:.2f} 秒, "
+                          f"总耗时 {time.time() - start_time:.2f} 秒")
+        return True
+
+    except Exception as e:
+        logger.error_print(f"执行过程中发生错误: {str(e)}")
+        return False
+
+    finally:
+        if connection:
+            connection.close()
+
+if __name__ == "__main__":
+    main()
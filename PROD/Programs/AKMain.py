@@ -1,7 +1,7 @@
 '''
-本程序顺序执行 AK001~AK006
-当且仅当上一个程序执行成功时，才会执行下一个程序
-任何错误都会被记录并导致程序终止
+本程序按依赖关系执行 AK001~AK008 及过滤程序
+上游程序执行成功后才会执行下游程序, 互不依赖的程序并发执行
+任何错误都会被记录, 依赖失败程序的下游程序会被跳过
 '''
 
 import os
@@ -17,62 +17,36 @@ from AK008 import main as ak008_main
 from AKFilter1 import main as akfilter1_main
 from AKFilter2 import main as akfilter2_main
 from AKFilter3 import main as akfilter3_main
+from AKFilterPipeline import main as akfilterpipeline_main
 from CommonFunc.DBconnection import find_config_path, load_config, set_log
+from CommonFunc.dag_runner import Step, run_steps
 
-def execute_ak_sequence():
-    """按顺序执行AK001~AK006程序"""
-    ak_functions = [
-        (ak001_main, "AK001"), # 获取最新的股票代码列表
-        (ak002_main, "AK002"), # 判断日期,创建新数据表,或者进行批量请求
-        (ak003_main, "AK003"), # 获取最新数据, 并写入到日表中
-        (ak004_main, "AK004"), # 日表 --> 年表
-        (ak005_main, "AK005"), # 更新 Latest 标识符
-        (ak006_main, "AK006"), # 计算MA
-        (ak007_main, "AK007"),  # 更新缺口数据
-        (ak008_main, "AK008")  # 更新周K数据
-    ]
-    
-    for func, name in ak_functions:
-        try:
-            logger.info_print(f"PROD: 开始执行 {name}")
-            result = func()
-            
-            if result is None or result is False:
-                error_msg = f"PROD: {name} 执行失败"
-                logger.error_print(error_msg)
-                return False
-                
-            logger.info_print(f"PROD: {name} 执行成功")
-            
-        except Exception as e:
-            error_msg = f"PROD: {name} 执行过程中发生错误: {str(e)}"
-            logger.error_print(error_msg)
-            return False
-    return True
+# 每个步骤声明读取和写入的资源, 互不依赖的步骤 (AK006/AK007/AK008) 并发执行
+AK_STEPS = [
+    Step("AK001", ak001_main, outputs=["stock_list"]),                                  # 获取最新的股票代码列表
+    Step("AK002", ak002_main, inputs=["stock_list"], outputs=["buffer_table"]),         # 判断日期,创建新数据表,或者进行批量请求
+    Step("AK003", ak003_main, inputs=["buffer_table"], outputs=["daily_table"]),        # 获取最新数据, 并写入到日表中
+    Step("AK004", ak004_main, inputs=["daily_table"], outputs=["main_table"]),          # 日表 --> 年表
+    Step("AK005", ak005_main, inputs=["main_table"], outputs=["main_table_latest"]),    # 更新 Latest 标识符
+    Step("AK006", ak006_main, inputs=["main_table_latest"], outputs=["MA"]),            # 计算MA
+    Step("AK007", ak007_main, inputs=["main_table_latest"], outputs=["Gap"]),           # 更新缺口数据
+    Step("AK008", ak008_main, inputs=["main_table_latest"], outputs=["WK"]),            # 更新周K数据
+]
 
-def excute_filters():
-    """执行过滤程序"""
-    filters = [
-        (akfilter1_main, "AKFilter1"),
-        (akfilter2_main, "AKFilter2"),
-        (akfilter3_main, "AKFilter3")
-    ]
-    for func, name in filters:
-        try:
-            logger.info_print(f"PROD: 开始执行 {name}")
-            result = func()
-            logger.info_print(f"PROD: {name} 执行成功")
+# 过滤程序: 无论 AK 序列是否成功都执行 (soft_inputs), 过滤程序之间任一失败则后续跳过
+# 过滤程序会改写 Filter0Out.csv (FilteredBy 标注), AK006 从同一文件读取股票代码 (ma_source_csv),
+# 因此第一个过滤程序等待 AK006 (MA) 结束后再执行
+FILTER_STEPS = [
+    Step("AKFilter1", akfilter1_main, soft_inputs=["main_table_latest", "MA"], outputs=["Filter1Out"]),
+    Step("AKFilter2", akfilter2_main, inputs=["Filter1Out"], soft_inputs=["MA"], outputs=["Filter2Out"]),
+    Step("AKFilter3", akfilter3_main, inputs=["Filter2Out"], soft_inputs=["Gap"], outputs=["Filter3Out"]),
+]
 
-            if result is None or result is False:
-                error_msg = f"PROD: {name} 执行失败"
-                logger.error_print(error_msg)
-                return False
-            
-            logger.info_print(f"PROD: {name} 执行成功")
-        except Exception as e:
-            logger.error_print(f"PROD: {name} 执行过程中发生错误: {str(e)}")
-            return False
-    return True
+# 合并执行 Filter1~3 (Programs.FilterPipeline.enabled): 各数据源只读取一次, 一次性写出全部结果
+PIPELINE_FILTER_STEPS = [
+    Step("AKFilterPipeline", akfilterpipeline_main, soft_inputs=["main_table_latest", "MA", "Gap"],
+         outputs=["Filter1Out", "Filter2Out", "Filter3Out"]),
+]
 
 def main():
     """主函数"""
@@ -82,31 +56,20 @@ def main():
     global logger
     logger = set_log(config, "AK_main.log", prefix="PROD")
     
-    logger.info_print("PROD: 开始执行 AK 程序序列")
-    
+    logger.info_print("PROD: 开始执行 AK 程序序列及过滤程序")
+
     try:
-        # 执行AK序列
-        success_ak_sequence = execute_ak_sequence()
-        if success_ak_sequence:
-            logger.info_print("PROD: 所有 AK 程序执行完成")
+        use_pipeline = config.get('Programs', {}).get('FilterPipeline', {}).get('enabled', False)
+        success = run_steps(config, AK_STEPS + (PIPELINE_FILTER_STEPS if use_pipeline else FILTER_STEPS), logger)
+        if success:
+            logger.info_print("PROD: 所有 AK 程序及过滤程序执行完成")
         else:
-            logger.error_print("PROD: AK 程序序列执行中断")
-            # 不要在这里直接返回，继续执行过滤程序
-        
-        # 无论AK序列是否成功，都执行过滤程序
-        logger.info_print("PROD: 开始执行过滤程序")
-        success_filters = excute_filters()
-        if success_filters:
-            logger.info_print("PROD: 所有过滤程序执行完成")
-        else:
-            logger.error_print("PROD: 过滤程序执行中断")
-        
-        # 只有当两个程序都成功时才返回True
-        return success_ak_sequence and success_filters
-    
+            logger.error_print("PROD: 部分程序执行失败或被跳过")
+        return success
+
     except Exception as e:
         logger.error_print(f"PROD: 执行过程中发生未预期的错误: {str(e)}")
         return False
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
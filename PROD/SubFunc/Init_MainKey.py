@@ -0,0 +1,75 @@
+"""
+为年表 (main_query_table) 建立 (id, date) 主键, 只需执行一次
+1. 按 LIKE 创建新表并添加主键
+2. 旧表数据按 Insrt_time 升序写入新表, 重复的 (id, date) 保留最后写入的一行, Latest 统一为 1
+3. 旧表重命名为 <表名>_bak, 新表替换为年表
+之后 AK004 使用 ON DUPLICATE KEY UPDATE 写入, AK005 自动跳过
+确认无误后可手动删除 <表名>_bak
+"""
+
+import sys
+from CommonFunc.DBconnection import find_config_path, load_config, db_con_pymysql, set_log
+
+COLUMNS = [
+    "date", "id", "open_price", "close_price", "high", "low", "volume", "turnover",
+    "amplitude", "chg_percen", "chg_amount", "turnover_rate", "Insrt_time"
+]
+
+
+def build_keyed_table(config, logger):
+    """复制数据到带主键的新表并替换原表"""
+    table = config["DB_tables"]["main_query_table"]
+    new_table = f"{table}_keyed"
+    bak_table = f"{table}_bak"
+    update_clause = ",\n        ".join(f"{c} = VALUES({c})" for c in COLUMNS if c not in ("id", "date"))
+
+    connection = db_con_pymysql(config)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {new_table}")
+            cursor.execute(f"CREATE TABLE {new_table} LIKE {table}")
+            cursor.execute(f"ALTER TABLE {new_table} MODIFY id varchar(10) NOT NULL, MODIFY date date NOT NULL, "
+                           f"ADD PRIMARY KEY (id, date)")
+            logger.info_print(f"已创建 {new_table} (PRIMARY KEY (id, date))")
+
+            cursor.execute(f"""
+            INSERT INTO {new_table} ({', '.join(COLUMNS)}, Latest)
+            SELECT {', '.join(COLUMNS)}, 1
+            FROM {table}
+            WHERE id IS NOT NULL AND date IS NOT NULL
+            ORDER BY Insrt_time ASC
+            ON DUPLICATE KEY UPDATE
+                {update_clause}
+            """)
+            connection.commit()
+
+            cursor.execute(f"SELECT COUNT(*) AS cnt FROM {table}")
+            old_count = cursor.fetchone()['cnt']
+            cursor.execute(f"SELECT COUNT(*) AS cnt FROM {new_table}")
+            new_count = cursor.fetchone()['cnt']
+            logger.info_print(f"{table}: {old_count} 行 -> {new_table}: {new_count} 行 (已去除重复的 (id, date))")
+
+            cursor.execute(f"RENAME TABLE {table} TO {bak_table}, {new_table} TO {table}")
+            logger.info_print(f"已将 {table} 替换为带主键的新表, 原表保留为 {bak_table}")
+        return True
+    except Exception as e:
+        connection.rollback()
+        logger.error_print(f"建立主键失败: {str(e)}")
+        return False
+    finally:
+        connection.close()
+
+
+def main():
+    env = sys.argv[1] if len(sys.argv) > 1 else "PROD"
+    config_path_QA, config_path_PROD, _ = find_config_path()
+    config = load_config(config_path_QA if env == "QA" else config_path_PROD)
+    logger = set_log(config, "Init_MainKey.log", prefix=env)
+    return build_keyed_table(config, logger)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"处理失败：{str(e)}")
@@ -1,3 +1,7 @@
+"""
+读取 MissedOnes CSV 中的股票代码, 请求指定日期范围内的数据写入 buffer_table
+批量回补中断或部分股票失败时, 请优先使用 python -m PROD.SubFunc.SubAK002 --resume (只重试失败的股票)
+"""
 import pandas as pd
 import akshare as ak
 import sys
@@ -12,6 +16,7 @@ from CommonFunc.DBconnection import (
     set_log,
     find_config_path
 )
+from CommonFunc.bulk_insert import bulk_insert_df
 
 def fetch_stock_codes(csv_file, root_dir, logger):
     """从CSV文件中读取股票代码"""
@@ -101,24 +106,13 @@ def process_single_stock(stock, logger, config, start_date, end_date):
             stock_data["Latest"] = 1
             
             try:
-                with connection.cursor() as cursor:
-                    # 插入数据
-                    for _, row in stock_data.iterrows():
-                        insert_query = f"""
-                        INSERT INTO {config["DB_tables"]["buffer_table"]}
-                        (date, id, open_price, close_price, high, low, volume, turnover, 
-                        amplitude, chg_percen, chg_amount, turnover_rate, Insrt_time, Latest)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        """
-                        values = (
-                            row["date"], row["id"], row["open_price"], row["close_price"], 
-                            row["high"], row["low"], row["volume"], row["turnover"], 
-                            row["amplitude"], row["chg_percen"], row["chg_amount"], 
-                            row["turnover_rate"], row["Insrt_time"], row["Latest"]
-                        )
-                        cursor.execute(insert_query, values)
-                    connection.commit()
-                    return "success"
+                # 批量插入数据
+                bulk_insert_df(connection, config["DB_tables"]["buffer_table"], stock_data[[
+                    "date", "id", "open_price", "close_price", "high", "low", "volume", "turnover",
+                    "amplitude", "chg_percen", "chg_amount", "turnover_rate", "Insrt_time", "Latest"
+                ]], config)
+                connection.commit()
+                return "success"
                     
             except Exception as e:
                 connection.rollback()
@@ -3,120 +3,54 @@
 数据表名为 配置文件中的 "buffer_table"
 用于批量请求长时间范围, 
 !!!!日常更新勿用
+每只股票的完成状态保存在回补任务中 (CommonFunc/backfill_jobs.py), 中断后重新运行会跳过已完成的股票
+只重试失败的股票: python -m PROD.SubFunc.SubAK002 --resume
 '''
 
-import akshare as ak
-import pymysql
 import pandas as pd
 import logging
 import os
-from datetime import datetime
-import time
-from requests.exceptions import SSLError
+import sys
 from CommonFunc.DBconnection import find_config_path
 from CommonFunc.DBconnection import load_config
 from CommonFunc.DBconnection import set_log
-from CommonFunc.DBconnection import db_con_pymysql
+from CommonFunc.backfill_jobs import run_backfill
 
-def check_and_clear_table(connection, table_name):
-    """清空指定表"""
-    try:
-        with connection.cursor() as cursor:
-            cursor.execute(f"TRUNCATE TABLE {table_name}")
-        return True
-    except Exception as e:
-        print(f"PROD: 清空表 {table_name} 时发生错误: {e}")
-        return False
-
-# MySQL 插入数据函数
-def insert_data_to_mysql(config, data):
+def main(resume=False):
     """
-    将数据插入MySQL数据库
+    主函数
     Args:
-        config: 配置信息
-        data: 要插入的数据列表
+        resume: True 时只重试回补任务中失败的股票
     """
-    buffer_table_name = config["DB_tables"]["buffer_table"]
-    connection = db_con_pymysql(config)
-    try:
-        with connection.cursor() as cursor:
-            insert_query = f"""
-            INSERT INTO {buffer_table_name} (
-                date, id, open_price, close_price, high, low, volume, 
-                turnover, amplitude, chg_percen, chg_amount, turnover_rate,
-                Insrt_time, Latest
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), 0)
-            """
-            cursor.executemany(insert_query, data)  # 批量插入数据
-            connection.commit()
-    except Exception as e:
-        logging.error(f"PROD: 数据插入失败: {str(e)}")
-        connection.rollback()
-        raise
-    finally:
-        connection.close()
-
-def fetch_stock_data(stock_code, start_date, end_date):
-    """获取单只股票的数据"""
-    retries = 3
-    while retries > 0:
-        try:
-            stock_data = ak.stock_zh_a_hist(
-                symbol=stock_code,
-                period="daily",
-                start_date=start_date,
-                end_date=end_date,
-                adjust="qfq"
-            )
-            return stock_data if not stock_data.empty else None
-        except SSLError as e:
-            logging.warning(f"PROD: SSL 错误：{e}. 正在重试 {3 - retries + 1} 次...")
-            retries -= 1
-            if retries > 0:
-                time.sleep(3)
-    return None
-
-def main():
-    """主函数"""
     _, config_path_PROD, root_dir = find_config_path()
     config = load_config(config_path_PROD)
-    set_log(config, "AK002.log")
+    logger = set_log(config, "AK002.log", "PROD")
 
     print("PROD: 开始执行数据导入程序...")
 
     try:
-        connection = db_con_pymysql(config)
-        if check_and_clear_table(connection, config["DB_tables"]["buffer_table"]):
-            # 读取股票列表
-            csv_path = os.path.join(root_dir, "PROD", config["CSVs"]["MainCSV"])
-            stock_list_df = pd.read_csv(csv_path, dtype={1: str})
-            stock_codes = stock_list_df.iloc[:, 1].tolist()
-            
-            start_date = config["ProgormInput"]["massive_insrt_start_date"]
-            end_date = config["ProgormInput"]["massive_insrt_end_date"]
-            
-            total_stocks = len(stock_codes)
-            print(f"PROD: 共需处理 {total_stocks} 只股票")
-            
-            # 遍历处理每只股票
-            for idx, stock_code in enumerate(stock_codes, start=1):
-                print(f"PROD: 正在处理 {idx}/{total_stocks}: {stock_code}")
-                data = fetch_stock_data(stock_code, start_date, end_date)
-                if data is not None:
-                    data_to_insert = [
-                        (
-                            row["日期"], row["股票代码"], row["开盘"], row["收盘"], row["最高"],
-                            row["最低"], row["成交量"], row["成交额"], row["振幅"], row["涨跌幅"],
-                            row["涨跌额"], row["换手率"]
-                        )
-                        for _, row in data.iterrows()
-                    ]
-                    insert_data_to_mysql(config, data_to_insert)
-                    print(f"PROD: ✓ {stock_code} 数据入库完成")
-                else:
-                    print(f"PROD: ✗ {stock_code} 数据获取失败")
-
-            print("\nPROD: 所有数据处理完成！")
+        # 读取股票列表
+        csv_path = os.path.join(root_dir, "PROD", config["CSVs"]["MainCSV"])
+        stock_list_df = pd.read_csv(csv_path, dtype={1: str})
+        stock_codes = stock_list_df.iloc[:, 1].tolist()
+        
+        start_date = config["ProgormInput"]["massive_insrt_start_date"]
+        end_date = config["ProgormInput"]["massive_insrt_end_date"]
+        
+        total_stocks = len(stock_codes)
+        print(f"PROD: 共需处理 {total_stocks} 只股票")
+        
+        # 并发请求, 批量写库, 记录每只股票的完成状态
+        def show_progress(stock_code, status):
+            mark = "✓" if status == "success" else "✗"
+            print(f"PROD: {mark} {stock_code} {status}")
+
+        summary = run_backfill(
+            config, stock_codes, start_date, end_date, resume=resume,
+            latest=0, on_status=show_progress, logger=logger
+        )
+        print(f"PROD: 处理结果 {summary}")
+        print("\nPROD: 所有数据处理完成！")
 
     except Exception as e:
         print(f"PROD: 程序执行出错: {str(e)}")
@@ -124,4 +58,4 @@ def main():
         raise
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(resume="--resume" in sys.argv[1:])
@@ -0,0 +1,145 @@
+'''
+手动核对 Triangle_v2 向量化连线搜索与逐条检查的参照实现结果是否一致
+用法: python QMLineCheck.py [--stock 000001] [--limit 500]
+      python QMLineCheck.py --synthetic 500 [--seed 0] [--days 150]
+    --stock: 只核对一只股票
+    --limit: 从 Filter 输入列表中取前 N 只股票核对
+    --synthetic: 不连接数据库, 用固定随机种子生成的合成K线 (benchmarks.synthetic) 核对 N 只股票,
+                 结果可重复, 修改连线搜索后可直接运行; 依次核对所有可用的连线检查实现 (numpy/numba)
+结果不一致的股票会被打印并写入日志, 同时输出两种实现的耗时; 存在不一致时返回码为 1
+'''
+import os
+import sys
+import time
+import logging
+import argparse
+import pandas as pd
+from QA.Programs.Triangle_v2 import ResistanceLineAnalyzer, DataLoader
+from CommonFunc import line_kernels
+from CommonFunc.candle_features import CandleFeatures
+from CommonFunc.DBconnection import find_config_path, load_config, set_log
+
+
+def connection_keys(connections):
+    """把连线记录整理为可直接比较的元组"""
+    return connections.tolist()
+
+
+def check_stock(analyzer, df):
+    """
+    核对一只股票
+
+    Returns:
+        tuple: (是否一致, 向量化耗时, 参照实现耗时, 是否找到连线)
+    """
+    features = CandleFeatures.from_frame(df)
+    base_idx = len(features) - 1
+    base_prices = features.ohlc[base_idx]
+    right_up_points = analyzer._generate_base_day_up_points_np(base_prices, base_idx)
+    right_low_points = analyzer._generate_base_day_low_points_np(base_prices, base_idx)
+
+    start = time.perf_counter()
+    upper = analyzer._analyze_shadow_connections_np(features, right_up_points)
+    lower = analyzer._analyze_lower_connections_np(features, right_low_points)
+    vector_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    upper_ref = analyzer._analyze_shadow_connections_loop(features, right_up_points)
+    lower_ref = analyzer._analyze_lower_connections_loop(features, right_low_points)
+    loop_time = time.perf_counter() - start
+
+    same = (connection_keys(upper) == connection_keys(upper_ref) and
+            connection_keys(lower) == connection_keys(lower_ref))
+    return same, vector_time, loop_time, len(upper_ref) + len(lower_ref) > 0
+
+
+def check_frames(analyzer, frames, logger, label=""):
+    """
+    核对多只股票
+
+    Args:
+        frames (dict): {股票代码: K线 DataFrame}
+
+    Returns:
+        list: 不一致的股票代码
+    """
+    mismatched = []
+    checked = with_lines = 0
+    vector_total = loop_total = 0.0
+    for stock_id, df in frames.items():
+        if len(df) < 3:
+            continue
+        same, vector_time, loop_time, has_lines = check_stock(analyzer, df)
+        checked += 1
+        with_lines += has_lines
+        vector_total += vector_time
+        loop_total += loop_time
+        if not same:
+            mismatched.append(stock_id)
+            logger.error_print(f"{label}{stock_id}: 向量化结果与参照实现不一致")
+
+    logger.info_print(f"{label}核对 {checked} 只股票 (其中 {with_lines} 只有连线), 不一致 {len(mismatched)} 只")
+    logger.info_print(f"{label}向量化耗时 {vector_total:.2f} 秒, 参照实现耗时 {loop_total:.2f} 秒")
+    return mismatched
+
+
+def print_logger():
+    """合成数据核对不读取配置文件, 只打印不写日志"""
+    logger = logging.getLogger("QMLineCheck")
+    logger.info_print = print
+    logger.error_print = lambda message: print(f"错误: {message}")
+    return logger
+
+
+def check_synthetic(n_stocks, days, seed, logger):
+    """用合成K线核对全部可用的连线检查实现, 返回是否全部一致"""
+    from benchmarks.synthetic import SyntheticUniverse
+    universe = SyntheticUniverse(n_stocks, days, seed)
+    frames = {universe.ids[i]: universe.frame(i) for i in range(n_stocks)}
+    analyzer = ResistanceLineAnalyzer()
+
+    backends = ['numpy'] + (['numba'] if line_kernels.HAVE_NUMBA else [])
+    previous = line_kernels.get_backend()
+    try:
+        ok = True
+        for backend in backends:
+            line_kernels.set_backend(backend)
+            ok &= not check_frames(analyzer, frames, logger, label=f"[{backend}] ")
+    finally:
+        line_kernels.set_backend(previous)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='核对向量化连线搜索结果')
+    parser.add_argument('--stock', type=str, help='单个股票代码，例如：000001')
+    parser.add_argument('--limit', type=int, default=500, help='核对的股票数量')
+    parser.add_argument('--synthetic', type=int, help='用 N 只股票的合成K线核对 (不连接数据库)')
+    parser.add_argument('--seed', type=int, default=0, help='合成K线的随机种子')
+    parser.add_argument('--days', type=int, default=150, help='合成K线的天数')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        return check_synthetic(args.synthetic, args.days, args.seed, print_logger())
+
+    config_path_QA, _, root_dir = find_config_path()
+    config = load_config(config_path_QA)
+    logger = set_log(config, "QMLineCheck.log", prefix="QA")
+
+    if args.stock:
+        stock_list = [f"{int(args.stock):06d}"]
+    else:
+        input_csv = os.path.join(root_dir, "QA", config['CSVs']['Filters']['Input'])
+        stock_list = pd.read_csv(input_csv, dtype=str).iloc[:, 1].str.zfill(6).tolist()[:args.limit]
+
+    data_loader = DataLoader()
+    analyzer = ResistanceLineAnalyzer()
+    all_data = data_loader._get_all_stock_data(stock_list)
+
+    mismatched = check_frames(analyzer, all_data, logger)
+    data_loader.close()
+    return not mismatched
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
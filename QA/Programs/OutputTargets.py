@@ -81,7 +81,7 @@ def main():
         
         if not stock_codes:
             logger.warning_print("没有找到符合条件的股票")
-            return
+            return True
         
         # 转换为DataFrame
         df = pd.DataFrame({'Stock Code': stock_codes})
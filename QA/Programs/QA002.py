@@ -11,12 +11,12 @@ import os
 import re
 import datetime
 import json
-import pymysql
 from chinese_calendar import is_workday
 from QA.SubFunc.SubQA002 import main as MasvImprt
 from CommonFunc.DBconnection import find_config_path
 from CommonFunc.DBconnection import load_config
 from CommonFunc.DBconnection import set_log
+from CommonFunc.DBconnection import db_con_pymysql
 
 def last_workday(date, logger):
     '''确定最后一个工作日,只有当非工作日的时候才会调用'''
@@ -186,19 +186,12 @@ def create_table_in_DB(config_path, logger):
             return False
 
     config = load_config(config_path)
-    db_config = {
-        "host": config["DBConnection"]["host"],
-        "user": config["DBConnection"]["user"],
-        "password": config["DBConnection"]["password"],
-        "database": config["DBConnection"]["database"],
-        "cursorclass": pymysql.cursors.DictCursor
-    }
     buffer_table = config["DB_tables"]["buffer_table"]
     
     update_config_date(processing_date, config_path, logger)
     
     try:
-        conn = pymysql.connect(**db_config)
+        conn = db_con_pymysql(config)
         cursor = conn.cursor()
         
         table_name_processing = processing_date.strftime("%b%d")
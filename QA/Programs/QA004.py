@@ -7,6 +7,7 @@ from CommonFunc.DBconnection import (
     set_log,
     find_config_path
 )
+from CommonFunc.bar_store import append_daily_table
 
 def transfer_day_to_main_table(logger):
     '''将数据库中的日表数据写入年表'''
@@ -86,7 +87,9 @@ def transfer_day_to_main_table(logger):
             log_message = f"数据已成功从 {daily_table} --> {main_table}"
             logger.info(log_message)
             print(log_message)
-            return True
+        # 同步追加到本地列式存储, 失败时存储自动失效, 不影响主流程
+        append_daily_table(config, daily_table, last_update_date, logger)
+        return True
     except Exception as e:
         error_message = f"数据转移过程中出错: {str(e)}"
         logger.error(error_message)
@@ -7,6 +7,7 @@ from sqlalchemy.sql import text
 from CommonFunc.DBconnection import (
     load_config,
     db_con_sqlalchemy,
+    release_sqlalchemy,
     set_log,
     find_config_path
 )
@@ -128,7 +129,7 @@ def main():
             logger.error_print(f"处理过程中出现错误: {str(e)}")
             return False
         finally:
-            engine.dispose()
+            release_sqlalchemy(config, engine)
     except Exception as e:
         logger.error_print(f"配置文件读取错误: {str(e)}")
         return False
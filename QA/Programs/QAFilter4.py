@@ -2,7 +2,12 @@ import argparse
 import pandas as pd
 import random
 import os
+import json
+import numpy as np
 from Week_K_v2 import ResistanceLineAnalyzer, DataLoader
+from CommonFunc.candle_features import OHLC_COLUMNS
+from CommonFunc.line_state import IncrementalLineState, WINDOW_BARS, load_line_state
+from CommonFunc.shared_arrays import SharedArrays, attach_arrays, work_units
 from CommonFunc.DBconnection import find_config_path, load_config, set_log, db_con_pymysql
 from QA.Programs.QA002 import is_today_workday, last_workday
 from QA.SubFunc.SubQA001 import save_filter_result
@@ -31,12 +36,22 @@ def process_single_stock(stock_id, data_loader, analyzer, threshold=2.8):
         print(f"处理股票 {stock_id} 时出错: {str(e)}")
         return None, None, False, 0
 
+# 每个子进程只创建一个 DataLoader, 处理多只股票时复用其数据库连接
+_worker_data_loader = None
+
+
+def get_worker_data_loader():
+    """当前进程共用的 DataLoader"""
+    global _worker_data_loader
+    if _worker_data_loader is None:
+        _worker_data_loader = DataLoader()
+    return _worker_data_loader
+
 def process_single_stock_mp(stock_id, threshold=2.8):
     """为多进程设计的处理函数"""
-    data_loader = None
     try:
-        # 在每个进程中创建自己的 DataLoader 和 analyzer
-        data_loader = DataLoader()
+        # 每个进程复用同一个 DataLoader
+        data_loader = get_worker_data_loader()
         analyzer = ResistanceLineAnalyzer()
         
         df = data_loader.get_stock_weekly_data(stock_id)
@@ -55,11 +70,6 @@ def process_single_stock_mp(stock_id, threshold=2.8):
     except Exception as e:
         print(f"处理股票 {stock_id} 时出错: {str(e)}")
         return stock_id, None, None, False, 0
-    
-    finally:
-        # 确保数据库连接被关闭
-        if data_loader and hasattr(data_loader, 'engine'):
-            data_loader.engine.dispose()
 
 def process_single_mode(stock_id, threshold, debug=False):
     """处理单只股票模式"""
@@ -78,36 +88,106 @@ def process_single_mode(stock_id, threshold, debug=False):
     if df is not None and is_qualified and results is not None:
         analyzer.plot(df, stock_id, results, debug=debug, batch_mode=False)
 
-def process_batch_mode(stock_list, threshold, debug=False):
+# 分析窗口 (周) 和增量模式每次读取的最近周数
+WINDOW_WEEKS = 80
+RECENT_WEEKS = 2
+
+
+def load_stock_windows(stock_list, threshold, config):
+    """
+    准备所有股票的周K窗口
+
+    增量模式 (Programs.Filter4.state_mode 为 incremental) 读取上次保存的状态, 只合并每只股票最近 RECENT_WEEKS 周的数据,
+    不在状态中或可能缺少周K的股票再读取完整窗口; 状态不可用或全量模式时读取完整窗口
+
+    Returns:
+        tuple: (IncrementalLineState, 状态文件路径), 全量模式下路径为 None
+    """
+    program_config = config['Programs'].get('Filter4', {})
+    state_path = None
+    if program_config.get('state_mode', 'full') == 'incremental' and program_config.get('state_path'):
+        _, _, root_dir = find_config_path()
+        state_path = os.path.join(root_dir, program_config['state_path'])
+    key = json.dumps({'threshold': threshold}, sort_keys=True)
+    state = load_line_state(state_path, WINDOW_WEEKS, WINDOW_BARS, key)
+    
+    data_loader = DataLoader()
+    try:
+        if state is None:
+            if state_path:
+                logger.info_print("增量状态不可用, 读取完整窗口并重建状态")
+            state = IncrementalLineState(WINDOW_WEEKS, WINDOW_BARS, key)
+            stale = stock_list
+        else:
+            recent = data_loader.get_all_weekly_data(stock_list, weeks=RECENT_WEEKS)
+            if recent is None:
+                raise Exception("批量获取周K数据失败")
+            changed, stale = state.update(recent, stock_list)
+            logger.info_print(f"增量状态: {len(changed)} 只股票窗口有变化, {len(stale)} 只股票重新读取完整窗口")
+        if stale:
+            frames = data_loader.get_all_weekly_data(stale, weeks=WINDOW_WEEKS)
+            if frames is None:
+                raise Exception("批量获取周K数据失败")
+            state.add_frames(frames)
+    finally:
+        data_loader.close()
+    return state, state_path
+
+
+def process_batch_mode(stock_list, threshold, config, debug=False):
     """处理批量股票模式"""
     total_stocks = len(stock_list)
-    stocks_with_lines = []  # 只保留最终有效的股票列表
     
     # 多进程处理
     process_start = time.time()
     max_workers = min(max(1, os.cpu_count() - 1), 8)
+    logger.info_print(f"开始分析 {total_stocks} 只股票，使用 {max_workers} 个进程")
     
-    # 将股票列表分成更大的批次
-    batch_size = max(20, total_stocks // max_workers)
-    stock_batches = [stock_list[i:i + batch_size] for i in range(0, len(stock_list), batch_size)]
+    # 准备所有股票的周K窗口 (增量模式下只读取最近几周), 窗口没有变化的股票沿用上次的结果
+    # 没有周K数据的股票不参与计算, 与单股模式一样视为没有突破形态
+    state, state_path = load_stock_windows(stock_list, threshold, config)
+    ids, rows = state.rows(stock_list)
+    todo = rows[~state.analyzed[rows]]
+    logger.info_print(f"需要重新分析 {len(todo)}/{len(ids)} 只股票")
     
-    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(process_single_stock_mp, stock_id, threshold) 
-                  for stock_id in stock_batches[0]]
-        
-        # 处理结果
-        completed_stocks = 0
-        for future in concurrent.futures.as_completed(futures):
-            completed_stocks += 1
-            print(f"\r处理进度: {completed_stocks}/{total_stocks} "
-                  f"({completed_stocks/total_stocks*100:.1f}%)", end="")
+    # 靠右对齐的价格张量放入共享内存, 子进程按行号区间取数据
+    shared = SharedArrays({'ohlc': state.ohlc[todo], 'lengths': state.lengths(todo), 'dates': state.dates[todo]})
+    codes = np.zeros(len(todo), dtype=np.uint8)
+    
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=init_weekly_worker,
+                initargs=(shared.spec, state.ids[todo].tolist(), threshold)) as executor:
+            futures = [executor.submit(process_weekly_rows, start, stop)
+                       for start, stop in work_units(len(todo), max_workers)]
             
-            stock_id, df, results, _, _ = future.result()
-            if df is not None and results and len(results['connections']) > 0:
-                stocks_with_lines.append(stock_id)
+            # 处理结果
+            completed_stocks = total_stocks - len(todo)
+            for future in concurrent.futures.as_completed(futures):
+                start, chunk_codes = future.result()
+                codes[start:start + len(chunk_codes)] = chunk_codes
+                completed_stocks += len(chunk_codes)
+                print(f"\r处理进度: {completed_stocks}/{total_stocks} "
+                      f"({completed_stocks/total_stocks*100:.1f}%)", end="")
+    finally:
+        shared.close()
+    
+    state.set_codes(todo, codes)
+    codes = state.codes[rows]
+    if state_path:
+        state.save(state_path)
+        logger.info_print(f"\n增量状态已保存至 {os.path.basename(state_path)}")
+    qualified_count = int(np.count_nonzero(codes & RISE_OK))
+    
+    # 按结果代码整理股票列表 (保持输入顺序)
+    stocks_with_lines = [ids[i] for i in np.flatnonzero(codes & HAS_LINES)]
     
     process_time = time.time() - process_start
     logger.info_print(f"\n处理完成, 耗时: {process_time:.2f} 秒")
+    if len(ids) < total_stocks:
+        logger.warning_print(f"{total_stocks - len(ids)} 只股票没有周K数据")
+    logger.info_print(f"涨幅合格: {qualified_count}/{total_stocks}")
     
     # 只显示最终结果的统计
     logger.info_print(f"发现 {len(stocks_with_lines)} 只股票存在周线突破形态 "
@@ -118,6 +198,56 @@ def process_batch_mode(stock_list, threshold, debug=False):
     
     return stocks_with_lines, process_time
 
+# 批量模式每只股票的结果代码 (按位组合)
+RISE_OK = 1      # 涨幅检查通过
+HAS_LINES = 2    # 存在阻力线连线
+
+# 子进程中映射的共享数据, 由 init_weekly_worker 设置
+_worker_shared = None
+
+
+def init_weekly_worker(spec, ids, threshold):
+    """子进程初始化: 映射共享内存中的周K张量"""
+    global _worker_shared
+    shm, arrays = attach_arrays(spec)
+    _worker_shared = (shm, arrays, ids, threshold)
+
+
+def process_weekly_rows(start, stop):
+    """
+    处理共享张量中 [start, stop) 行的股票, 判断条件与 process_single_stock 相同:
+    最新一周涨幅 ≥ threshold 的股票才做阻力线分析
+
+    Returns:
+        tuple: (start, 结果代码数组 uint8)
+    """
+    _, arrays, ids, threshold = _worker_shared
+    ohlc, lengths, dates = arrays['ohlc'], arrays['lengths'], arrays['dates']
+    analyzer = ResistanceLineAnalyzer()
+    
+    # 最新一周都在最后一列, 涨幅一次算完
+    latest = ohlc[start:stop, -1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weekly_change = ((latest[:, 3] - latest[:, 0]) / latest[:, 0]) * 100
+    qualified = weekly_change >= threshold
+    codes = qualified.astype(np.uint8) * RISE_OK
+    
+    depth = ohlc.shape[1]
+    for offset in np.flatnonzero(qualified):
+        row = start + offset
+        stock_id = ids[row]
+        n = int(lengths[row])
+        try:
+            df = pd.DataFrame(ohlc[row, depth - n:], columns=list(OHLC_COLUMNS),
+                              index=pd.DatetimeIndex(dates[row, depth - n:], name='Date'))
+            df.name = stock_id
+            results = analyzer.analyze(df, stock_id)
+            if results and len(results['connections']) > 0:
+                codes[offset] |= HAS_LINES
+        except Exception as e:
+            print(f"处理股票 {stock_id} 时出错: {str(e)}")
+    return start, codes
+
 def plot_sample_stocks(qualified_stocks, threshold, debug=False):
     """绘制样本股票图表"""
     plot_start = time.time()
@@ -244,7 +374,7 @@ def main():
                 
                 # 处理所有股票
                 stocks_with_lines, process_time = process_batch_mode(
-                    stock_list, threshold, args.debug)
+                    stock_list, threshold, config, args.debug)
                 
                 # 计算被过滤掉的股票
                 filtered_out_stocks = list(set(stock_list) - set(stocks_with_lines))
@@ -2,8 +2,13 @@ import argparse
 import pandas as pd
 import random
 import os
+import json
 from QA.Programs.Triangle_v2 import ResistanceLineAnalyzer, DataLoader
+import numpy as np
 from CommonFunc.DBconnection import find_config_path, load_config, set_log, db_con_pymysql
+from CommonFunc.line_records import connections_to_dicts
+from CommonFunc.line_state import IncrementalLineState, WINDOW_DATES, load_line_state
+from CommonFunc.shared_arrays import SharedArrays, attach_arrays, work_units
 from QA.Programs.QA002 import is_today_workday, last_workday
 from QA.SubFunc.SubQA001 import save_filter_result
 import time
@@ -27,15 +32,15 @@ def process_single_stock(stock_id, data_loader, analyzer, debug=False):
         return None
     
     # 检查上边界连线
-    if not results['connections']:
+    if len(results['connections']) == 0:
         return None
         
     # 检查下边界连线
-    if not results['low_connections']:
+    if len(results['low_connections']) == 0:
         return None
     
     # 检查上下边界的对称性
-    if not check_triangle_symmetry(results):
+    if not check_triangle_symmetry(results, df.index.values):
         return None
     
     # 如果通过所有检查，绘制图表
@@ -48,22 +53,23 @@ def process_single_stock(stock_id, data_loader, analyzer, debug=False):
         'results': results
     }
 
-def check_triangle_symmetry(results):
+def check_triangle_symmetry(results, dates):
     """
     检查三角形的对称性
     
     Args:
         results: 分析结果字典
+        dates: K线日期, 与连线中的K线序号对应
     
     Returns:
         bool: 如果三角形足够对称返回True
     """
-    if not results['connections'] or not results['low_connections']:
+    if len(results['connections']) == 0 or len(results['low_connections']) == 0:
         return False
     
     # 获取上下边界的斜率
-    up_slope = calculate_average_slope(results['connections'])
-    low_slope = calculate_average_slope(results['low_connections'])
+    up_slope = calculate_average_slope(results['connections'], dates)
+    low_slope = calculate_average_slope(results['low_connections'], dates)
     
     # 检查斜率的对称性（绝对值应该接近）
     slope_ratio = abs(up_slope / low_slope) if low_slope != 0 else float('inf')
@@ -77,27 +83,33 @@ def check_triangle_symmetry(results):
     
     return True
 
-def calculate_average_slope(connections):
-    """计算连线的平均斜率"""
-    if not connections:
+def calculate_average_slope(connections, dates):
+    """计算连线的平均斜率 (按自然日)"""
+    if len(connections) == 0:
         return 0
     
-    slopes = []
-    for conn in connections:
-        left = conn['left_point']
-        right = conn['right_point']
-        time_diff = (right[1] - left[1]).days
-        if time_diff > 0:
-            slope = (right[0] - left[0]) / time_diff
-            slopes.append(slope)
+    # 只在这里把K线序号换算为日期
+    time_diff = (dates[connections['right_idx']] - dates[connections['left_idx']]).astype('timedelta64[D]').astype(np.int64)
+    valid = time_diff > 0
+    slopes = ((connections['right_price'] - connections['left_price'])[valid] / time_diff[valid]).tolist()
     
     return sum(slopes) / len(slopes) if slopes else 0
 
+# 每个子进程只创建一个 DataLoader, 处理多只股票时复用其数据库连接
+_worker_data_loader = None
+
+
+def get_worker_data_loader():
+    """当前进程共用的 DataLoader"""
+    global _worker_data_loader
+    if _worker_data_loader is None:
+        _worker_data_loader = DataLoader()
+    return _worker_data_loader
+
 def process_single_stock_mp(stock_id, threshold, filter_config):
     """为多进程设计的处理函数"""
-    data_loader = None
     try:
-        data_loader = DataLoader()
+        data_loader = get_worker_data_loader()
         analyzer = ResistanceLineAnalyzer()
         
         df = data_loader.get_stock_data(stock_id)
@@ -129,17 +141,13 @@ def process_single_stock_mp(stock_id, threshold, filter_config):
         has_valid_lines = False
         if is_qualified_rise and is_qualified_low:
             results = analyzer.analyze(df, stock_id)
-            has_valid_lines = bool(results and results['connections'] and results['low_connections'])
+            has_valid_lines = bool(results and len(results['connections']) and len(results['low_connections']))
             
         return stock_id, df, results, is_qualified_rise, is_qualified_low, daily_change, has_valid_lines
         
     except Exception as e:
         print(f"处理股票 {stock_id} 时出错: {str(e)}")
         return stock_id, None, None, False, False, 0, False
-    
-    finally:
-        if data_loader and hasattr(data_loader, 'engine'):
-            data_loader.engine.dispose()
 
 def process_single_mode(stock_id, threshold, config, debug=False):
     """处理单只股票模式"""
@@ -190,9 +198,10 @@ def process_single_mode(stock_id, threshold, config, debug=False):
         
         # 如果开启了调试模式，显示更多细节
         if debug:
-            if results['connections']:
+            if len(results['connections']):
                 print("\n上边界连线详情:")
-                for i, conn in enumerate(results['connections'], 1):
+                connections = connections_to_dicts(results['connections'], df.index, 'left_point_shadow', 'right_up_point')
+                for i, conn in enumerate(connections, 1):
                     left = conn['left_point']
                     right = conn['right_point']
                     print(f"连线 {i}:")
@@ -200,9 +209,10 @@ def process_single_mode(stock_id, threshold, config, debug=False):
                     print(f"  右端点: 价格 {right[0]:.2f} @ {right[1].strftime('%Y-%m-%d')}")
                     print(f"  穿越上影线数量: {conn['crossed_shadows']}")
             
-            if results['low_connections']:
+            if len(results['low_connections']):
                 print("\n下边界连线详情:")
-                for i, conn in enumerate(results['low_connections'], 1):
+                connections = connections_to_dicts(results['low_connections'], df.index, 'left_low_shadow', 'right_low_point')
+                for i, conn in enumerate(connections, 1):
                     left = conn['left_point']
                     right = conn['right_point']
                     print(f"连线 {i}:")
@@ -214,6 +224,54 @@ def process_single_mode(stock_id, threshold, config, debug=False):
     if has_valid_lines:
         analyzer.plot(df, stock_id, results, debug=debug, batch_mode=False)
 
+# 分析窗口 (交易日) 和增量模式每次读取的最近交易日数
+WINDOW_DAYS = 150
+RECENT_DAYS = 5
+
+
+def load_stock_windows(stock_list, config, filter_config):
+    """
+    准备所有股票的分析窗口
+
+    增量模式 (Programs.Filter5.state_mode 为 incremental) 读取上次保存的状态, 只合并最近 RECENT_DAYS 个交易日的K线,
+    不在状态中或可能缺少K线的股票再读取完整窗口; 状态不可用或全量模式时读取完整窗口
+
+    Returns:
+        tuple: (IncrementalLineState, 状态文件路径), 全量模式下路径为 None
+    """
+    program_config = config['Programs']['Filter5']
+    state_path = None
+    if program_config.get('state_mode', 'full') == 'incremental' and program_config.get('state_path'):
+        _, _, root_dir = find_config_path()
+        state_path = os.path.join(root_dir, program_config['state_path'])
+    key = json.dumps(filter_config, sort_keys=True)
+    state = load_line_state(state_path, WINDOW_DAYS, WINDOW_DATES, key)
+    
+    data_loader = DataLoader()
+    try:
+        recent = data_loader._get_all_stock_data(stock_list, days=RECENT_DAYS) if state is not None else {}
+        if not recent:
+            if state_path:
+                logger.info_print("增量状态不可用, 读取完整窗口并重建状态")
+            state = IncrementalLineState(WINDOW_DAYS, WINDOW_DATES, key)
+            frames = data_loader._get_all_stock_data(stock_list, days=WINDOW_DAYS)
+            state.add_frames(frames, latest_bar_date(frames))
+        else:
+            since = min(df.index[0] for df in recent.values())
+            changed, stale = state.update(recent, stock_list, since)
+            if stale:
+                state.add_frames(data_loader._get_all_stock_data(stale, days=WINDOW_DAYS), latest_bar_date(recent))
+            logger.info_print(f"增量状态: {len(changed)} 只股票窗口有变化, {len(stale)} 只股票重新读取完整窗口")
+    finally:
+        data_loader.close()
+    return state, state_path
+
+
+def latest_bar_date(frames):
+    """多只股票中最新的K线日期"""
+    return max((df.index[-1] for df in frames.values() if df is not None and len(df)), default=None)
+
+
 def process_batch_mode(stock_list, threshold, config, debug=False):
     """批量处理模式"""
     total_stocks = len(stock_list)
@@ -223,105 +281,95 @@ def process_batch_mode(stock_list, threshold, config, debug=False):
     max_workers = min(max(1, os.cpu_count() - 1), 8)
     logger.info_print(f"开始分析 {total_stocks} 只股票，使用 {max_workers} 个进程")
     
-    # 预先加载所有数据
-    data_loader = DataLoader()
-    all_stock_data = data_loader._get_all_stock_data(stock_list)
-    data_loader.close()
-    
     # 获取筛选条件配置
     filter_config = config['Programs']['Filter5']['filters']
     
-    # 准备批处理参数
-    stock_data_chunks = []
-    chunk_size = len(stock_list) // max_workers
-    for i in range(0, len(stock_list), chunk_size):
-        chunk = {k: all_stock_data[k] for k in stock_list[i:i+chunk_size] if k in all_stock_data}
-        stock_data_chunks.append((chunk, threshold, filter_config))
+    # 准备所有股票的分析窗口 (增量模式下只读取最近几天的K线), 窗口没有变化的股票沿用上次的结果
+    state, state_path = load_stock_windows(stock_list, config, filter_config)
+    ids, rows = state.rows(stock_list)
+    todo = rows[~state.analyzed[rows]]
+    logger.info_print(f"需要重新分析 {len(todo)}/{len(ids)} 只股票")
+    
+    # 整理为靠右对齐的价格张量, 放入共享内存, 子进程按行号区间取数据, 不再 pickle 价格数据
+    shared = SharedArrays({'ohlc': state.ohlc[todo], 'lengths': state.lengths(todo),
+                           'calendar_days': state.calendar_days(todo)})
+    codes = np.zeros(len(todo), dtype=np.uint8)
     
     # 多进程处理
-    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        for chunk_data in stock_data_chunks:
-            futures.append(executor.submit(process_stock_chunk, *chunk_data))
-        
-        # 收集结果
-        qualified_rise_stocks = []
-        qualified_low_stocks = []
-        stocks_with_lines = []
-        completed_stocks = 0
-        
-        for future in concurrent.futures.as_completed(futures):
-            chunk_results = future.result()
-            completed_stocks += len(chunk_results['processed'])
-            
-            # 直接使用 chunk_results 中的结果
-            qualified_rise_stocks.extend(chunk_results['rise'])
-            qualified_low_stocks.extend(chunk_results['low'])
-            stocks_with_lines.extend(chunk_results['lines'])
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=init_chunk_worker,
+                initargs=(shared.spec, filter_config)) as executor:
+            futures = [executor.submit(process_stock_rows, start, stop)
+                       for start, stop in work_units(len(todo), max_workers)]
             
-            print(f"\r处理进度: {completed_stocks}/{total_stocks} "
-                  f"({completed_stocks/total_stocks*100:.1f}%)", end="")
-        
-        process_time = time.time() - process_start
-        
-        # 打印统计信息
-        logger.info_print(f"\n分析完成，耗时: {process_time:.1f} 秒")
-        logger.info_print(f"涨幅合格: {len(qualified_rise_stocks)}/{total_stocks} ({len(qualified_rise_stocks)/total_stocks*100:.1f}%)")
-        logger.info_print(f"最低价合格: {len(qualified_low_stocks)}/{len(qualified_rise_stocks)} ({len(qualified_low_stocks)/len(qualified_rise_stocks)*100:.1f}%)")
-        logger.info_print(f"Triangle形态: {len(stocks_with_lines)}/{len(qualified_low_stocks)} ({len(stocks_with_lines)/len(qualified_low_stocks)*100:.1f}%)")
-        
-        return qualified_rise_stocks, qualified_low_stocks, stocks_with_lines, process_time
-
-def process_stock_chunk(stock_data_dict, threshold, filter_config):
-    """处理一组股票数据"""
-    analyzer = ResistanceLineAnalyzer()
-    results = {
-        'processed': [],
-        'rise': [],
-        'low': [],
-        'lines': []
-    }
+            completed_stocks = total_stocks - len(todo)
+            for future in concurrent.futures.as_completed(futures):
+                start, chunk_codes = future.result()
+                codes[start:start + len(chunk_codes)] = chunk_codes
+                completed_stocks += len(chunk_codes)
+                print(f"\r处理进度: {completed_stocks}/{total_stocks} "
+                      f"({completed_stocks/total_stocks*100:.1f}%)", end="")
+    finally:
+        shared.close()
     
-    for stock_id, df in stock_data_dict.items():
-        results['processed'].append(stock_id)
-        
-        # 数据量检查（至少3天）
-        if df is None or len(df) < 3:
-            continue
-        
-        # 涨幅条件检查
-        latest_data = df.iloc[-1]
-        daily_change = ((latest_data['close'] - latest_data['open']) / latest_data['open']) * 100
-        
-        if filter_config['rise_check']['enabled']:
-            is_qualified_rise = daily_change < filter_config['rise_check']['threshold']
-            if not is_qualified_rise:
-                continue
-        
-        results['rise'].append(stock_id)
-        
-        # 最低价条件检查
-        is_qualified_low = True  # 默认通过
-        if filter_config['low_price_check']['enabled']:
-            if len(df) >= 3:
-                base_day = df.iloc[-1]
-                base_day_minus_1 = df.iloc[-2]
-                base_day_minus_2 = df.iloc[-3]
-                is_qualified_low = not (base_day['low'] < base_day_minus_2['low'] or 
-                                     base_day_minus_1['low'] < base_day_minus_2['low'])
-        
-        if not is_qualified_low:
-            continue
-            
-        results['low'].append(stock_id)
-        
-        # Triangle分析
-        analysis_results = analyzer.analyze(df, stock_id)
-        if (analysis_results and analysis_results['connections'] 
-            and analysis_results['low_connections']):
-            results['lines'].append(stock_id)
+    state.set_codes(todo, codes)
+    codes = state.codes[rows]
+    if state_path:
+        state.drop_expired()
+        state.save(state_path)
+        logger.info_print(f"\n增量状态已保存至 {os.path.basename(state_path)}")
+    
+    # 按结果代码整理股票列表 (保持输入顺序)
+    qualified_rise_stocks = [ids[i] for i in np.flatnonzero(codes & RISE_OK)]
+    qualified_low_stocks = [ids[i] for i in np.flatnonzero(codes & LOW_OK)]
+    stocks_with_lines = [ids[i] for i in np.flatnonzero(codes & HAS_LINES)]
     
-    return results
+    process_time = time.time() - process_start
+    
+    # 打印统计信息
+    logger.info_print(f"\n分析完成，耗时: {process_time:.1f} 秒")
+    logger.info_print(f"涨幅合格: {len(qualified_rise_stocks)}/{total_stocks} ({len(qualified_rise_stocks)/total_stocks*100:.1f}%)")
+    logger.info_print(f"最低价合格: {len(qualified_low_stocks)}/{len(qualified_rise_stocks)} ({len(qualified_low_stocks)/len(qualified_rise_stocks)*100:.1f}%)")
+    logger.info_print(f"Triangle形态: {len(stocks_with_lines)}/{len(qualified_low_stocks)} ({len(stocks_with_lines)/len(qualified_low_stocks)*100:.1f}%)")
+    
+    return qualified_rise_stocks, qualified_low_stocks, stocks_with_lines, process_time
+
+# 批量模式每只股票的结果代码 (按位组合)
+RISE_OK = 1      # 涨幅检查通过
+LOW_OK = 2       # 最低价检查通过
+HAS_LINES = 4    # 存在上下边界连线
+
+# 子进程中映射的共享数据, 由 init_chunk_worker 设置
+_worker_shared = None
+
+
+def init_chunk_worker(spec, filter_config):
+    """子进程初始化: 映射共享内存中的价格张量"""
+    global _worker_shared
+    shm, arrays = attach_arrays(spec)
+    _worker_shared = (shm, arrays, filter_config)
+
+
+def process_stock_rows(start, stop):
+    """
+    批量处理共享张量中 [start, stop) 行的股票: 涨幅检查、最低价检查和三角形检测一起用 numpy 计算
+
+    Returns:
+        tuple: (start, 结果代码数组 uint8)
+    """
+    _, arrays, filter_config = _worker_shared
+    analyzer = ResistanceLineAnalyzer()
+    rise_threshold = filter_config['rise_check']['threshold'] if filter_config['rise_check']['enabled'] else None
+    batch = analyzer.analyze_batch(
+        arrays['ohlc'][start:stop], arrays['lengths'][start:stop], arrays['calendar_days'][start:stop],
+        rise_threshold=rise_threshold,
+        check_low=filter_config['low_price_check']['enabled']
+    )
+    has_lines = batch['low_ok'] & (batch['upper_lines'] > 0) & (batch['lower_lines'] > 0)
+    codes = (batch['rise_ok'] * RISE_OK) | (batch['low_ok'] * LOW_OK) | (has_lines * HAS_LINES)
+    return start, codes.astype(np.uint8)
 
 def plot_sample_stocks(qualified_stocks, threshold, config, debug=False):
     """绘制样本股票图表"""
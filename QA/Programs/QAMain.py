@@ -1,7 +1,7 @@
 '''
-本程序顺序执行 QA001~QA006
-当且仅当上一个程序执行成功时，才会执行下一个程序
-任何错误都会被记录并导致程序终止
+本程序按依赖关系执行 QA001~QA008、过滤程序及 OutputTargets
+上游程序执行成功后才会执行下游程序, 互不依赖的程序并发执行
+任何错误都会被记录, 依赖失败程序的下游程序会被跳过
 '''
 
 import os
@@ -21,64 +21,35 @@ from QAFilter4 import main as qafilter4_main
 from QAFilter5 import main as qafilter5_main
 from OutputTargets import main as output_targets_to_csv
 from CommonFunc.DBconnection import find_config_path, load_config, set_log
+from CommonFunc.dag_runner import Step, run_steps
 
-def execute_qa_sequence():
-    """按顺序执行QA001~QA006程序"""
-    qa_functions = [
-        (qa001_main, "QA001"), # 获取最新的股票代码列表
-        (qa002_main, "QA002"), # 判断日期,创建新数据表,或者进行批量请求
-        (qa003_main, "QA003"), # 获取最新数据, 并写入到日表中
-        (qa004_main, "QA004"), # 日表 --> 年表
-        (qa005_main, "QA005"), # 更新 Latest 标识符
-        (qa006_main, "QA006"), # 计算MA
-        (qa007_main, "QA007"),  # 更新缺口数据
-        (qa008_main, "QA008")  # 更新周K数据
-    ]
-    
-    for func, name in qa_functions:
-        try:
-            logger.info_print(f"开始执行 {name}")
-            result = func()
-            
-            if result is None or result is False:
-                error_msg = f"{name} 执行失败"
-                logger.error_print(error_msg)
-                return False
-                
-            logger.info_print(f"{name} 执行成功")
-            
-        except Exception as e:
-            error_msg = f"{name} 执行过程中发生错误: {str(e)}"
-            logger.error_print(error_msg)
-            return False
-    
-    return True
+# 每个步骤声明读取和写入的资源, 互不依赖的步骤 (QA006/QA007/QA008/QAFilter1) 并发执行
+QA_STEPS = [
+    Step("QA001", qa001_main, outputs=["stock_list"]),                                  # 获取最新的股票代码列表
+    Step("QA002", qa002_main, inputs=["stock_list"], outputs=["buffer_table"]),         # 判断日期,创建新数据表,或者进行批量请求
+    Step("QA003", qa003_main, inputs=["buffer_table"], outputs=["daily_table"]),        # 获取最新数据, 并写入到日表中
+    Step("QA004", qa004_main, inputs=["daily_table"], outputs=["main_table"]),          # 日表 --> 年表
+    Step("QA005", qa005_main, inputs=["main_table"], outputs=["main_table_latest"]),    # 更新 Latest 标识符
+    Step("QA006", qa006_main, inputs=["main_table_latest"], outputs=["MA"]),            # 计算MA
+    Step("QA007", qa007_main, inputs=["main_table_latest"], outputs=["Gap"]),           # 更新缺口数据
+    Step("QA008", qa008_main, inputs=["main_table_latest"], outputs=["WK"]),            # 更新周K数据
+]
 
-def excute_filters():
-    """执行过滤程序"""
-    filters = [
-        (qafilter1_main, "QAFilter1"),
-        (qafilter2_main, "QAFilter2"),
-        (qafilter3_main, "QAFilter3"),
-        (qafilter4_main, "QAFilter4"),
-        (qafilter5_main, "QAFilter5")
-    ]
-    for func, name in filters:
-        try:
-            logger.info_print(f"QA: 开始执行 {name}")
-            result = func()
-            logger.info_print(f"QA: {name} 执行成功")
+# 过滤程序: 无论 QA 序列是否成功都执行 (soft_inputs), 过滤程序之间任一失败则后续跳过
+# 各过滤程序依次更新 FilterResults 表, 因此彼此之间保持顺序
+# QAFilter3 改写 Filter0Out.csv (FilteredBy 标注), QA006 从同一文件读取股票代码 (ma_source_csv), 因此等待 QA006 (MA) 结束
+FILTER_STEPS = [
+    Step("QAFilter1", qafilter1_main, soft_inputs=["main_table_latest"], outputs=["Filter1Out"]),
+    Step("QAFilter2", qafilter2_main, inputs=["Filter1Out"], soft_inputs=["MA"], outputs=["Filter2Out"]),
+    Step("QAFilter3", qafilter3_main, inputs=["Filter2Out"], soft_inputs=["Gap", "MA"], outputs=["Filter3Out"]),
+    Step("QAFilter4", qafilter4_main, inputs=["Filter3Out"], soft_inputs=["WK"], outputs=["Filter4Out"]),
+    Step("QAFilter5", qafilter5_main, inputs=["Filter4Out"], outputs=["Filter5Out"]),
+]
 
-            if result is None or result is False:
-                error_msg = f"QA: {name} 执行失败"
-                logger.error_print(error_msg)
-                return False
-            
-            logger.info_print(f"QA: {name} 执行成功")
-        except Exception as e:
-            logger.error_print(f"QA: {name} 执行过程中发生错误: {str(e)}")
-            return False
-    return True
+# 无论过滤程序是否成功都输出目标股票
+OUTPUT_STEPS = [
+    Step("OutputTargets", output_targets_to_csv, soft_inputs=["Filter5Out"], outputs=["Targets"]),
+]
 
 def main():
     """主函数"""
@@ -88,37 +59,16 @@ def main():
     global logger
     logger = set_log(config, "QA_main.log", prefix="QA")
     
-    logger.info_print("开始执行 QA 程序序列")
-    
+    logger.info_print("开始执行 QA 程序序列及过滤程序")
+
     try:
-        # 执行QA序列
-        success_qa_sequence = execute_qa_sequence()
-        if success_qa_sequence:
-            logger.info_print("所有 QA 程序执行完成")
+        success = run_steps(config, QA_STEPS + FILTER_STEPS + OUTPUT_STEPS, logger)
+        if success:
+            logger.info_print("所有 QA 程序及过滤程序执行完成")
         else:
-            logger.error_print("QA 程序序列执行中断")
-            # 不要在这里直接返回，继续执行过滤程序
-        
-        # 无论QA序列是否成功，都执行过滤程序
-        logger.info_print("开始执行过滤程序")
-        success_filters = excute_filters()
-        if success_filters:
-            logger.info_print("QA: 所有过滤程序执行完成")
-        else:
-            logger.error_print("QA: 过滤程序执行中断")
-        
-        # 执行output_targets_to_csv
-        logger.info_print("开始执行output_targets_to_csv")
-        try:
-            output_targets_to_csv()
-            logger.info_print("output_targets_to_csv 执行成功")
-        except Exception as e:
-            logger.error_print(f"output_targets_to_csv 执行过程中发生错误: {str(e)}")
-            return False
-        
-        # 只有当所有程序都成功时才返回True
-        return success_qa_sequence and success_filters
-    
+            logger.error_print("QA: 部分程序执行失败或被跳过")
+        return success
+
     except Exception as e:
         logger.error_print(f"QA: 执行过程中发生未预期的错误: {str(e)}")
         return False
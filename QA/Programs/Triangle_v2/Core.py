@@ -1,23 +1,67 @@
 import numpy as np
+from CommonFunc import line_kernels
+from CommonFunc.candle_features import CandleFeatures
+from CommonFunc.line_records import make_points, make_connections
+from .LineSearch import search_lines, count_lines_batch, right_points_batch, UPPER, LOWER
+
+# 批量分析时单次计算的连线张量元素数上限 (股票数 × 右侧点 × 左侧点 × 天数)
+BATCH_MAX_ELEMENTS = 1 << 20
+
+# analyze_batch 返回的每只股票结果
+BATCH_RESULT_DTYPE = np.dtype([
+    ('daily_change', 'f8'),    # 最后一天涨幅 (%)
+    ('rise_ok', '?'),          # 涨幅检查通过
+    ('low_ok', '?'),           # 最低价检查通过
+    ('upper_lines', 'i2'),     # 上边界连线数量
+    ('lower_lines', 'i2'),     # 下边界连线数量
+])
+
+
+def stack_stock_frames(stock_data, stock_ids=None):
+    """
+    把多只股票的 DataFrame 整理为靠右对齐的价格张量
+
+    Args:
+        stock_data (dict): {stock_id: DataFrame}, 索引为日期, 包含 open/high/low/close 列
+        stock_ids (list): 股票顺序, 默认为 stock_data 的顺序
+
+    Returns:
+        tuple: (ids, ohlc (S, D, 4), lengths (S,), calendar_days (S, D))
+    """
+    ids = [i for i in (stock_ids or list(stock_data)) if stock_data.get(i) is not None]
+    depth = max((len(stock_data[i]) for i in ids), default=0)
+    ohlc = np.full((len(ids), depth, 4), np.nan)
+    lengths = np.zeros(len(ids), dtype=np.int64)
+    calendar_days = np.zeros((len(ids), depth), dtype=np.int64)
+    for row, stock_id in enumerate(ids):
+        df = stock_data[stock_id]
+        n = len(df)
+        if n == 0:
+            continue
+        lengths[row] = n
+        ohlc[row, depth - n:] = df[['open', 'high', 'low', 'close']].to_numpy(dtype=np.float64)
+        dates = df.index.values
+        calendar_days[row, depth - n:] = (dates[-1] - dates).astype('timedelta64[D]').astype(np.int64)
+    return ids, ohlc, lengths, calendar_days
 
 class ResistanceLineAnalyzer:
     """使用基于base week实体的阻力线分析方法"""
     
     def analyze(self, df, stock_id):
-        """分析股票的阻力线"""
+        """
+        分析股票的阻力线
+
+        Returns:
+            dict: 点和连线均以K线序号表示 (POINT_DTYPE / CONNECTION_DTYPE 结构化数组),
+                  输出时用 CommonFunc.line_records 换算为日期
+        """
         # 检查数据量是否足够
         if len(df) < 3:
             return None
         
-        # 将DataFrame转换为numpy数组以提高性能
-        prices = np.array([
-            df['open'].values,
-            df['high'].values,
-            df['low'].values,
-            df['close'].values
-        ]).T  # shape: (n_days, 4)
-        
-        dates = df.index.values
+        # K线特征只计算一次, 上下边界连线共用
+        features = CandleFeatures.from_frame(df)
+        prices = features.ohlc  # shape: (n_days, 4)
         
         # 获取最近三天的数据
         base_day_idx = len(prices) - 1
@@ -31,30 +75,72 @@ class ResistanceLineAnalyzer:
             return None
         
         # 生成右侧点
-        right_up_points = self._generate_base_day_up_points_np(
-            base_prices, dates[base_day_idx])
+        right_up_points = self._generate_base_day_up_points_np(base_prices, base_day_idx)
         
         # 分析连线
-        connections = self._analyze_shadow_connections_np(
-            prices, dates, right_up_points)
+        connections = self._analyze_shadow_connections_np(features, right_up_points)
         
         # 生成右侧下边界点
-        right_low_points = self._generate_base_day_low_points_np(
-            base_prices, dates[base_day_idx])
+        right_low_points = self._generate_base_day_low_points_np(base_prices, base_day_idx)
         
         # 分析下边界连线
-        low_connections = self._analyze_lower_connections_np(
-            prices, dates, right_low_points)
+        low_connections = self._analyze_lower_connections_np(features, right_low_points)
         
         return {
             'connections': connections,
             'right_up_points': right_up_points,
             'low_connections': low_connections,
             'right_low_points': right_low_points,
-            'base_day': df.iloc[-1],
-            'boundary_day': df.iloc[0]
+            'base_idx': base_day_idx,
+            'boundary_idx': 0
         }
     
+    def analyze_batch(self, ohlc, lengths, calendar_days, rise_threshold=None, check_low=True,
+                      max_elements=BATCH_MAX_ELEMENTS):
+        """
+        批量分析多只股票: 涨幅检查、最低价检查、上下边界连线检测全部用 numpy 掩码一起计算
+        每只股票的连线数量与逐只调用 analyze 的结果相同
+
+        Args:
+            ohlc (np.ndarray): (S, D, 4) 靠右对齐的 open/high/low/close, 见 stack_stock_frames
+            lengths (np.ndarray): (S,) 每只股票的有效天数
+            calendar_days (np.ndarray): (S, D) 每天距最后一天的自然日天数
+            rise_threshold (float): 最后一天涨幅须小于该值 (%), None 表示不检查
+            check_low (bool): 是否做最低价检查
+            max_elements (int): 单次计算的连线张量元素数上限, 超出时按股票分块
+
+        Returns:
+            np.ndarray: (S,) BATCH_RESULT_DTYPE 结构化数组
+        """
+        S, D, _ = ohlc.shape
+        lengths = np.asarray(lengths)
+        result = np.zeros(S, dtype=BATCH_RESULT_DTYPE)
+        if S == 0 or D < 3:
+            return result
+
+        enough = lengths >= 3
+        base, minus_1, minus_2 = ohlc[:, -1], ohlc[:, -2], ohlc[:, -3]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result['daily_change'] = ((base[:, 3] - base[:, 0]) / base[:, 0]) * 100
+            rise_ok = enough if rise_threshold is None else enough & (result['daily_change'] < rise_threshold)
+            # analyze 中的最低价条件, 不满足时没有连线
+            low_cond = ~((base[:, 2] < minus_2[:, 2]) | (minus_1[:, 2] < minus_2[:, 2]))
+        result['rise_ok'] = rise_ok
+        result['low_ok'] = rise_ok & (low_cond if check_low else True)
+
+        todo = np.flatnonzero(result['low_ok'] & low_cond & (lengths > 7))
+        if len(todo) == 0:
+            return result
+
+        features = CandleFeatures(ohlc[todo])
+        right_up = right_points_batch(features.ohlc[:, -1], UPPER)
+        right_low = right_points_batch(features.ohlc[:, -1], LOWER)
+        result['upper_lines'][todo] = count_lines_batch(
+            features, lengths[todo], right_up, UPPER, max_elements=max_elements)
+        result['lower_lines'][todo] = count_lines_batch(
+            features, lengths[todo], right_low, LOWER, calendar_days[todo], max_elements=max_elements)
+        return result
+
     def _generate_base_day_up_points(self, base_day):
         """
         在最后一个交易日生成右侧上边界点
@@ -352,8 +438,8 @@ class ResistanceLineAnalyzer:
         
         return right_low_points
     
-    def _generate_base_day_up_points_np(self, base_prices, base_date):
-        """使用numpy生成右侧上边界点"""
+    def _generate_base_day_up_points_np(self, base_prices, base_idx):
+        """使用numpy生成右侧上边界点 (POINT_DTYPE 结构化数组)"""
         open_price, high, low, close = base_prices
         body_high = max(open_price, close)
         body_low = min(open_price, close)
@@ -365,7 +451,7 @@ class ResistanceLineAnalyzer:
         max_x = (1.1 * body_low - body_high) / 2.1
         
         if max_x <= 0:
-            return []
+            return make_points([], base_idx)
         
         # 使用max_x的一定比例作为实际使用的x值
         x = max_x * 0.5
@@ -378,27 +464,36 @@ class ResistanceLineAnalyzer:
         
         # 使用numpy生成均匀分布的点
         prices = np.linspace(body_high, upper_boundary, num_points + 1)[1:]
-        
-        # 转换为(price, date, name)元组列表
-        return [(float(price), base_date, f'right_up_point{i+1}') 
-                for i, price in enumerate(prices)]
+        return make_points(prices, base_idx)
     
-    def _analyze_shadow_connections_np(self, prices, dates, right_up_points):
-        """使用numpy分析连线"""
+    def _analyze_shadow_connections_np(self, features, right_up_points):
+        """使用numpy分析连线 (所有候选连线一次性向量化计算)"""
+        found = search_lines(features, right_up_points['price'], UPPER)
+        return self._make_connection_records(found, right_up_points)
+
+    def _make_connection_records(self, found, right_points):
+        """把 search_lines 的结果整理为 CONNECTION_DTYPE 结构化数组"""
+        return make_connections([
+            (day_idx, left_price, segment, right_points[r]['idx'], right_points[r]['price'], right_points[r]['no'], crossed)
+            for r, day_idx, left_price, segment, crossed in found])
+
+    def _analyze_shadow_connections_loop(self, features, right_up_points):
+        """逐条检查连线 (向量化版本的参照实现, 用于结果核对)"""
+        prices = features.ohlc
         if len(prices) <= 7:
-            return []
+            return make_connections([])
         
         # 获取基础数据
         base_day_idx = len(prices) - 1
-        base_date = dates[base_day_idx]
         
         connections = []
-        used_dates = set()
+        used_days = set()
         
-        for right_price, right_date, right_name in right_up_points:
+        for right_point in right_up_points:
+            right_idx, right_price, right_no = int(right_point['idx']), float(right_point['price']), int(right_point['no'])
             # 只遍历到base day前7天
             for day_idx in range(len(prices) - 7):
-                if dates[day_idx] in used_dates:
+                if day_idx in used_days:
                     continue
                 
                 # 使用numpy计算左侧点
@@ -426,106 +521,65 @@ class ResistanceLineAnalyzer:
                 # 生成上影线上的点
                 if shadow_length > 0:
                     shadow_points = np.linspace(curr_body_high, curr_prices[1], num_segments + 1)[1:]  # 移除实体上边界点
-                    potential_points = [
-                        (float(price), dates[day_idx], f"left_point_shadow{i+1}")
-                        for i, price in enumerate(shadow_points)
-                    ]
+                    potential_points = [(float(price), i + 1) for i, price in enumerate(shadow_points)]
                 else:
                     potential_points = []  # 如果没有上影线，则没有候选点
                 
                 found_valid_point = False
-                for left_price, left_date, left_name in potential_points:
+                for left_price, left_no in potential_points:
                     # 使用numpy进行穿越检查
                     if not self._check_line_crosses_body_np(
-                        prices, dates, left_date, left_price, 
-                        right_date, right_price):
+                        prices, day_idx, left_price, right_idx, right_price):
                         continue
                     
                     shadow_count = self._count_crossed_shadows_np(
-                        prices, dates, left_date, left_price,
-                        right_date, right_price, base_date)
+                        prices, day_idx, left_price, right_idx, right_price, base_day_idx)
                     
                     if shadow_count >= 3:
-                        connections.append({
-                            'left_point': (left_price, left_date, left_name),
-                            'right_point': (right_price, right_date, right_name),
-                            'crossed_shadows': shadow_count
-                        })
+                        connections.append(
+                            (day_idx, left_price, left_no, right_idx, right_price, right_no, shadow_count))
                         found_valid_point = True
-                        used_dates.add(dates[day_idx])
+                        used_days.add(day_idx)
                         break
                 
                 if found_valid_point:
                     break
         
-        return connections
+        return make_connections(connections)
     
-    def _check_line_crosses_body_np(self, prices, dates, left_date, left_price, right_date, right_price):
-        """使用numpy检查连线是否穿过实体"""
-        left_idx = np.where(dates == left_date)[0][0]
-        right_idx = np.where(dates == right_date)[0][0]
-        
-        between_prices = prices[left_idx+1:right_idx]
-        if len(between_prices) == 0:
-            return True
-        
-        days = np.arange(1, len(between_prices) + 1)
-        total_days = right_idx - left_idx
-        
-        # 计算斜率和连线价格
-        daily_slope = (right_price - left_price) / total_days
-        line_prices = left_price + (daily_slope * days)
-        
-        # 计算实体上边界
-        body_high = np.maximum(between_prices[:, 0], between_prices[:, 3])
-        
-        # 计算扩展量（与原版本一致：斜率的绝对值）
-        y_extension = 1 * abs(daily_slope)
-        
-        # 修改判断标准：如果连线价格低于任何实体上边界加上扩展量，则认为穿过了实体
-        extended_body_high = body_high + y_extension
-        return not np.any(line_prices <= extended_body_high)
+    def _check_line_crosses_body_np(self, prices, left_idx, left_price, right_idx, right_price):
+        """使用numpy检查连线是否穿过实体, 位置均为K线序号"""
+        return line_kernels.line_crosses_body(prices, left_idx, left_price, right_idx, right_price, upper=True)
     
-    def _count_crossed_shadows_np(self, prices, dates, left_date, left_price, right_date, right_price, base_date):
-        """使用numpy计算穿越的上影线数量"""
-        # 获取日期索引
-        left_idx = np.where(dates == left_date)[0][0]
-        right_idx = np.where(dates == right_date)[0][0]
-        base_idx = np.where(dates == base_date)[0][0]
-        
-        # 获取两点之间的所有K线
-        between_prices = prices[left_idx+1:min(right_idx, base_idx)]
-        if len(between_prices) == 0:
-            return 0
-        
-        # 计算连线方程
-        days = np.arange(1, len(between_prices) + 1)
-        total_days = right_idx - left_idx
-        line_prices = left_price + ((right_price - left_price) / total_days) * days
-        
-        # 计算实体上边界和上影线
-        body_high = np.maximum(between_prices[:, 0], between_prices[:, 3])
-        
-        # 一次性计算所有穿越点
-        crosses = (line_prices >= body_high) & (line_prices <= between_prices[:, 1])
-        return np.sum(crosses)
+    def _count_crossed_shadows_np(self, prices, left_idx, left_price, right_idx, right_price, base_idx):
+        """使用numpy计算穿越的上影线数量, 位置均为K线序号"""
+        return line_kernels.count_crossed_shadows(prices, left_idx, left_price, right_idx, right_price,
+                                                  base_idx, upper=True)
     
-    def _analyze_lower_connections_np(self, prices, dates, right_low_points):
-        """使用numpy分析下边界连线"""
+    def _analyze_lower_connections_np(self, features, right_low_points):
+        """使用numpy分析下边界连线 (所有候选连线一次性向量化计算)"""
+        dates = features.dates
+        calendar_days = (dates[-1] - dates).astype('timedelta64[D]').astype(np.int64)
+        found = search_lines(features, right_low_points['price'], LOWER, calendar_days)
+        return self._make_connection_records(found, right_low_points)
+
+    def _analyze_lower_connections_loop(self, features, right_low_points):
+        """逐条检查下边界连线 (向量化版本的参照实现, 用于结果核对)"""
+        prices, dates = features.ohlc, features.dates
         if len(prices) <= 7:
-            return []
+            return make_connections([])
         
         # 获取基础数据
         base_day_idx = len(prices) - 1
-        base_date = dates[base_day_idx]
         
         connections = []
-        used_dates = set()
+        used_days = set()
         
-        for right_price, right_date, right_name in right_low_points:
+        for right_point in right_low_points:
+            right_idx, right_price, right_no = int(right_point['idx']), float(right_point['price']), int(right_point['no'])
             # 只遍历到base day前7天
             for day_idx in range(len(prices) - 7):
-                if dates[day_idx] in used_dates:
+                if day_idx in used_days:
                     continue
                 
                 # 使用numpy计算左侧点
@@ -553,17 +607,14 @@ class ResistanceLineAnalyzer:
                 # 生成下影线上的点
                 if shadow_length > 0:
                     shadow_points = np.linspace(curr_body_low, curr_prices[2], num_segments + 1)[1:]  # 移除实体下边界点
-                    potential_points = [
-                        (float(price), dates[day_idx], f"left_low_shadow{i+1}")
-                        for i, price in enumerate(shadow_points)
-                    ]
+                    potential_points = [(float(price), i + 1) for i, price in enumerate(shadow_points)]
                 else:
                     potential_points = []  # 如果没有下影线，则没有候选点
                 
                 found_valid_point = False
-                for left_price, left_date, left_name in potential_points:
-                    # 计算斜率
-                    time_diff = (right_date - left_date).astype('timedelta64[D]').astype(np.int64)
+                for left_price, left_no in potential_points:
+                    # 计算斜率 (按自然日)
+                    time_diff = (dates[right_idx] - dates[day_idx]).astype('timedelta64[D]').astype(np.int64)
                     if time_diff == 0:
                         continue
                         
@@ -575,31 +626,26 @@ class ResistanceLineAnalyzer:
                     
                     # 继续其他检查
                     if not self._check_line_crosses_body_from_below_np(
-                        prices, dates, left_date, left_price, 
-                        right_date, right_price):
+                        prices, day_idx, left_price, right_idx, right_price):
                         continue
                     
                     shadow_count = self._count_crossed_lower_shadows_np(
-                        prices, dates, left_date, left_price,
-                        right_date, right_price, base_date)
+                        prices, day_idx, left_price, right_idx, right_price, base_day_idx)
                     
                     if shadow_count >= 3:
-                        connections.append({
-                            'left_point': (left_price, left_date, left_name),
-                            'right_point': (right_price, right_date, right_name),
-                            'crossed_shadows': shadow_count
-                        })
+                        connections.append(
+                            (day_idx, left_price, left_no, right_idx, right_price, right_no, shadow_count))
                         found_valid_point = True
-                        used_dates.add(dates[day_idx])
+                        used_days.add(day_idx)
                         break
                 
                 if found_valid_point:
                     break
         
-        return connections
+        return make_connections(connections)
     
-    def _generate_base_day_low_points_np(self, base_prices, base_date):
-        """使用numpy生成右侧下边界点"""
+    def _generate_base_day_low_points_np(self, base_prices, base_idx):
+        """使用numpy生成右侧下边界点 (POINT_DTYPE 结构化数组)"""
         open_price, high, low, close = base_prices
         body_high = max(open_price, close)
         body_low = min(open_price, close)
@@ -611,7 +657,7 @@ class ResistanceLineAnalyzer:
         max_x = (1.1 * body_low - body_high) / 2.1
         
         if max_x <= 0:
-            return []
+            return make_points([], base_idx)
         
         # 使用max_x的一定比例作为实际使用的x值
         x = max_x * 0.5
@@ -624,57 +670,13 @@ class ResistanceLineAnalyzer:
         
         # 使用numpy生成均匀分布的点
         prices = np.linspace(body_low, lower_boundary, num_points + 1)[1:]
-        
-        # 转换为(price, date, name)元组列表
-        return [(float(price), base_date, f'right_low_point{i+1}') 
-                for i, price in enumerate(prices)]
+        return make_points(prices, base_idx)
     
-    def _check_line_crosses_body_from_below_np(self, prices, dates, left_date, left_price, right_date, right_price):
-        """使用numpy检查连线是否从下方穿过实体"""
-        left_idx = np.where(dates == left_date)[0][0]
-        right_idx = np.where(dates == right_date)[0][0]
-        
-        between_prices = prices[left_idx+1:right_idx]
-        if len(between_prices) == 0:
-            return True
-        
-        days = np.arange(1, len(between_prices) + 1)
-        total_days = right_idx - left_idx
-        
-        # 计算斜率和连线价格
-        daily_slope = (right_price - left_price) / total_days
-        line_prices = left_price + (daily_slope * days)
-        
-        # 计算实体下边界
-        body_low = np.minimum(between_prices[:, 0], between_prices[:, 3])
-        
-        # 计算扩展量（与原版本一致：斜率的绝对值）
-        y_extension = 1 * abs(daily_slope)
-        
-        # 修改判断标准：如果连线价格高于任何实体下边界减去扩展量，则认为穿过了实体
-        extended_body_low = body_low - y_extension
-        return not np.any(line_prices >= extended_body_low)
+    def _check_line_crosses_body_from_below_np(self, prices, left_idx, left_price, right_idx, right_price):
+        """使用numpy检查连线是否从下方穿过实体, 位置均为K线序号"""
+        return line_kernels.line_crosses_body(prices, left_idx, left_price, right_idx, right_price, upper=False)
     
-    def _count_crossed_lower_shadows_np(self, prices, dates, left_date, left_price, right_date, right_price, base_date):
-        """使用numpy计算穿越的下影线数量"""
-        # 获取日期索引
-        left_idx = np.where(dates == left_date)[0][0]
-        right_idx = np.where(dates == right_date)[0][0]
-        base_idx = np.where(dates == base_date)[0][0]
-        
-        # 获取两点之间的所有K线
-        between_prices = prices[left_idx+1:min(right_idx, base_idx)]
-        if len(between_prices) == 0:
-            return 0
-        
-        # 计算连线方程
-        days = np.arange(1, len(between_prices) + 1)
-        total_days = right_idx - left_idx
-        line_prices = left_price + ((right_price - left_price) / total_days) * days
-        
-        # 计算实体下边界和下影线
-        body_low = np.minimum(between_prices[:, 0], between_prices[:, 3])
-        
-        # 修改判断标准：连线价格在下影线和实体下边界之间
-        crosses = (line_prices >= between_prices[:, 2]) & (line_prices < body_low)
-        return np.sum(crosses)
\ No newline at end of file
+    def _count_crossed_lower_shadows_np(self, prices, left_idx, left_price, right_idx, right_price, base_idx):
+        """使用numpy计算穿越的下影线数量, 位置均为K线序号"""
+        return line_kernels.count_crossed_shadows(prices, left_idx, left_price, right_idx, right_price,
+                                                  base_idx, upper=False)
\ No newline at end of file
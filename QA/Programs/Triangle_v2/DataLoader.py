@@ -4,8 +4,10 @@ from CommonFunc.DBconnection import (
     find_config_path,
     load_config,
     set_log,
-    db_con_sqlalchemy
+    db_con_sqlalchemy,
+    release_sqlalchemy
 )
+from CommonFunc.bar_store import open_bar_store
 from functools import lru_cache
 
 class DataLoader:
@@ -26,16 +28,14 @@ class DataLoader:
         # 读取DEBUG配置
         self.debug = self.config.get('Programs', {}).get('Triangle_Analyzer', {}).get('DEBUG', False)
         self._cache = {}
-    
-    def __del__(self):
-        """析构函数，确保数据库连接被关闭"""
-        if hasattr(self, 'engine'):
-            self.engine.dispose()
+        
+        # 本地K线存储, 未启用、未建立或未更新到最新交易日时为None, 回退到数据库查询
+        self.store = open_bar_store(self.config, self.config['DBinput']['last_update_date'])
     
     def close(self):
-        """显式关闭数据库连接"""
+        """显式关闭数据库连接 (启用连接池时 engine 由进程共享, 不关闭)"""
         if hasattr(self, 'engine'):
-            self.engine.dispose()
+            release_sqlalchemy(self.config, self.engine)
     
     @lru_cache(maxsize=1000)
     def get_stock_data(self, stock_id, days=150):
@@ -48,8 +48,25 @@ class DataLoader:
             self._cache[stock_id] = df
         return df
     
+    def _format_store_frame(self, stock_df, stock_id):
+        """将本地存储的数据整理为与数据库查询一致的格式"""
+        if stock_df is None:
+            return None
+        stock_df = stock_df.dropna(subset=['open'])
+        if stock_df.empty:
+            return None
+        stock_df['wkn'] = None
+        stock_df = stock_df.reindex(columns=['wkn', 'open', 'high', 'low', 'close'])
+        stock_df.name = stock_id
+        return stock_df
+    
     def _get_stock_data_from_db(self, stock_id, days=150):
         """获取指定股票的K线数据"""
+        if self.store is not None:
+            return self._format_store_frame(
+                self.store.get_frame(stock_id, days=days, columns=('open', 'high', 'low', 'close')),
+                stock_id
+            )
         try:
             # 修改SQL查询，避免使用不支持的语法
             query = text("""
@@ -172,6 +189,19 @@ class DataLoader:
     
     def _get_all_stock_data(self, stock_list, days=150):
         """一次性获取所有股票数据"""
+        if self.store is not None:
+            dates = self.store.recent_dates(days, stock_list)
+            if len(dates) == 0:
+                return {}
+            result = {}
+            for stock_id in stock_list:
+                stock_df = self._format_store_frame(
+                    self.store.get_frame(stock_id, start_date=dates[0], columns=('open', 'high', 'low', 'close')),
+                    stock_id
+                )
+                if stock_df is not None:
+                    result[stock_id] = stock_df
+            return result
         try:
             # 构建更兼容的批量查询
             stock_ids_str = ','.join([f"'{id}'" for id in stock_list])
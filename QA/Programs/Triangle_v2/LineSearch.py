@@ -0,0 +1,336 @@
+"""
+向量化的连线搜索
+把一只股票所有 (右侧点 × 左侧影线点) 的候选连线放在一个张量中一次计算:
+    line[r, j, t] = 左侧价格 + 斜率 * (t - 左侧位置)
+再用掩码只保留左右两点之间的K线, 同时得到 "是否穿过实体" 和 "穿越影线数量"
+最后按原循环的顺序 (右侧点依次处理, 左侧按日期、影线分段从前到后) 选出每个右侧点的第一条有效连线,
+已被使用的日期不再作为后续右侧点的左侧点
+计算时用区间界剪枝 (CommonFunc.line_kernels.line_bounds), 跳过必然穿过实体或穿越影线数量不足的连线
+计算式与 Core 中逐条检查的写法保持一致, 结果完全相同
+单只股票的计算在安装了 numba 时由 CommonFunc.line_kernels 的编译内核完成
+"""
+
+import numpy as np
+from CommonFunc import line_kernels
+from CommonFunc.candle_features import MAX_SEGMENTS
+
+UPPER = 'upper'
+LOWER = 'lower'
+
+# 最后 7 天不作为左侧点
+RIGHT_MARGIN = 7
+MIN_CROSSED_SHADOWS = 3
+
+
+def shadow_candidates(features, side):
+    """
+    生成所有可作为左侧点的影线分段点
+
+    Args:
+        features (CandleFeatures): 一只股票的K线特征
+        side (str): UPPER 为上影线, LOWER 为下影线
+
+    Returns:
+        tuple: (day_idx, left_prices, segment), segment 从 1 开始, 按日期、分段顺序排列
+    """
+    body_edge, shadow_end, segments = features.edge(side == UPPER)
+    idx = np.flatnonzero(segments[:max(0, len(features) - RIGHT_MARGIN)])
+    num_segments = segments[idx]
+    points = linspace_tail(body_edge[idx], shadow_end[idx], num_segments, MAX_SEGMENTS)   # (days, 8)
+    valid = np.arange(1, MAX_SEGMENTS + 1)[None, :] <= num_segments[:, None]
+    segment = np.broadcast_to(np.arange(1, MAX_SEGMENTS + 1), points.shape)[valid]
+    return (np.repeat(idx, num_segments).astype(np.int64),
+            points[valid],
+            segment.astype(np.int64))
+
+
+def evaluate_lines(prices, right_prices, day_idx, left_prices, side, alive=None, bounds=None):
+    """
+    计算所有候选连线 (安装 numba 时使用编译内核, 见 CommonFunc.line_kernels)
+
+    Args:
+        prices (np.ndarray): (n_days, 4)
+        right_prices (np.ndarray): (R,) 右侧点价格, 右侧点均位于最后一天
+        day_idx, left_prices (np.ndarray): (J,) 左侧点位置和价格
+        side (str): UPPER / LOWER
+        alive (np.ndarray): (R, J) False 的连线不计算
+        bounds (tuple): 剪枝用的区间界 (line_kernels.line_bounds), None 表示不剪枝
+
+    Returns:
+        tuple: (body_ok, crossed), 形状均为 (R, J); crossed 只在 body_ok 为 True 时有意义
+    """
+    return line_kernels.evaluate_lines(prices, right_prices, day_idx, left_prices, side == UPPER, alive, bounds)
+
+
+def lower_slope_ok(right_prices, left_prices, time_diff):
+    """下边界斜率 (按自然日计算) 必须大于 0.01, 形状为 (..., R, J)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (right_prices[..., :, None] - left_prices[..., None, :]) / time_diff[..., None, :]
+    return (time_diff != 0)[..., None, :] & (slope > 0.01)
+
+
+def select_lines(valid, day_idx):
+    """
+    按原循环的顺序为每个右侧点选出第一条有效连线, 已使用的日期不再使用
+
+    Args:
+        valid (np.ndarray): (R, J) 布尔矩阵
+        day_idx (np.ndarray): (J,) 左侧点位置
+
+    Returns:
+        list: [(r, j)]
+    """
+    selected = []
+    used = np.zeros(len(day_idx), dtype=bool)
+    for r in range(valid.shape[0]):
+        candidates = np.flatnonzero(valid[r] & ~used)
+        if len(candidates) == 0:
+            continue
+        j = candidates[0]
+        selected.append((r, j))
+        used |= day_idx == day_idx[j]
+    return selected
+
+
+def search_lines(features, right_prices, side, calendar_days=None, min_crossed=MIN_CROSSED_SHADOWS, prune=True):
+    """
+    搜索一只股票的上边界或下边界连线
+
+    Args:
+        features (CandleFeatures): 一只股票的K线特征
+        right_prices (list): 右侧点价格 (按处理顺序)
+        side (str): UPPER / LOWER
+        calendar_days (np.ndarray): (n_days,) 每天距最后一天的自然日天数, 仅下边界斜率检查使用
+        min_crossed (int): 最少穿越影线数量
+        prune (bool): 是否先剪枝, 结果相同
+
+    Returns:
+        list: [(右侧点序号, 左侧点位置, 左侧点价格, 影线分段, 穿越影线数量)]
+    """
+    if len(features) <= RIGHT_MARGIN or len(right_prices) == 0:
+        return []
+    day_idx, left_prices, segment = shadow_candidates(features, side)
+    if len(day_idx) == 0:
+        return []
+
+    right_prices = np.asarray(right_prices, dtype=np.float64)
+    bounds = line_kernels.line_bounds(features.ohlc, side == UPPER, min_crossed) if prune else None
+    # 下边界斜率 (按自然日计算) 必须大于 0.01, 不满足的连线不需要计算
+    alive = lower_slope_ok(right_prices, left_prices, calendar_days[day_idx]) if side == LOWER else None
+
+    body_ok, crossed = evaluate_lines(features.ohlc, right_prices, day_idx, left_prices, side, alive, bounds)
+    valid = body_ok & (crossed >= min_crossed)
+
+    return [(r, int(day_idx[j]), float(left_prices[j]), int(segment[j]), int(crossed[r, j]))
+            for r, j in select_lines(valid, day_idx)]
+
+
+# ---------- 多只股票批量计算 ----------
+# 价格张量为 (stocks, days, 4), 每只股票的数据靠右对齐 (最后一天都在 days - 1), 前部用 nan 填充
+
+MAX_RIGHT_POINTS = 6
+
+
+def linspace_tail(start, stop, num, width):
+    """
+    逐元素等价于 np.linspace(start, stop, num + 1)[1:], start/stop/num 可为数组
+
+    Returns:
+        np.ndarray: (..., width), 超出 num 的位置为 nan
+    """
+    start = np.asarray(start, dtype=np.float64)[..., None]
+    stop = np.asarray(stop, dtype=np.float64)[..., None]
+    num = np.asarray(num)[..., None]
+    k = np.arange(1, width + 1, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        values = k * ((stop - start) / num) + start
+    values = np.where(k == num, stop, values)
+    return np.where(k <= num, values, np.nan)
+
+
+def right_points_batch(base_prices, side):
+    """
+    批量生成右侧点价格, 与 Core._generate_base_day_*_points_np 一致
+
+    Args:
+        base_prices (np.ndarray): (S, 4) 最后一天的 open/high/low/close
+
+    Returns:
+        np.ndarray: (S, MAX_RIGHT_POINTS), 无右侧点的位置为 nan
+    """
+    open_price, close = base_prices[:, 0], base_prices[:, 3]
+    body_high = np.maximum(open_price, close)
+    body_low = np.minimum(open_price, close)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        chg_percen = ((close - open_price) / open_price) * 100
+        max_x = (1.1 * body_low - body_high) / 2.1
+        x = max_x * 0.5
+        num_points = np.maximum(1, np.trunc((10 - np.abs(chg_percen)) / 2)) + 1
+    num_points = np.where(np.isfinite(num_points), num_points, 0).astype(np.int64)
+    if side == UPPER:
+        points = linspace_tail(body_high, body_high + x, num_points, MAX_RIGHT_POINTS)
+    else:
+        points = linspace_tail(body_low, body_low - x, num_points, MAX_RIGHT_POINTS)
+    points[~(max_x > 0)] = np.nan
+    return points
+
+
+def shadow_candidates_batch(features, lengths, side):
+    """
+    批量生成左侧影线分段点, 每只股票的候选点按日期、分段顺序排在前面
+
+    Args:
+        features (CandleFeatures): (S, D) 靠右对齐的K线特征
+        lengths (np.ndarray): (S,) 每只股票的有效天数
+
+    Returns:
+        tuple: (day_idx, left_prices, segment, valid), 形状均为 (S, J)
+    """
+    S, D = features.high.shape
+    body_edge, shadow_end, segments = features.edge(side == UPPER)
+
+    t = features.day_index
+    in_range = (t[None, :] >= D - lengths[:, None]) & (t[None, :] < D - RIGHT_MARGIN)
+    num_segments = np.where(in_range, segments, 0)
+
+    points = linspace_tail(body_edge, shadow_end, num_segments, MAX_SEGMENTS)   # (S, D, 8)
+    valid = ~np.isnan(points)
+    valid &= (num_segments > 0)[:, :, None]
+
+    # 把有效候选点按原顺序移到前面
+    flat_valid = valid.reshape(S, -1)
+    order = np.argsort(~flat_valid, axis=1, kind='stable')
+    width = max(1, int(flat_valid.sum(axis=1).max()))
+    order = order[:, :width]
+    rows = np.arange(S)[:, None]
+    day_idx = np.broadcast_to(t[:, None], (D, MAX_SEGMENTS)).reshape(-1)[order]
+    segment = np.broadcast_to(np.arange(1, MAX_SEGMENTS + 1), (D, MAX_SEGMENTS)).reshape(-1)[order]
+    left_prices = points.reshape(S, -1)[rows, order]
+    valid = flat_valid[rows, order]
+    return day_idx, left_prices, segment, valid
+
+
+def _prune_candidates_batch(features, right_prices, side, calendar_days, day_idx, left_prices, cand_valid,
+                            min_crossed):
+    """
+    批量剪枝: 对所有右侧点都必然无效的左侧点从候选中去掉, 其余候选点保持原顺序移到前面
+
+    Returns:
+        tuple: (day_idx, left_prices, cand_valid), 形状均为 (S, J)
+    """
+    upper = side == UPPER
+    bounds = line_kernels.line_bounds(features.ohlc, upper, min_crossed)
+    if side == LOWER:
+        time_diff = np.take_along_axis(calendar_days, day_idx, axis=1)
+    useful = np.zeros(cand_valid.shape, dtype=bool)
+    # 逐个右侧点计算, 避免生成 (S, R, J) 的临时数组
+    for r in range(right_prices.shape[1]):
+        right = right_prices[:, r:r + 1]
+        alive = line_kernels.prune_lines(bounds, right, day_idx, left_prices, upper)
+        if side == LOWER:
+            alive &= lower_slope_ok(right, left_prices, time_diff)
+        useful |= alive[:, 0, :] & ~np.isnan(right)
+    cand_valid = cand_valid & useful
+    order = np.argsort(~cand_valid, axis=1, kind='stable')
+    return (np.take_along_axis(day_idx, order, axis=1),
+            np.take_along_axis(left_prices, order, axis=1),
+            np.take_along_axis(cand_valid, order, axis=1))
+
+
+def _count_lines_chunk(features, right_prices, side, calendar_days, day_idx, left_prices, cand_valid, min_crossed):
+    """计算一组股票的连线数量, 候选点已按股票整理为 (S, J)"""
+    S, D = features.high.shape
+    right_idx = D - 1
+
+    total_days = (right_idx - day_idx).astype(np.float64)                                  # (S, J)
+    slope = (right_prices[:, :, None] - left_prices[:, None, :]) / total_days[:, None, :]  # (S, R, J)
+
+    t = np.arange(D)
+    days = t[None, None, :] - day_idx[:, :, None]                                          # (S, J, D)
+    between = ((days > 0) & (t < right_idx))[:, None, :, :]
+    line = left_prices[:, None, :, None] + slope[:, :, :, None] * days[:, None, :, :]      # (S, R, J, D)
+
+    extension = np.abs(slope)[:, :, :, None]
+
+    with np.errstate(invalid='ignore'):
+        if side == UPPER:
+            body_high = features.body_high[:, None, None, :]
+            touches_body = line <= body_high + extension
+            in_shadow = (line >= body_high) & (line <= features.high[:, None, None, :])
+        else:
+            body_low = features.body_low[:, None, None, :]
+            touches_body = line >= body_low - extension
+            in_shadow = (line >= features.low[:, None, None, :]) & (line < body_low)
+
+    body_ok = ~np.any(touches_body & between, axis=3)
+    crossed = np.sum(in_shadow & between, axis=3)
+    valid = body_ok & (crossed >= min_crossed) & cand_valid[:, None, :] & ~np.isnan(right_prices)[:, :, None]
+
+    if side == LOWER:
+        valid &= lower_slope_ok(right_prices, left_prices, np.take_along_axis(calendar_days, day_idx, axis=1))
+
+    # 与 select_lines 相同的选择顺序, 同时处理所有股票
+    counts = np.zeros(S, dtype=np.int64)
+    rows = np.arange(S)
+    used = np.zeros(day_idx.shape, dtype=bool)
+    for r in range(right_prices.shape[1]):
+        available = valid[:, r, :] & ~used
+        found = available.any(axis=1)
+        chosen_day = day_idx[rows, available.argmax(axis=1)]
+        used |= found[:, None] & (day_idx == chosen_day[:, None])
+        counts += found
+    return counts
+
+
+def count_lines_batch(features, lengths, right_prices, side, calendar_days=None,
+                      min_crossed=MIN_CROSSED_SHADOWS, max_elements=1 << 20, prune=True):
+    """
+    批量搜索连线, 返回每只股票找到的连线数量 (与逐只调用 search_lines 的结果数量相同)
+
+    股票按候选连线数排序后分块计算, 每块只保留块内需要的右侧点和左侧点列数, 减少填充带来的无效计算
+
+    Args:
+        features (CandleFeatures): (S, D) 靠右对齐的K线特征
+        lengths (np.ndarray): (S,) 每只股票的有效天数
+        right_prices (np.ndarray): (S, R) 右侧点价格, nan 表示无此点
+        side (str): UPPER / LOWER
+        calendar_days (np.ndarray): (S, D) 每天距最后一天的自然日天数, 下边界使用
+        max_elements (int): 单块连线张量 (股票 × 右侧点 × 左侧点 × 天数) 的元素数上限
+        prune (bool): 是否先剪枝去掉必然无效的左侧点, 结果相同
+
+    Returns:
+        np.ndarray: (S,) 连线数量
+    """
+    S, D = features.high.shape
+    counts = np.zeros(S, dtype=np.int64)
+    if S == 0 or D <= RIGHT_MARGIN:
+        return counts
+    day_idx, left_prices, _, cand_valid = shadow_candidates_batch(features, lengths, side)
+    if prune:
+        day_idx, left_prices, cand_valid = _prune_candidates_batch(
+            features, right_prices, side, calendar_days, day_idx, left_prices, cand_valid, min_crossed)
+    n_right = (~np.isnan(right_prices)).sum(axis=1)
+    n_left = cand_valid.sum(axis=1)
+    todo = np.flatnonzero((n_right > 0) & (n_left > 0) & (lengths > RIGHT_MARGIN))
+    # 候选连线少的股票排在前面, 同一块内的股票规模相近
+    todo = todo[np.argsort(n_right[todo] * n_left[todo], kind='stable')]
+
+    start = 0
+    while start < len(todo):
+        # 按块内最大规模确定块大小
+        stop = start + 1
+        width_r, width_j = int(n_right[todo[start]]), int(n_left[todo[start]])
+        while stop < len(todo):
+            next_r = max(width_r, int(n_right[todo[stop]]))
+            next_j = max(width_j, int(n_left[todo[stop]]))
+            if (stop + 1 - start) * next_r * next_j * D > max_elements:
+                break
+            width_r, width_j = next_r, next_j
+            stop += 1
+        rows = todo[start:stop]
+        counts[rows] = _count_lines_chunk(
+            features.take(rows), right_prices[rows, :width_r], side,
+            None if calendar_days is None else calendar_days[rows],
+            day_idx[rows, :width_j], left_prices[rows, :width_j], cand_valid[rows, :width_j], min_crossed)
+        start = stop
+    return counts
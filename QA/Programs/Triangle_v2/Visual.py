@@ -4,6 +4,7 @@ import matplotlib.dates as mdates
 import numpy as np
 from datetime import timedelta
 import pandas as pd
+from CommonFunc.line_records import points_to_tuples, connections_to_dicts
 
 def plot_analysis_results(df, analysis_results, stock_id=None, debug=False, batch_mode=False):
     """
@@ -11,7 +12,7 @@ def plot_analysis_results(df, analysis_results, stock_id=None, debug=False, batc
     
     Args:
         df (pandas.DataFrame): 股票数据
-        analysis_results (dict): 分析结果，包含right_up_points等信息
+        analysis_results (dict): 分析结果，包含right_up_points等信息, 点和连线的位置为K线序号
         stock_id (str): 股票代码
         debug (bool): 是否显示调试信息
         batch_mode (bool): 是否为批量处理模式
@@ -33,12 +34,12 @@ def plot_analysis_results(df, analysis_results, stock_id=None, debug=False, batc
     def find_intersection_point(upper_line, lower_line):
         """计算两条直线的交点"""
         # 上边界直线的两点
-        x1, y1 = df.index.get_loc(upper_line['left_point'][1]), upper_line['left_point'][0]
-        x2, y2 = df.index.get_loc(upper_line['right_point'][1]), upper_line['right_point'][0]
+        x1, y1 = upper_line['left_idx'], upper_line['left_price']
+        x2, y2 = upper_line['right_idx'], upper_line['right_price']
         
         # 下边界直线的两点
-        x3, y3 = df.index.get_loc(lower_line['left_point'][1]), lower_line['left_point'][0]
-        x4, y4 = df.index.get_loc(lower_line['right_point'][1]), lower_line['right_point'][0]
+        x3, y3 = lower_line['left_idx'], lower_line['left_price']
+        x4, y4 = lower_line['right_idx'], lower_line['right_price']
         
         # 计算直线斜率和截距
         k1 = (y2 - y1) / (x2 - x1)
@@ -58,29 +59,21 @@ def plot_analysis_results(df, analysis_results, stock_id=None, debug=False, batc
     
     def extend_lines_to_intersection(ax, upper_connections, lower_connections):
         """延伸直线到交点"""
-        if not upper_connections or not lower_connections:
+        if len(upper_connections) == 0 or len(lower_connections) == 0:
             return
         
         # 先绘制原始的线段
-        for conn in upper_connections:
-            left = conn['left_point']
-            right = conn['right_point']
-            left_idx = df.index.get_loc(left[1])
-            right_idx = df.index.get_loc(right[1])
-            ax.plot([left_idx, right_idx], 
-                   [left[0], right[0]], 
+        for i, conn in enumerate(upper_connections):
+            ax.plot([conn['left_idx'], conn['right_idx']], 
+                   [conn['left_price'], conn['right_price']], 
                    'gray', alpha=LINE_ALPHA, linewidth=LINE_WIDTH,
-                   label='Upper Triangle Line' if conn == upper_connections[0] else "")
+                   label='Upper Triangle Line' if i == 0 else "")
         
-        for conn in lower_connections:
-            left = conn['left_point']
-            right = conn['right_point']
-            left_idx = df.index.get_loc(left[1])
-            right_idx = df.index.get_loc(right[1])
-            ax.plot([left_idx, right_idx], 
-                   [left[0], right[0]], 
+        for i, conn in enumerate(lower_connections):
+            ax.plot([conn['left_idx'], conn['right_idx']], 
+                   [conn['left_price'], conn['right_price']], 
                    'gray', alpha=LINE_ALPHA, linewidth=LINE_WIDTH,
-                   label='Lower Triangle Line' if conn == lower_connections[0] else "")
+                   label='Lower Triangle Line' if i == 0 else "")
         
         # 然后尝试延伸到交点
         for upper_conn in upper_connections:
@@ -89,20 +82,20 @@ def plot_analysis_results(df, analysis_results, stock_id=None, debug=False, batc
                 if intersection:
                     x_intersect, y_intersect = intersection
                     
-                    # 获取原始点的索引
-                    upper_right_idx = df.index.get_loc(upper_conn['right_point'][1])
-                    lower_right_idx = df.index.get_loc(lower_conn['right_point'][1])
+                    # 原始右端点的位置
+                    upper_right_idx = upper_conn['right_idx']
+                    lower_right_idx = lower_conn['right_idx']
                     
                     # 只绘制从右端点到交点的延伸部分
                     if x_intersect > max(upper_right_idx, lower_right_idx):
                         # 延伸上边界线
                         ax.plot([upper_right_idx, x_intersect],
-                               [upper_conn['right_point'][0], y_intersect],
+                               [upper_conn['right_price'], y_intersect],
                                'gray', alpha=LINE_ALPHA, linewidth=LINE_WIDTH)
                         
                         # 延伸下边界线
                         ax.plot([lower_right_idx, x_intersect],
-                               [lower_conn['right_point'][0], y_intersect],
+                               [lower_conn['right_price'], y_intersect],
                                'gray', alpha=LINE_ALPHA, linewidth=LINE_WIDTH)
     
     if batch_mode:
@@ -123,17 +116,15 @@ def plot_analysis_results(df, analysis_results, stock_id=None, debug=False, batc
         
         # 绘制右侧上边点
         if 'right_up_points' in analysis_results:
-            for price, date, name in analysis_results['right_up_points']:
-                idx = df.index.get_loc(date)
-                ax.plot(idx, price, 'b.', markersize=POINT_SIZE, alpha=POINT_ALPHA)
+            for point in analysis_results['right_up_points']:
+                ax.plot(point['idx'], point['price'], 'b.', markersize=POINT_SIZE, alpha=POINT_ALPHA)
         
         # 绘制右侧下边点
         if 'right_low_points' in analysis_results:
             if debug:
                 print(f"Drawing {len(analysis_results['right_low_points'])} lower right points")
-            for price, date, name in analysis_results['right_low_points']:
-                idx = df.index.get_loc(date)
-                ax.plot(idx, price, 'b.', markersize=POINT_SIZE, alpha=POINT_ALPHA)
+            for point in analysis_results['right_low_points']:
+                ax.plot(point['idx'], point['price'], 'b.', markersize=POINT_SIZE, alpha=POINT_ALPHA)
         elif debug:
             print("No right_low_points found in analysis_results")
             print("Keys in analysis_results:", analysis_results.keys())
@@ -158,17 +149,15 @@ def plot_analysis_results(df, analysis_results, stock_id=None, debug=False, batc
         
         # 绘制右侧上边点
         if 'right_up_points' in analysis_results:
-            for price, date, name in analysis_results['right_up_points']:
-                idx = df.index.get_loc(date)
-                ax1.plot(idx, price, 'b.', markersize=POINT_SIZE, alpha=POINT_ALPHA, 
-                        label='Upper Right Points' if name == 'right_up_point1' else "")
+            for point in analysis_results['right_up_points']:
+                ax1.plot(point['idx'], point['price'], 'b.', markersize=POINT_SIZE, alpha=POINT_ALPHA, 
+                        label='Upper Right Points' if point['no'] == 1 else "")
         
         # 绘制右侧下边点
         if 'right_low_points' in analysis_results:
-            for price, date, name in analysis_results['right_low_points']:
-                idx = df.index.get_loc(date)
-                ax1.plot(idx, price, 'b.', markersize=POINT_SIZE, alpha=POINT_ALPHA,
-                        label='Lower Right Points' if name == 'right_low_point1' else "")
+            for point in analysis_results['right_low_points']:
+                ax1.plot(point['idx'], point['price'], 'b.', markersize=POINT_SIZE, alpha=POINT_ALPHA,
+                        label='Lower Right Points' if point['no'] == 1 else "")
         
         # 延伸直线到交点
         extend_lines_to_intersection(ax1, analysis_results['connections'], 
@@ -198,14 +187,18 @@ def print_analysis_results(df, analysis_results, debug=False):
         print("\n三角形形态分析:")
         print(f"最新交易日收盘价: {df.iloc[-1]['close']:.2f}")
         print(f"三角形顶点:")
-        for price, date, name in analysis_results['right_points']:
+        right_points = (points_to_tuples(analysis_results['right_up_points'], df.index, 'right_up_point') +
+                        points_to_tuples(analysis_results['right_low_points'], df.index, 'right_low_point'))
+        for price, date, name in right_points:
             print(f"{name}: {price:.2f} @ {date.strftime('%Y-%m-%d')}")
         
         print(f"\n符合条件的三角形边数量: {len(analysis_results['connections'])}")
         
         # 只打印前5个连线示例
         print("\n三角形边示例（前5个）:")
-        for i, conn in enumerate(analysis_results['connections'][:5]):
+        connections = connections_to_dicts(analysis_results['connections'][:5], df.index,
+                                           'left_point_shadow', 'right_up_point')
+        for i, conn in enumerate(connections):
             left = conn['left_point']
             right = conn['right_point']
             print(f"边 {i+1}: {left[2]} ({left[0]:.2f} @ {left[1].strftime('%Y-%m-%d')}) "
@@ -1,4 +1,4 @@
-from .Core import ResistanceLineAnalyzer
+from .Core import ResistanceLineAnalyzer, stack_stock_frames
 from .DataLoader import DataLoader
 
-__all__ = ['ResistanceLineAnalyzer', 'DataLoader']
\ No newline at end of file
+__all__ = ['ResistanceLineAnalyzer', 'DataLoader', 'stack_stock_frames']
\ No newline at end of file
@@ -1,5 +1,11 @@
 import numpy as np
 from scipy.signal import find_peaks as scipy_find_peaks
+from CommonFunc import line_kernels
+from CommonFunc.candle_features import CandleFeatures
+from CommonFunc.line_records import make_points, make_connections
+
+# 连线至少连续穿越的上影线数量
+MIN_CROSSED_SHADOWS = 3
 
 class ResistanceLineAnalyzer:
     """使用基于base week实体的阻力线分析方法"""
@@ -13,41 +19,35 @@ class ResistanceLineAnalyzer:
             stock_id (str): 股票代码
             
         Returns:
-            dict: 分析结果，包含连线、波峰等信息
+            dict: 分析结果，包含连线、波峰等信息; 点、连线和波峰均以K线序号表示
+                  (POINT_DTYPE / CONNECTION_DTYPE 结构化数组), 输出时用 CommonFunc.line_records 换算为日期
         """
-        # 将DataFrame转换为numpy数组以提高性能
-        prices = np.array([
-            df['open'].values,
-            df['high'].values,
-            df['low'].values,
-            df['close'].values
-        ]).T  # shape: (n_weeks, 4)
-        
-        dates = df.index.values
+        # K线特征只计算一次
+        features = CandleFeatures.from_frame(df)
+        prices = features.ohlc  # shape: (n_weeks, 4)
         
         # 计算波峰 - 使用scipy的find_peaks
         peaks, _ = scipy_find_peaks(prices[:, 1], prominence=0.01)  # 使用high列
-        peak_dates = dates[peaks]
         peak_prices = prices[peaks, 1]
         
         # 在base week实体上生成right points
-        right_points = self._generate_base_week_points_np(prices[-1], dates[-1])
+        base_week_idx = len(prices) - 1
+        right_points = self._generate_base_week_points_np(prices[-1], base_week_idx)
         
         # 分析连线
-        connections = self._analyze_shadow_connections_np(prices, dates, right_points)
+        connections = self._analyze_shadow_connections_np(features, right_points)
         
         return {
             'connections': connections,
             'right_points': right_points,
             'peaks': peaks,
-            'peak_dates': peak_dates,
             'peak_prices': peak_prices,
-            'base_week': df.iloc[-1],
-            'boundary_week': df.iloc[0]
+            'base_idx': base_week_idx,
+            'boundary_idx': 0
         }
     
-    def _generate_base_week_points_np(self, base_prices, base_date):
-        """使用numpy生成基准周的点"""
+    def _generate_base_week_points_np(self, base_prices, base_idx):
+        """使用numpy生成基准周的点 (POINT_DTYPE 结构化数组)"""
         open_price, high, low, close = base_prices
         body_high = max(open_price, close)
         body_low = min(open_price, close)
@@ -62,19 +62,30 @@ class ResistanceLineAnalyzer:
         
         # 合并所有点
         prices = np.concatenate([below_points, body_points])
-        right_points = [(float(price), base_date, f'right_point{i+1}') 
-                       for i, price in enumerate(prices)]
-        
-        return right_points
+        return make_points(prices, base_idx)
     
-    def _analyze_shadow_connections_np(self, prices, dates, right_points):
-        """使用numpy分析连线"""
+    def _analyze_shadow_connections_np(self, features, right_points, prune=True):
+        """
+        使用numpy分析连线, 位置均为K线序号
+
+        prune 为 True 时先用区间界 (CommonFunc.line_kernels.prune_lines) 跳过必然穿过实体
+        或连续穿越影线不足的左侧点, 找到的连线与逐个检查完全相同
+        """
+        prices = features.ohlc
         if len(prices) <= 1:
-            return []
+            return make_connections([])
+        
+        # 有效影线和每周的左侧点只计算一次, 所有右侧点共用
+        n_weeks = len(prices) - 1
+        valid_shadow = self._is_valid_shadow_np(features.upper_shadow, features.body_high, features.body_low)[:n_weeks]
+        left_points = self._generate_left_points_np(features.body_high[:n_weeks], features.high[:n_weeks])
+        if prune:
+            bounds = line_kernels.line_bounds(prices, True, MIN_CROSSED_SHADOWS)
+            left_weeks = np.repeat(np.arange(n_weeks), left_points.shape[1])
         
         connections = []
-        used_weeks = set()
-        base_date = dates[-1]
+        used_weeks = np.zeros(n_weeks, dtype=bool)
+        base_week_idx = len(prices) - 1
         
         # 重新排序right_points
         total_points = len(right_points)
@@ -82,49 +93,39 @@ class ResistanceLineAnalyzer:
         reordered_indices = self._get_reordered_indices(total_points, middle)
         
         for idx in reordered_indices:
-            right_price, right_date, right_name = right_points[idx]
+            right_point = right_points[idx]
+            right_idx, right_price, right_no = int(right_point['idx']), float(right_point['price']), int(right_point['no'])
             
-            # 遍历从boundary到base week之前的每一周
-            for week_idx in range(len(prices) - 1):
-                if dates[week_idx] in used_weeks:
-                    continue
-                
-                # 获取left points
-                curr_prices = prices[week_idx]
-                curr_body_high = max(curr_prices[0], curr_prices[3])
-                curr_body_low = min(curr_prices[0], curr_prices[3])
-                shadow_length = curr_prices[1] - curr_body_high
-                
-                if not self._is_valid_shadow_np(shadow_length, curr_body_high, curr_body_low):
-                    continue
-                
-                # 生成left points
-                left_points = self._generate_left_points_np(
-                    curr_prices, dates[week_idx], shadow_length)
-                
+            # 从boundary到base week之前的每一周, 跳过已使用的周和无效影线
+            alive = np.broadcast_to((valid_shadow & ~used_weeks)[:, None], left_points.shape)
+            if prune:
+                alive = alive & line_kernels.prune_lines(
+                    bounds, [right_price], left_weeks, left_points.ravel()).reshape(left_points.shape)
+            
+            for week_idx in np.flatnonzero(alive.any(axis=1)):
+                week_idx = int(week_idx)
                 found_valid_point = False
-                for left_price, left_date, left_name in left_points:
+                for left_no in np.flatnonzero(alive[week_idx]) + 1:
+                    left_no = int(left_no)
+                    left_price = float(left_points[week_idx, left_no - 1])
                     if not self._check_line_crosses_body_np(
-                        prices, dates, left_date, left_price, right_date, right_price):
+                        prices, week_idx, left_price, right_idx, right_price):
                         continue
                     
                     shadow_count = self._count_crossed_shadows_np(
-                        prices, dates, left_date, left_price, right_date, right_price, base_date)
+                        prices, week_idx, left_price, right_idx, right_price, base_week_idx)
                     
-                    if shadow_count >= 3:
-                        connections.append({
-                            'left_point': (left_price, left_date, left_name),
-                            'right_point': (right_price, right_date, right_name),
-                            'crossed_shadows': shadow_count
-                        })
+                    if shadow_count >= MIN_CROSSED_SHADOWS:
+                        connections.append(
+                            (week_idx, left_price, left_no, right_idx, right_price, right_no, shadow_count))
                         found_valid_point = True
-                        used_weeks.add(dates[week_idx])
+                        used_weeks[week_idx] = True
                         break
                 
                 if found_valid_point:
                     break
         
-        return connections
+        return make_connections(connections)
     
     def plot(self, df, stock_id, results, debug=False, batch_mode=False):
         """
@@ -145,75 +146,32 @@ class ResistanceLineAnalyzer:
         # 将打印函数移到这里
     
     def _is_valid_shadow_np(self, shadow_length, body_high, body_low):
-        """检查影线是否有效"""
-        if shadow_length <= 0:
-            return False
-            
+        """检查影线是否有效 (参数可以是数组, 逐周判断)"""
         body_height = body_high - body_low
-        if body_height > 0:
-            return shadow_length >= body_height * 0.2
-        else:
-            return shadow_length >= (body_high - body_low) * 0.1
+        # 有实体时影线至少为实体高度的 20%, 十字星只要求有影线
+        return (shadow_length > 0) & ~((body_height > 0) & (shadow_length < body_height * 0.2))
     
-    def _generate_left_points_np(self, prices, date, shadow_length):
-        """生成左侧点"""
-        body_high = max(prices[0], prices[3])
+    def _generate_left_points_np(self, body_high, high):
+        """
+        生成左侧点价格, 编号从 1 开始依次对应 left_point1..5
+
+        Args:
+            body_high, high (np.ndarray): (n_weeks,) 实体上沿和最高价
+
+        Returns:
+            np.ndarray: (n_weeks, 5), 每周的值与逐周调用 np.linspace 相同
+        """
         num_segments = 4
-        points = np.linspace(body_high, prices[1], num_segments + 1)
-        return [(float(price), date, f"left_point{i+1}") 
-                for i, price in enumerate(points)]
+        return np.linspace(body_high, high, num_segments + 1, axis=-1)
     
-    def _check_line_crosses_body_np(self, prices, dates, left_date, left_price, 
-                                  right_date, right_price):
-        """使用numpy检查连线是否穿过实体"""
-        left_idx = np.where(dates == left_date)[0][0]
-        right_idx = np.where(dates == right_date)[0][0]
-        
-        between_prices = prices[left_idx+1:right_idx]
-        if len(between_prices) == 0:
-            return True
-        
-        days = np.arange(1, len(between_prices) + 1)
-        total_days = right_idx - left_idx
-        
-        daily_slope = (right_price - left_price) / total_days
-        line_prices = left_price + (daily_slope * days)
-        
-        body_high = np.maximum(between_prices[:, 0], between_prices[:, 3])
-        y_extension = abs(daily_slope)
-        
-        extended_high = body_high + y_extension
-        return not np.any(line_prices <= extended_high)
+    def _check_line_crosses_body_np(self, prices, left_idx, left_price, right_idx, right_price):
+        """使用numpy检查连线是否穿过实体, 位置均为K线序号"""
+        return line_kernels.line_crosses_body(prices, left_idx, left_price, right_idx, right_price, upper=True)
     
-    def _count_crossed_shadows_np(self, prices, dates, left_date, left_price,
-                                right_date, right_price, base_date):
-        """使用numpy计算穿越的上影线数量"""
-        left_idx = np.where(dates == left_date)[0][0]
-        right_idx = np.where(dates == right_date)[0][0]
-        base_idx = np.where(dates == base_date)[0][0]
-        
-        between_prices = prices[left_idx+1:min(right_idx, base_idx)]
-        if len(between_prices) == 0:
-            return 0
-        
-        days = np.arange(1, len(between_prices) + 1)
-        total_days = right_idx - left_idx
-        line_prices = left_price + ((right_price - left_price) / total_days) * days
-        
-        body_high = np.maximum(between_prices[:, 0], between_prices[:, 3])
-        crosses = (line_prices >= body_high) & (line_prices <= between_prices[:, 1])
-        
-        # 寻找最长的连续穿越序列
-        max_consecutive = 0
-        current_consecutive = 0
-        for cross in crosses:
-            if cross:
-                current_consecutive += 1
-                max_consecutive = max(max_consecutive, current_consecutive)
-            else:
-                current_consecutive = 0
-                
-        return max_consecutive
+    def _count_crossed_shadows_np(self, prices, left_idx, left_price, right_idx, right_price, base_idx):
+        """使用numpy计算最长的连续穿越上影线数量, 位置均为K线序号"""
+        return line_kernels.max_consecutive_crossed_shadows(prices, left_idx, left_price, right_idx, right_price,
+                                                            base_idx)
     
     def _get_reordered_indices(self, total_points, middle):
         """
@@ -1,12 +1,17 @@
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, bindparam
 from CommonFunc.DBconnection import (
     find_config_path,
     load_config,
     set_log,
-    db_con_sqlalchemy
+    db_con_sqlalchemy,
+    release_sqlalchemy
 )
 
+# 批量读取周K时每条查询包含的股票数
+BULK_QUERY_SIZE = 500
+
+
 class DataLoader:
     def __init__(self, config_path=None):
         """
@@ -25,15 +30,10 @@ class DataLoader:
         # 读取DEBUG配置
         self.debug = self.config.get('Programs', {}).get('Week_K_Analyzer', {}).get('DEBUG', False)
     
-    def __del__(self):
-        """析构函数，确保数据库连接被关闭"""
-        if hasattr(self, 'engine'):
-            self.engine.dispose()
-    
     def close(self):
-        """显式关闭数据库连接"""
+        """显式关闭数据库连接 (启用连接池时 engine 由进程共享, 不关闭)"""
         if hasattr(self, 'engine'):
-            self.engine.dispose()
+            release_sqlalchemy(self.config, self.engine)
     
     def get_stock_weekly_data(self, stock_id, weeks=80):
         """
@@ -67,6 +67,52 @@ class DataLoader:
             self.logger.error_print(f"获取周K数据失败: {str(e)}")
             return None
     
+    def get_all_weekly_data(self, stock_ids, weeks=80):
+        """
+        批量获取多只股票的周K数据, 每只股票的结果与 get_stock_weekly_data 相同
+        按 BULK_QUERY_SIZE 只股票一条查询, 用窗口函数取每只股票最近 weeks 周
+        
+        Args:
+            stock_ids (list): 股票代码列表
+            weeks (int): 获取的周数
+            
+        Returns:
+            dict: {stock_id: DataFrame}, 没有数据的股票不在结果中; 查询失败时返回 None
+        """
+        query = text("""
+            SELECT id, Date, wkn, open, high, low, close
+            FROM (
+                SELECT id, WK_date as Date, wkn, open, high, low, close,
+                       ROW_NUMBER() OVER (PARTITION BY id ORDER BY WK_date DESC) as rn
+                FROM WK
+                WHERE id IN :stock_ids
+                AND status = 'active'
+            ) t
+            WHERE rn <= :weeks
+        """).bindparams(bindparam('stock_ids', expanding=True))
+        
+        try:
+            frames = []
+            for i in range(0, len(stock_ids), BULK_QUERY_SIZE):
+                batch = list(stock_ids[i:i + BULK_QUERY_SIZE])
+                frames.append(pd.read_sql(query, self.engine, params={'stock_ids': batch, 'weeks': weeks}))
+        except Exception as e:
+            self.logger.error_print(f"批量获取周K数据失败: {str(e)}")
+            return None
+        
+        result = {}
+        if not frames:
+            return result
+        df = pd.concat(frames, ignore_index=True)
+        df['id'] = df['id'].astype(str).str.zfill(6)
+        df['Date'] = pd.to_datetime(df['Date'])
+        df = df.sort_values(['id', 'Date'])
+        for stock_id, group in df.groupby('id', sort=False):
+            stock_df = group.drop(columns='id').set_index('Date')
+            stock_df.name = stock_id
+            result[stock_id] = stock_df
+        return result
+    
     def check_stock_rise(self, df, threshold=2.8):
         """
         检查股票最新一周的涨幅是否满足条件
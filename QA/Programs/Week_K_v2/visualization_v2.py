@@ -4,6 +4,7 @@ import matplotlib.dates as mdates
 import numpy as np
 from datetime import timedelta
 import pandas as pd
+from CommonFunc.line_records import points_to_tuples, connections_to_dicts
 
 def plot_analysis_results(df, analysis_results, stock_id=None, debug=False, batch_mode=False):
     """
@@ -11,7 +12,7 @@ def plot_analysis_results(df, analysis_results, stock_id=None, debug=False, batc
     
     Args:
         df (pandas.DataFrame): 股票数据
-        analysis_results (dict): 分析结果
+        analysis_results (dict): 分析结果, 点、连线和波峰的位置为K线序号
         stock_id (str): 股票代码
         debug (bool): 是否显示调试信息
         batch_mode (bool): 是否为批量处理模式
@@ -42,16 +43,9 @@ def plot_analysis_results(df, analysis_results, stock_id=None, debug=False, batc
         
         # 在蜡烛图上绘制连线
         for conn in analysis_results['connections']:
-            left = conn['left_point']
-            right = conn['right_point']
-            
-            # 获取日期对应的索引位置
-            left_idx = df.index.get_loc(left[1])
-            right_idx = df.index.get_loc(right[1])
-            
-            # 使用索引位置画线
-            ax.plot([left_idx, right_idx], 
-                   [left[0], right[0]], 
+            # 连线端点本身就是K线序号
+            ax.plot([conn['left_idx'], conn['right_idx']], 
+                   [conn['left_price'], conn['right_price']], 
                    'gray', alpha=0.5, linewidth=1)
         
         plt.savefig(f'QA/Output/{stock_id}_analysis_v2.png')
@@ -84,7 +78,7 @@ def plot_analysis_results(df, analysis_results, stock_id=None, debug=False, batc
         ax2.plot(df.index, df['high'], 'gray', alpha=0.5, label='High Price')
         
         # 标记波峰
-        ax2.plot(analysis_results['peak_dates'], 
+        ax2.plot(df.index[analysis_results['peaks']], 
                 analysis_results['peak_prices'], 
                 'ro', markersize=10, 
                 markerfacecolor='none', 
@@ -101,16 +95,9 @@ def plot_analysis_results(df, analysis_results, stock_id=None, debug=False, batc
         
         # 在蜡烛图上绘制连线
         for conn in analysis_results['connections']:
-            left = conn['left_point']
-            right = conn['right_point']
-            
-            # 获取日期对应的索引位置
-            left_idx = df.index.get_loc(left[1])
-            right_idx = df.index.get_loc(right[1])
-            
-            # 使用索引位置画线
-            ax1.plot([left_idx, right_idx], 
-                    [left[0], right[0]], 
+            # 连线端点本身就是K线序号
+            ax1.plot([conn['left_idx'], conn['right_idx']], 
+                    [conn['left_price'], conn['right_price']], 
                     'gray', alpha=0.5, linewidth=1)
         
         # 调整布局
@@ -127,14 +114,16 @@ def print_analysis_results(df, analysis_results, debug=False):
         print("\n连线分析:")
         print(f"Base Week 收盘价: {df.iloc[-1]['close']:.2f}")
         print(f"Right Points:")
-        for price, date, name in analysis_results['right_points']:
+        for price, date, name in points_to_tuples(analysis_results['right_points'], df.index, 'right_point'):
             print(f"{name}: {price:.2f} @ {date.strftime('%Y-%m-%d')}")
         
         print(f"\n符合条件的连线数量: {len(analysis_results['connections'])}")
         
         # 只打印前5个连线示例
         print("\n连线示例（前5个）:")
-        for i, conn in enumerate(analysis_results['connections'][:5]):
+        connections = connections_to_dicts(analysis_results['connections'][:5], df.index,
+                                           'left_point', 'right_point')
+        for i, conn in enumerate(connections):
             left = conn['left_point']
             right = conn['right_point']
             print(f"连线 {i+1}: {left[2]} ({left[0]:.2f} @ {left[1].strftime('%Y-%m-%d')}) "
@@ -11,6 +11,7 @@ import pandas as pd
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from CommonFunc.DBconnection import find_config_path, load_config, db_con_pymysql, set_log
+from CommonFunc.bulk_insert import bulk_insert, get_bulk_options
 import os
 import time
 from requests.exceptions import SSLError
@@ -93,32 +94,20 @@ def process_single_stock(stock, logger, config):
             df['周数'] = df['日期'].apply(convert_date_to_week)
             
             try:
-                # 插入或更新数据
-                for _, row in df.iterrows():
-                    sql = """
-                    INSERT INTO WK (id, wkn, WK_date, open, close, high, low, chg_percen, update_time)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                    WK_date = VALUES(WK_date),
-                    open = VALUES(open),
-                    close = VALUES(close),
-                    high = VALUES(high),
-                    low = VALUES(low),
-                    chg_percen = VALUES(chg_percen),
-                    update_time = VALUES(update_time)
-                    """
-                    values = (
-                        stock,
-                        row['周数'],
-                        row['日期'],
-                        row['开盘'],
-                        row['收盘'],
-                        row['最高'],
-                        row['最低'],
-                        row['涨跌幅'],
-                        update_time
-                    )
-                    cursor.execute(sql, values)
+                # 批量插入或更新数据
+                method, chunk_size = get_bulk_options(config)
+                bulk_insert(conn, 'WK', {
+                    'id': stock,
+                    'wkn': df['周数'].values,
+                    'WK_date': df['日期'].values,
+                    'open': df['开盘'].values,
+                    'close': df['收盘'].values,
+                    'high': df['最高'].values,
+                    'low': df['最低'].values,
+                    'chg_percen': df['涨跌幅'].values,
+                    'update_time': update_time
+                }, method, chunk_size,
+                    update_columns=['WK_date', 'open', 'close', 'high', 'low', 'chg_percen', 'update_time'])
                 
                 conn.commit()
                 return "success"
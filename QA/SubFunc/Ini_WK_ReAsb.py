@@ -1,4 +1,202 @@
 """
 本程序使用reassemble将日K数据重组为周K数据
+日K来自本地存储 (BarStore) 或主表, 一次性按日历周重组后批量写入 WK 表, 不需要逐只股票请求 API
+周数 wkn 使用 convert_date_to_week, 与 Ini_WK_MuTh / AK008 相同
+注意: 主表日K为不复权价格, Ini_WK_MuTh 请求的是前复权 (qfq) 周K, 有除权的股票两者的历史价格不同
+
+用法 (在项目根目录):
+    python -m QA.SubFunc.Ini_WK_ReAsb                      # QA 环境, 从 20230101 开始重组并写入
+    python -m QA.SubFunc.Ini_WK_ReAsb --env PROD --start 20240101
+    python -m QA.SubFunc.Ini_WK_ReAsb --verify 50 --dry-run  # 只重组, 抽样 50 只股票与 API 周K (不复权) 核对
 """
 
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+import akshare as ak
+import pandas as pd
+from CommonFunc.DBconnection import find_config_path, load_config, db_con_pymysql, set_log
+from CommonFunc.bar_store import open_bar_store
+from CommonFunc.bulk_insert import bulk_insert_df
+from CommonFunc.weekly_bars import resample_weekly, WK_COLUMNS, WK_UPDATE_COLUMNS, PRICE_COLUMNS
+from QA.SubFunc.Ini_WK_MuTh import convert_date_to_week
+
+# 核对时价格允许的误差 (decimal(10,2) 取整) 和涨跌幅允许的误差 (百分点)
+PRICE_TOLERANCE = 0.011
+CHG_TOLERANCE = 0.05
+
+
+def get_stock_list(config, root_dir, env):
+    """从对应环境的 MainCSV 获取股票代码列表"""
+    csv_path = os.path.join(root_dir, env, config['CSVs']['MainCSV'])
+    df = pd.read_csv(csv_path)
+    stock_list = df.iloc[:, 1].astype(str).tolist()
+    return [code.zfill(6) for code in stock_list if code.isdigit()]
+
+
+def load_daily_bars(config, stock_list, start_date, logger):
+    """
+    读取 start_date 前一周起的日K (多读一周用于计算第一周的涨跌幅), 停牌日 (价格为空) 由 resample_weekly 跳过
+
+    Returns:
+        pd.DataFrame: id, date, open, close, high, low
+    """
+    load_start = pd.Timestamp(start_date) - timedelta(days=14)
+    store = open_bar_store(config, config['DBinput']['last_update_date'])
+    if store is not None:
+        logger.info_print("从本地存储读取日K数据")
+        return store.to_frame(stock_list, load_start, None, tuple(PRICE_COLUMNS))
+
+    logger.info_print("从主表读取日K数据")
+    connection = db_con_pymysql(config)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT id, date, open_price AS open, close_price AS close, high, low
+                FROM {config['DB_tables']['main_query_table']}
+                WHERE date >= %s AND Latest = 1
+                  AND open_price IS NOT NULL AND close_price IS NOT NULL
+            """, (load_start.date(),))
+            df = pd.DataFrame(cursor.fetchall())
+    finally:
+        connection.close()
+    if df.empty:
+        return df
+    df = df[df['id'].isin(stock_list)]
+    df[PRICE_COLUMNS] = df[PRICE_COLUMNS].astype(float)
+    return df
+
+
+def build_weekly(bars, start_date):
+    """重组周K并去掉 start_date 所在周之前的周"""
+    weekly = resample_weekly(bars, convert_date_to_week)
+    first_monday = pd.Timestamp(start_date) - timedelta(days=pd.Timestamp(start_date).weekday())
+    return weekly[weekly['WK_date'] >= first_monday].reset_index(drop=True)
+
+
+def fetch_api_weekly(stock, start_date, end_date):
+    """请求 API 不复权周K, 列名与 WK 表一致"""
+    df = ak.stock_zh_a_hist(symbol=stock, period="weekly", start_date=start_date,
+                            end_date=end_date, adjust="")
+    if df is None or df.empty:
+        return pd.DataFrame(columns=['wkn', 'WK_date'] + PRICE_COLUMNS + ['chg_percen'])
+    return pd.DataFrame({
+        'wkn': df['日期'].apply(convert_date_to_week),
+        'WK_date': pd.to_datetime(df['日期']),
+        'open': df['开盘'].astype(float),
+        'close': df['收盘'].astype(float),
+        'high': df['最高'].astype(float),
+        'low': df['最低'].astype(float),
+        'chg_percen': df['涨跌幅'].astype(float),
+    })
+
+
+def verify_sample(weekly, stock_list, sample_size, start_date, logger, seed=None):
+    """
+    抽样与 API 周K逐周核对, 任一侧为空值 (NaN) 也视为不一致
+
+    Returns:
+        pd.DataFrame: 不一致的周 (id, wkn, 字段, 本地值, API值)
+    """
+    stocks = sorted(random.Random(seed).sample(sorted(stock_list), min(sample_size, len(stock_list))))
+    end_date = datetime.now().strftime("%Y%m%d")
+    local_by_id = dict(tuple(weekly.groupby('id')))
+    mismatches = []
+    for n, stock in enumerate(stocks, 1):
+        print(f"\r核对进度: {n}/{len(stocks)}", end="", flush=True)
+        try:
+            api = fetch_api_weekly(stock, start_date, end_date)
+        except Exception as e:
+            logger.warning_print(f"股票 {stock} API 请求失败, 跳过核对: {str(e)}")
+            continue
+        local = local_by_id.get(stock, pd.DataFrame(columns=weekly.columns))
+        merged = local.merge(api, on='wkn', how='outer', suffixes=('', '_api'), indicator=True)
+        for _, row in merged[merged['_merge'] != 'both'].iterrows():
+            side = '只在本地' if row['_merge'] == 'left_only' else '只在API'
+            mismatches.append((stock, row['wkn'], side, None, None))
+        both = merged[merged['_merge'] == 'both']
+        for column in PRICE_COLUMNS + ['chg_percen']:
+            tolerance = CHG_TOLERANCE if column == 'chg_percen' else PRICE_TOLERANCE
+            local_values = both[column].astype(float)
+            api_values = both[f'{column}_api'].astype(float)
+            # NaN 比较结果为 False, 需单独判断; 两侧都为空的涨跌幅 (第一根周K) 视为一致
+            mismatch = ((local_values - api_values).abs() > tolerance) | (local_values.isna() != api_values.isna())
+            if column != 'chg_percen':
+                mismatch |= local_values.isna()
+            for _, row in both[mismatch].iterrows():
+                mismatches.append((stock, row['wkn'], column, row[column], row[f'{column}_api']))
+        time.sleep(0.2)
+    print()
+    return pd.DataFrame(mismatches, columns=['id', 'wkn', 'field', 'local', 'api'])
+
+
+def save_weekly(config, weekly, logger):
+    """批量写入 WK 表 (已存在的周更新)"""
+    rows = weekly.assign(
+        WK_date=pd.to_datetime(weekly['WK_date']).dt.date,
+        update_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        status='active',
+    )[WK_COLUMNS]
+    connection = db_con_pymysql(config)
+    try:
+        written = bulk_insert_df(connection, config['DB_tables']['WK_table'], rows, config,
+                                 update_columns=WK_UPDATE_COLUMNS, logger=logger)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='由日K重组周K并写入 WK 表')
+    parser.add_argument('--env', choices=['QA', 'PROD'], default='QA', help='使用的配置, 默认 QA')
+    parser.add_argument('--start', default='20230101', help='开始日期 YYYYMMDD, 默认 20230101')
+    parser.add_argument('--verify', type=int, default=0, help='抽样与 API 周K核对的股票数量, 默认不核对')
+    parser.add_argument('--seed', type=int, help='抽样随机种子')
+    parser.add_argument('--dry-run', action='store_true', help='只重组 (和核对), 不写入数据库')
+    args = parser.parse_args(argv)
+
+    config_path_QA, config_path_PROD, root_dir = find_config_path()
+    config = load_config(config_path_QA if args.env == "QA" else config_path_PROD)
+    logger = set_log(config, "Ini_WK_ReAsb.log", args.env)
+    logger.info_print(f"开始由日K重组周K, 开始日期: {args.start}")
+
+    try:
+        start_time = time.time()
+        stock_list = get_stock_list(config, root_dir, args.env)
+        bars = load_daily_bars(config, stock_list, args.start, logger)
+        weekly = build_weekly(bars, args.start)
+        logger.info_print(f"{len(bars)} 条日K重组为 {len(weekly)} 根周K ({weekly['id'].nunique()} 只股票), "
+                          f"耗时 {time.time() - start_time:.1f} 秒")
+
+        if args.verify:
+            mismatches = verify_sample(weekly, stock_list, args.verify, args.start, logger, args.seed)
+            if mismatches.empty:
+                logger.info_print(f"抽样 {args.verify} 只股票与 API 周K一致")
+            else:
+                logger.warning_print(f"抽样核对发现 {len(mismatches)} 处不一致, "
+                                     f"涉及 {mismatches['id'].nunique()} 只股票:\n"
+                                     f"{mismatches.head(50).to_string(index=False)}")
+
+        if args.dry_run:
+            return True, "重组完成 (未写入数据库)"
+        written = save_weekly(config, weekly, logger)
+        logger.info_print(f"写入 {written} 根周K, 总耗时 {time.time() - start_time:.1f} 秒")
+        return True, "周K重组写入完成"
+
+    except Exception as e:
+        error_msg = f"程序执行出现错误: {str(e)}"
+        logger.error_print(error_msg)
+        return False, error_msg
+
+
+if __name__ == "__main__":
+    success, message = main()
+    print(message)
+    sys.exit(0 if success else 1)
@@ -4,11 +4,13 @@
 日常更新缺口数据使用 QA007.py
 """
 
+import numpy as np
 import pandas as pd
 from CommonFunc.DBconnection import db_con_pymysql as connect_db, load_config, find_config_path
 import csv
 import os
 from CommonFunc.DBconnection import set_log
+from CommonFunc.gap_engine import find_down_gaps, stack_price_rows
 
 def fetch_all_stock_data(connection, table, stock_ids, start_date, end_date):
     """
@@ -46,68 +48,62 @@ def read_stock_codes_from_csv(csv_path):
         return []
 
 def calculate_down_gap(stock_data):
-    gaps = []  # 用于存所有检测到的下跌缺口
-    
-    # 检查每一对相邻的日期，看看是否形成下跌缺口
-    for i in range(1, len(stock_data)):
-        prev_row = stock_data.iloc[i - 1]  # 获取前一行数据
-        curr_row = stock_data.iloc[i]      # 获取当前行数据
-        
-        # 判断是否形成下跌缺口：当前交易日的最高价小于前一交易日的最低价
-        if curr_row["high"] < prev_row["low"]:
-            gaps.append({
-                "start_date": prev_row["date"],  # 缺口开始日期
-                "end_date": None,                # 初始时，缺口的结束日期设为 None
-                "gap_low": curr_row["high"],     # 缺口的最低价是当前交易日的最高价
-                "gap_high": prev_row["low"],     # 缺口的最高价是前一交易日的最低价
-                "filled": False,                 # 初始时，缺口未被填满
-                "filled_date": None,             # 填满日期暂时为 None
-            })
+    """
+    计算单只股票的下跌缺口 (数据按日期升序)
+    与 calculate_gaps_batch 使用同一个缺口引擎 (CommonFunc.gap_engine), 按K线顺序只扫描一遍
+
+    Returns:
+        list: 每个缺口一个字典, 已填补缺口的 gap_low 为填补前的下沿
+    """
+    prices = stock_data[["high", "low"]].to_numpy(dtype=np.float64)
+    dates = stock_data["date"].values
+    gaps = find_down_gaps(prices[None, :, 0], prices[None, :, 1])
     
-    # 检查缺口是否被填满
+    result = []
     for gap in gaps:
-        for _, row in stock_data.iterrows():
-            if gap["end_date"] is None and gap["start_date"] < row["date"]:
-                # 判断是否填满
-                if row["high"] >= gap["gap_high"]:
-                    gap["filled"] = True  # 缺口被填满
-                    gap["filled_date"] = row["date"]  # 记录填满日期
-                    gap["end_date"] = row["date"]    # 设置缺口的结束日期为填满日期
-                    break  # 找到填满缺口的日期后就跳出当前循环
-                elif gap["gap_low"] <= row["high"] < gap["gap_high"]:
-                    # 更新缺口的最低价为当前行的最高价
-                    gap["gap_low"] = row["high"]
-    
-    return gaps
+        filled = bool(gap["fill"] >= 0)
+        result.append({
+            "start_date": dates[gap["start"]],                        # 缺口开始日期
+            "end_date": dates[gap["fill"]] if filled else None,       # 缺口的结束日期 (填满日期)
+            "gap_low": float(gap["gap_low"]),                         # 缺口的最低价
+            "gap_high": float(gap["gap_high"]),                       # 缺口的最高价
+            "filled": filled,                                         # 缺口是否被填满
+            "filled_date": dates[gap["fill"]] if filled else None,    # 填满日期
+        })
+    return result
 
 def calculate_gaps_batch(stock_data):
     """
-    批量计算缺口
+    批量计算缺口: 所有股票整理为靠右对齐的矩阵后由缺口引擎一次计算
     Args:
         stock_data: 包含多只股票的 DataFrame
     Returns:
-        包含所有缺口信息的 DataFrame
+        包含所有缺口信息的 DataFrame (按股票代码、缺口开始日期排序)
     """
-    all_gaps = []
-
-    # 按股票代码分组
-    grouped = stock_data.groupby("id")
-    for stock_id, group in grouped:
-        group = group.sort_values("date")  # 按日期排序
-        gaps = calculate_down_gap(group)  # 计算单只股票的缺口
-
-        # 转换为 DataFrame 格式
-        for gap in gaps:
-            all_gaps.append({
-                "id": stock_id,
-                "sdate": gap["start_date"],
-                "filled": 1 if gap["filled"] else 0,
-                "edate": gap["filled_date"] if gap["filled"] else None,
-                "from_price": gap["gap_high"],
-                "to_price": None if gap["filled"] else gap["gap_low"],
-            })
-
-    return pd.DataFrame(all_gaps)
+    if stock_data.empty:
+        return pd.DataFrame()
+
+    ids, df, rows = stack_price_rows(stock_data)
+    # 行号 -1 (靠右对齐后的空缺) 对应最后追加的 NaN
+    prices = np.vstack((df[["high", "low"]].to_numpy(dtype=np.float64), [[np.nan, np.nan]]))
+    gaps = find_down_gaps(prices[rows, 0], prices[rows, 1])
+    if len(gaps) == 0:
+        return pd.DataFrame()
+
+    dates = df["date"].values
+    filled = gaps["fill"] >= 0
+    fill_rows = rows[gaps["stock"], gaps["fill"]]
+    # edate / to_price 保持 object 列, 未填补 / 已填补的缺口为 None (写入 NULL), 不能变成 NaN (pymysql 无法写入)
+    return pd.DataFrame({
+        "id": ids[gaps["stock"]],
+        "sdate": dates[rows[gaps["stock"], gaps["start"]]],
+        "filled": filled.astype(int),
+        "edate": pd.Series([dates[row] if is_filled else None for row, is_filled in zip(fill_rows, filled)],
+                           dtype=object),
+        "from_price": gaps["gap_high"],
+        "to_price": pd.Series([None if is_filled else float(low) for low, is_filled in zip(gaps["gap_low"], filled)],
+                              dtype=object),
+    })
 
 def write_gaps_batch_to_mysql(connection, gaps):
     """
@@ -0,0 +1,7 @@
+"""
+性能基准测试
+用随机种子生成的合成K线 (benchmarks.synthetic) 测试各分析函数、过滤条件和端到端流程的耗时,
+不需要数据库和网络. 结果写入 JSON, 可在不同提交之间比较:
+    python -m benchmarks.run --output before.json
+    python -m benchmarks.compare before.json after.json
+"""
@@ -0,0 +1,70 @@
+"""
+比较两次基准测试结果 (benchmarks.run 输出的 JSON)
+用法:
+    python -m benchmarks.compare before.json after.json [--threshold 0.15]
+按 (股票池, 阶段) 对比最快耗时, 变慢超过阈值的阶段记为性能退化, 存在退化时返回码为 1 (可用于部署前检查)
+"""
+
+import argparse
+import json
+import sys
+
+# 两次耗时都低于该秒数时不判断退化 (计时误差占比太大)
+MIN_SECONDS = 0.005
+# 影响结果可比性的运行条件
+COMPARABLE_KEYS = ('seed', 'sample', 'line_backend', 'cpu_count')
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return data['meta'], {(r['universe'], r['stage']): r for r in data['results']}
+
+
+def compare(before, after, threshold):
+    """
+    Returns:
+        tuple: (比较行 [(股票池, 阶段, 之前秒数, 之后秒数, 比值)], 退化的 (股票池, 阶段))
+    """
+    rows, regressions = [], []
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key]['seconds'], after[key]['seconds']
+        ratio = new / old if old > 0 else float('inf')
+        rows.append((*key, old, new, ratio))
+        if ratio > 1 + threshold and max(old, new) >= MIN_SECONDS:
+            regressions.append(key)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='比较两次基准测试结果')
+    parser.add_argument('before', help='基准结果 (通常为部署中的版本)')
+    parser.add_argument('after', help='新结果')
+    parser.add_argument('--threshold', type=float, default=0.15, help='变慢超过该比例记为退化, 默认 0.15')
+    args = parser.parse_args(argv)
+
+    meta_before, before = load_results(args.before)
+    meta_after, after = load_results(args.after)
+    print(f"之前: {meta_before.get('commit')} ({meta_before.get('timestamp')})")
+    print(f"之后: {meta_after.get('commit')} ({meta_after.get('timestamp')})")
+    for key in COMPARABLE_KEYS:
+        if meta_before.get(key) != meta_after.get(key):
+            print(f"警告: 两次测试的 {key} 不同 ({meta_before.get(key)} / {meta_after.get(key)}), 结果可能不可比")
+
+    rows, regressions = compare(before, after, args.threshold)
+    print(f"\n{'股票池':<12}{'阶段':<18}{'之前(秒)':>10}{'之后(秒)':>10}{'比值':>8}")
+    for universe, stage, old, new, ratio in rows:
+        mark = "  退化" if (universe, stage) in regressions else ""
+        print(f"{universe:<12}{stage:<18}{old:>10.3f}{new:>10.3f}{ratio:>8.2f}{mark}")
+    for key in sorted(before.keys() ^ after.keys()):
+        print(f"{key[0]:<12}{key[1]:<18}  只在{'之前' if key in before else '之后'}的结果中")
+
+    if regressions:
+        print(f"\n{len(regressions)} 个阶段变慢超过 {args.threshold:.0%}")
+        return 1
+    print("\n没有性能退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
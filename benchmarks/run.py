@@ -0,0 +1,151 @@
+"""
+运行基准测试并把结果写入 JSON
+用法 (在项目根目录):
+    python -m benchmarks.run                                   # 1k/5k/10k 三个股票池, 全部阶段
+    python -m benchmarks.run --universe 1k --stage triangle_batch --stage pipeline
+    python -m benchmarks.run --universe 2000x300 --backend numpy --output before.json
+之后用 python -m benchmarks.compare before.json after.json 比较两次结果
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from CommonFunc import line_kernels
+from benchmarks.synthetic import SyntheticUniverse
+from benchmarks.stages import STAGES
+
+# 股票池预设: 名称 → (股票数, K线数)
+UNIVERSES = {
+    '1k': (1000, 150),
+    '5k': (5000, 500),
+    '10k': (10000, 1000),
+}
+# 逐只股票计算的阶段默认抽样数量
+DEFAULT_SAMPLE = 500
+# 结果文件默认目录
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def parse_universe(value):
+    """'1k' 等预设名称或 '股票数x K线数'"""
+    if value in UNIVERSES:
+        return UNIVERSES[value]
+    try:
+        n_stocks, n_bars = value.lower().split('x')
+        return int(n_stocks), int(n_bars)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无法识别的股票池: {value} (可用 {', '.join(UNIVERSES)} 或 股票数x K线数)")
+
+
+def time_stage(run, repeat):
+    """
+    预热一次后重复运行 repeat 次
+
+    Returns:
+        list: 每次运行的秒数
+    """
+    run()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_benchmarks(universes, stages, sample=DEFAULT_SAMPLE, repeat=3, seed=0):
+    """
+    Args:
+        universes (list): [(股票数, K线数)]
+        stages (list): 阶段名称, 见 benchmarks.stages.STAGES
+
+    Returns:
+        list: 每个 (股票池, 阶段) 一条结果
+    """
+    results = []
+    for n_stocks, n_bars in universes:
+        start = time.perf_counter()
+        universe = SyntheticUniverse(n_stocks, n_bars, seed)
+        print(f"\n股票池 {universe.name}: 生成耗时 {time.perf_counter() - start:.1f} 秒")
+        for name in stages:
+            run, items = STAGES[name](universe, sample)
+            timings = time_stage(run, repeat)
+            best = min(timings)
+            results.append({
+                'universe': universe.name,
+                'stocks': n_stocks,
+                'bars': n_bars,
+                'stage': name,
+                'items': int(items),
+                'seconds': best,
+                'per_item_ms': best / items * 1000 if items else None,
+                'timings': timings,
+            })
+            print(f"  {name:<18} {best:9.3f} 秒  ({items} 只股票, {results[-1]['per_item_ms'] or 0:.3f} ms/只)")
+    return results
+
+
+def environment(seed, sample, repeat):
+    """记录运行环境, 比较结果时用于确认两次测试条件相同"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(RESULTS_DIR)).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'numba': line_kernels.HAVE_NUMBA,
+        'line_backend': line_kernels.get_backend(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'sample': sample,
+        'repeat': repeat,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='合成数据基准测试 (不连接数据库和网络)')
+    parser.add_argument('--universe', action='append', type=parse_universe,
+                        help=f"股票池, 可重复; 默认 {', '.join(UNIVERSES)}")
+    parser.add_argument('--stage', action='append', choices=list(STAGES), help='测试阶段, 可重复; 默认全部')
+    parser.add_argument('--sample', type=int, default=DEFAULT_SAMPLE, help='逐只股票计算的阶段抽样数量')
+    parser.add_argument('--repeat', type=int, default=3, help='每个阶段重复次数, 取最快一次')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--backend', choices=['numpy', 'numba'], help='连线检查的实现, 默认自动选择')
+    parser.add_argument('--output', help='结果文件路径, 默认 benchmarks/results/<时间>_<提交>.json')
+    args = parser.parse_args(argv)
+
+    if args.backend:
+        line_kernels.set_backend(args.backend)
+    universes = args.universe or list(UNIVERSES.values())
+    stages = args.stage or list(STAGES)
+
+    meta = environment(args.seed, args.sample, args.repeat)
+    print(f"连线检查实现: {meta['line_backend']}, 提交: {meta['commit']}")
+    results = run_benchmarks(universes, stages, args.sample, args.repeat, args.seed)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}_{meta['commit'] or 'nocommit'}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'results': results}, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存至 {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+基准测试的各个阶段
+每个阶段由一个准备函数注册到 STAGES: 准备函数把合成数据整理成被测函数的输入格式 (不计时),
+返回 (被计时的函数, 处理的股票数). 被测函数直接调用各程序中的计算函数, 不连接数据库
+
+单项阶段:
+    triangle_analyze   Triangle_v2 ResistanceLineAnalyzer.analyze, 逐只股票 (抽样)
+    triangle_batch     Triangle_v2 ResistanceLineAnalyzer.analyze_batch, 全部股票
+    weekk_analyze      Week_K_v2 ResistanceLineAnalyzer.analyze, 逐只股票 (抽样)
+    down_gap           Init_Gap.calculate_gaps_batch, 完整历史 (抽样)
+    ma_pandas          QA006.calculate_ma (pandas rolling, 抽样)
+    ma_engine          AK006.calculate_ma (CommonFunc.ma_engine), 全部股票
+    ma_incremental     IncrementalMAState 更新一个交易日, 全部股票
+    filter1/2/3        AKFilter1~3 的过滤条件, 全部股票
+    filter_pipeline    AKFilterPipeline 合并计算 Filter1~3, 全部股票
+端到端阶段:
+    pipeline           均线 → Filter1 → Filter2 → Filter3 → 周K阻力线 → 日K三角形, 全部股票
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+from CommonFunc.ma_engine import calculate_latest_ma, IncrementalMAState
+from QA.Programs.Triangle_v2 import ResistanceLineAnalyzer as TriangleAnalyzer
+from QA.Programs.Week_K_v2 import ResistanceLineAnalyzer as WeeklyAnalyzer
+from QA.Programs.QA006 import calculate_ma as calculate_ma_pandas
+from PROD.SubFunc.Init_Gap import calculate_gaps_batch
+from PROD.Programs import AKFilter1, AKFilter2, AKFilter3, AKFilterPipeline
+
+# 各程序的分析窗口
+TRIANGLE_DAYS = 150
+WEEKLY_WEEKS = 80
+MA_DAYS = [7, 30, 60, 120, 250]
+# 程序中的过滤阈值
+RISE_THRESHOLD = 10       # QAFilter5 最后一天涨幅上限 (%)
+WEEKLY_THRESHOLD = 2.8    # QAFilter4 最新一周涨幅下限 (%)
+FILTER1_MAX_GAINS = 12    # AKFilter1 三天累计涨幅上限 (%)
+# 缺口表只用最近的K线生成 (相当于数据库中已有的 Gap 表, 不计时)
+GAP_TABLE_DAYS = 500
+
+STAGES = {}
+
+
+def stage(name):
+    """注册测试阶段"""
+    def register(prepare):
+        STAGES[name] = prepare
+        return prepare
+    return register
+
+
+def _logger():
+    """过滤函数需要的 logger, 只打印不写文件"""
+    logger = logging.getLogger("benchmarks")
+    logger.info_print = print
+    logger.error_print = lambda message: print(f"错误: {message}")
+    logger.warning_print = lambda message: print(f"警告: {message}")
+    return logger
+
+
+def _sample_rows(universe, sample):
+    return np.arange(min(universe.n_stocks, sample))
+
+
+# ---------- 派生数据 (多个阶段共用, 缓存在 universe.cache 中) ----------
+
+def ma_table(universe):
+    """每只股票最新交易日的 MA (相当于 MA 表)"""
+    if 'ma' not in universe.cache:
+        universe.cache['ma'] = calculate_latest_ma(universe.long_frame(max(MA_DAYS)), MA_DAYS)
+    return universe.cache['ma']
+
+
+def unfilled_gaps(universe):
+    """未填充的缺口 (相当于 Gap 表中 filled = 0 的记录)"""
+    if 'gaps' not in universe.cache:
+        gaps = calculate_gaps_batch(universe.long_frame(GAP_TABLE_DAYS))
+        if gaps.empty:
+            gaps = pd.DataFrame(columns=['id', 'to_price', 'filled'])
+        universe.cache['gaps'] = gaps[gaps['filled'] == 0][['id', 'to_price']].reset_index(drop=True)
+    return universe.cache['gaps']
+
+
+def latest_prices(universe):
+    """最新交易日的收盘价 (id, close_price)"""
+    return pd.DataFrame({'id': universe.ids, 'close_price': universe.ohlc[:, -1, 3]})
+
+
+def recent_changes(universe):
+    """最近三个交易日的涨幅 (id, date, chg_percen), 与 AKFilter1.fetch_all_data 的结果相同"""
+    return universe.long_frame(3)[['id', 'date', 'chg_percen']]
+
+
+# ---------- 单项阶段 ----------
+
+@stage("triangle_analyze")
+def prepare_triangle_analyze(universe, sample):
+    rows = _sample_rows(universe, sample)
+    frames = [(universe.ids[i], universe.frame(i, TRIANGLE_DAYS)) for i in rows]
+    analyzer = TriangleAnalyzer()
+    return lambda: [analyzer.analyze(df, stock_id) for stock_id, df in frames], len(rows)
+
+
+@stage("triangle_batch")
+def prepare_triangle_batch(universe, sample):
+    ohlc, lengths, calendar_days = universe.window(TRIANGLE_DAYS)
+    analyzer = TriangleAnalyzer()
+    return lambda: analyzer.analyze_batch(ohlc, lengths, calendar_days, rise_threshold=RISE_THRESHOLD), universe.n_stocks
+
+
+@stage("weekk_analyze")
+def prepare_weekk_analyze(universe, sample):
+    rows = _sample_rows(universe, sample)
+    frames = [(universe.ids[i], universe.weekly_frame(i, WEEKLY_WEEKS)) for i in rows]
+    frames = [(stock_id, df) for stock_id, df in frames if len(df) >= 3]
+    analyzer = WeeklyAnalyzer()
+    return lambda: [analyzer.analyze(df, stock_id) for stock_id, df in frames], len(frames)
+
+
+@stage("down_gap")
+def prepare_down_gap(universe, sample):
+    data = universe.long_frame(rows=_sample_rows(universe, sample))
+    return lambda: calculate_gaps_batch(data), data['id'].nunique()
+
+
+@stage("ma_pandas")
+def prepare_ma_pandas(universe, sample):
+    data = universe.long_frame(max(MA_DAYS), rows=_sample_rows(universe, sample))[['id', 'date', 'close_price']]
+    return lambda: calculate_ma_pandas(data, MA_DAYS), data['id'].nunique()
+
+
+@stage("ma_engine")
+def prepare_ma_engine(universe, sample):
+    data = universe.long_frame(max(MA_DAYS))[['id', 'date', 'close_price']]
+    return lambda: calculate_latest_ma(data, MA_DAYS), universe.n_stocks
+
+
+@stage("ma_incremental")
+def prepare_ma_incremental(universe, sample):
+    history = universe.long_frame(max(MA_DAYS))
+    state = IncrementalMAState.from_history(history, MA_DAYS)
+    latest = history[history['date'] == history['date'].max()]
+    stock_ids, closes = latest['id'].tolist(), latest['close_price'].values
+    trade_dates = iter(pd.bdate_range(start=universe.dates[-1], periods=10000)[1:])
+
+    def run():
+        # 每次运行追加一个新交易日 (收盘价沿用最新一天), 与夜间增量更新的计算量相同
+        rows = state.update(next(trade_dates), stock_ids, closes)
+        return state.latest_ma(rows)
+    return run, len(stock_ids)
+
+
+@stage("filter1")
+def prepare_filter1(universe, sample):
+    data = recent_changes(universe)
+    logger = _logger()
+
+    def run():
+        gains = AKFilter1.process_data_vectorized(data, logger)
+        return gains[gains['sum_gains'] <= FILTER1_MAX_GAINS].index.values
+    return run, universe.n_stocks
+
+
+@stage("filter2")
+def prepare_filter2(universe, sample):
+    df = latest_prices(universe).merge(ma_table(universe)[['id', 'MA120', 'MA250']], on='id', how='left')
+    return lambda: AKFilter2.process_filter_condition(df.copy()), universe.n_stocks
+
+
+@stage("filter3")
+def prepare_filter3(universe, sample):
+    prices, gaps = latest_prices(universe), unfilled_gaps(universe)
+    return lambda: AKFilter3.process_filter_condition(prices.copy(), gaps.copy()), universe.n_stocks
+
+
+@stage("filter_pipeline")
+def prepare_filter_pipeline(universe, sample):
+    changes = recent_changes(universe)
+    prices = latest_prices(universe).merge(ma_table(universe)[['id', 'MA120', 'MA250']], on='id', how='left')
+    gaps = unfilled_gaps(universe)
+    stock_codes = list(universe.ids)
+    logger = _logger()
+
+    def run():
+        gains = AKFilter1.process_data_vectorized(changes, logger)
+        frame = AKFilterPipeline.build_filter_frame(stock_codes, gains, prices, gaps)
+        return AKFilterPipeline.evaluate_filters(frame)
+    return run, universe.n_stocks
+
+
+# ---------- 端到端 ----------
+
+@stage("pipeline")
+def prepare_pipeline(universe, sample):
+    """
+    夜间计算流程 (数据已在内存中): 计算均线, 依次做 Filter1~3, 再对剩余股票做周K阻力线和日K三角形分析
+    缺口表视为已有数据, 不计时
+    """
+    daily = universe.long_frame(max(MA_DAYS))[['id', 'date', 'close_price']]
+    changes = recent_changes(universe)
+    prices = latest_prices(universe)
+    gaps = unfilled_gaps(universe)
+    row_of = {stock_id: i for i, stock_id in enumerate(universe.ids)}
+    ohlc, lengths, calendar_days = universe.window(TRIANGLE_DAYS)
+    weekly_frames = {stock_id: universe.weekly_frame(i, WEEKLY_WEEKS) for stock_id, i in row_of.items()}
+    logger = _logger()
+
+    def run():
+        ma = calculate_latest_ma(daily, MA_DAYS)
+
+        gains = AKFilter1.process_data_vectorized(changes, logger)
+        stocks = gains[gains['sum_gains'] <= FILTER1_MAX_GAINS].index.tolist()
+
+        df = prices[prices['id'].isin(stocks)].merge(ma[['id', 'MA120', 'MA250']], on='id', how='left')
+        stocks, _ = AKFilter2.process_filter_condition(df)
+
+        stocks, _ = AKFilter3.process_filter_condition(prices[prices['id'].isin(stocks)].copy(),
+                                                       gaps[gaps['id'].isin(stocks)].copy())
+
+        # Filter4: 最新一周涨幅达到阈值的股票做周K阻力线分析
+        analyzer = WeeklyAnalyzer()
+        weekly_hits = []
+        for stock_id in stocks:
+            df = weekly_frames[stock_id]
+            if len(df) < 3:
+                continue
+            latest = df.iloc[-1]
+            if (latest['close'] - latest['open']) / latest['open'] * 100 < WEEKLY_THRESHOLD:
+                continue
+            results = analyzer.analyze(df, stock_id)
+            if results and len(results['connections']) > 0:
+                weekly_hits.append(stock_id)
+
+        # Filter5: 日K三角形批量分析
+        rows = np.array([row_of[stock_id] for stock_id in weekly_hits], dtype=np.int64)
+        batch = TriangleAnalyzer().analyze_batch(ohlc[rows], lengths[rows], calendar_days[rows],
+                                                 rise_threshold=RISE_THRESHOLD)
+        has_lines = batch['low_ok'] & (batch['upper_lines'] > 0) & (batch['lower_lines'] > 0)
+        return [weekly_hits[i] for i in np.flatnonzero(has_lines)]
+    return run, universe.n_stocks
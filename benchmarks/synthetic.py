@@ -0,0 +1,166 @@
+"""
+合成K线数据 (基准测试用)
+按随机种子生成可重复的股票池, 不需要数据库和网络:
+    - 收盘价为对数随机游走, 开盘价带小幅跳空, 少量K线向下跳空形成缺口
+    - 约 5% 的股票为次新股, 只有后面一部分K线 (前面为 NaN)
+    - 所有股票共用同一个交易日历 (工作日), 没有停牌
+同一组 (股票数, K线数, 种子) 每次生成的数据完全相同, 不同提交之间的测试结果可以直接比较
+"""
+
+import numpy as np
+import pandas as pd
+
+# 交易日历的最后一天 (固定, 保证日期可重复)
+END_DATE = '2025-06-30'
+# 次新股比例及其最少K线数
+NEW_LISTING_RATIO = 0.05
+MIN_LISTED_BARS = 20
+# 向下跳空的概率和幅度
+DOWN_GAP_PROB = 0.02
+DOWN_GAP_SIZE = 0.06
+# 每次生成的股票数, 控制生成时的临时内存
+GENERATE_CHUNK = 1000
+
+
+class SyntheticUniverse:
+    """
+    一组合成股票的日K数据
+
+    Attributes:
+        ids (np.ndarray): 股票代码 ('000000' 起)
+        dates (pd.DatetimeIndex): 交易日历
+        ohlc (np.ndarray): (S, D, 4) 靠右对齐的 open/high/low/close, 上市前为 NaN
+        lengths (np.ndarray): (S,) 每只股票的K线数量
+    """
+
+    def __init__(self, n_stocks, n_bars, seed=0):
+        self.n_stocks = int(n_stocks)
+        self.n_bars = int(n_bars)
+        self.seed = int(seed)
+        self.ids = np.array([f"{i:06d}" for i in range(self.n_stocks)])
+        self.dates = pd.bdate_range(end=END_DATE, periods=self.n_bars, name='date')
+
+        rng = np.random.default_rng(self.seed)
+        self.ohlc = np.empty((self.n_stocks, self.n_bars, 4))
+        for start in range(0, self.n_stocks, GENERATE_CHUNK):
+            stop = min(self.n_stocks, start + GENERATE_CHUNK)
+            self.ohlc[start:stop] = _random_ohlc(rng, stop - start, self.n_bars)
+
+        self.lengths = np.full(self.n_stocks, self.n_bars, dtype=np.int64)
+        new_listing = rng.random(self.n_stocks) < NEW_LISTING_RATIO
+        if self.n_bars > MIN_LISTED_BARS:
+            self.lengths[new_listing] = rng.integers(MIN_LISTED_BARS, self.n_bars, new_listing.sum())
+        self.ohlc[np.arange(self.n_bars) < (self.n_bars - self.lengths)[:, None]] = np.nan
+        self._long_frames = {}
+        self._weekly = None
+        # 由 stages 准备的派生数据 (均线表、缺口表等), 多个测试阶段共用
+        self.cache = {}
+
+    @property
+    def name(self):
+        return f"{self.n_stocks}x{self.n_bars}"
+
+    # ---------- 日K ----------
+
+    def window(self, bars):
+        """
+        最近 bars 个交易日的靠右对齐张量, 与 Triangle_v2 stack_stock_frames 的输出相同
+
+        Returns:
+            tuple: (ohlc (S, bars, 4), lengths (S,), calendar_days (S, bars))
+        """
+        bars = min(bars, self.n_bars)
+        ohlc = self.ohlc[:, -bars:]
+        lengths = np.minimum(self.lengths, bars)
+        days = (self.dates[-1] - self.dates[-bars:]).days.values.astype(np.int64)
+        calendar_days = np.where(np.isnan(ohlc[:, :, 0]), 0, days)
+        return ohlc, lengths, calendar_days
+
+    def frame(self, i, bars=None):
+        """第 i 只股票的 DataFrame (索引为日期, open/high/low/close 列), 与 Triangle_v2 DataLoader 的格式相同"""
+        n = int(self.lengths[i]) if bars is None else int(min(self.lengths[i], bars))
+        df = pd.DataFrame(self.ohlc[i, self.n_bars - n:], columns=['open', 'high', 'low', 'close'],
+                          index=self.dates[self.n_bars - n:])
+        df.name = self.ids[i]
+        return df
+
+    def long_frame(self, bars=None, rows=None):
+        """
+        数据库查询格式的长表: id, date, open_price, close_price, high, low, chg_percen
+        按 id、date 升序, 上市前的空K线不出现
+
+        Args:
+            bars (int): 只取最近 bars 个交易日, None 表示全部
+            rows (array-like): 只取这些股票 (行号), None 表示全部
+        """
+        key = (bars, None if rows is None else tuple(np.asarray(rows).tolist()))
+        if key in self._long_frames:
+            return self._long_frames[key]
+        bars = self.n_bars if bars is None else min(bars, self.n_bars)
+        rows = np.arange(self.n_stocks) if rows is None else np.asarray(rows)
+        ohlc = self.ohlc[rows]
+        close = ohlc[:, :, 3]
+        prev_close = np.concatenate((np.full((len(rows), 1), np.nan), close[:, :-1]), axis=1)
+        with np.errstate(invalid='ignore'):
+            chg = (close / prev_close - 1) * 100
+        ohlc, chg = ohlc[:, -bars:], chg[:, -bars:]
+        valid = ~np.isnan(ohlc[:, :, 0])
+        stock_idx, day_idx = np.nonzero(valid)
+        df = pd.DataFrame({
+            'id': self.ids[rows][stock_idx],
+            'date': self.dates[-bars:][day_idx],
+            'open_price': ohlc[:, :, 0][valid],
+            'close_price': ohlc[:, :, 3][valid],
+            'high': ohlc[:, :, 1][valid],
+            'low': ohlc[:, :, 2][valid],
+            'chg_percen': np.round(chg[valid], 2),
+        })
+        self._long_frames[key] = df
+        return df
+
+    # ---------- 周K ----------
+
+    def weekly(self):
+        """
+        按自然周 (周五结束) 合成周K, 与 WK 表一致: 日期为该周最后一个交易日
+
+        Returns:
+            tuple: (week_dates, ohlc (S, W, 4)), 上市前及上市当周为 NaN
+        """
+        if self._weekly is None:
+            periods = self.dates.to_period('W-FRI')
+            starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+            ends = np.r_[starts[1:], self.n_bars] - 1
+            weekly = np.stack([
+                self.ohlc[:, starts, 0],
+                np.maximum.reduceat(self.ohlc[:, :, 1], starts, axis=1),
+                np.minimum.reduceat(self.ohlc[:, :, 2], starts, axis=1),
+                self.ohlc[:, ends, 3],
+            ], axis=-1)
+            self._weekly = (self.dates[ends], weekly)
+        return self._weekly
+
+    def weekly_frame(self, i, weeks=80):
+        """第 i 只股票最近 weeks 周的周K DataFrame, 与 Week_K_v2 DataLoader 的格式相同"""
+        week_dates, weekly = self.weekly()
+        rows = weekly[i, -weeks:]
+        valid = ~np.isnan(rows).any(axis=1)
+        df = pd.DataFrame(rows[valid], columns=['open', 'high', 'low', 'close'],
+                          index=pd.DatetimeIndex(week_dates[-weeks:][valid], name='Date'))
+        df.name = self.ids[i]
+        return df
+
+
+def _random_ohlc(rng, n_stocks, n_bars):
+    """(n_stocks, n_bars, 4) 的随机K线: 开盘跳空 + 日内涨跌, 收盘价为两者的累积"""
+    gap = rng.normal(0, 0.006, (n_stocks, n_bars))
+    gap[rng.random((n_stocks, n_bars)) < DOWN_GAP_PROB] -= DOWN_GAP_SIZE
+    # 日内均值抵消跳空的平均跌幅, 长窗口内价格不会单边下跌
+    intraday = rng.normal(DOWN_GAP_PROB * DOWN_GAP_SIZE + 0.0003, 0.02, (n_stocks, n_bars))
+    base = 10 * np.exp(rng.normal(0, 0.8, (n_stocks, 1)))
+    log_close = np.cumsum(gap + intraday, axis=1)
+    close = base * np.exp(log_close)
+    open_price = base * np.exp(log_close - intraday)
+    high = np.maximum(open_price, close) * (1 + np.abs(rng.normal(0, 0.01, (n_stocks, n_bars))))
+    low = np.minimum(open_price, close) * (1 - np.abs(rng.normal(0, 0.01, (n_stocks, n_bars))))
+    return np.stack([open_price, high, low, close], axis=-1)